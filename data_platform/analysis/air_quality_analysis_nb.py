@@ -1,3 +1,6 @@
+# Reads the aq_daily export of the dbt models (dbt build, see test_analysis_nb.py). Without it the daily values are
+# computed from the wide GBGS sample committed in data/parquet_files/aq_data_2025.parquet (data_access.py)
+
 import marimo
 
 __generated_with = "0.16.1"
@@ -14,60 +17,19 @@ def _():
     import matplotlib.dates as mdates
     from datetime import date
     import base64
-    return Path, base64, mo, pl
+    # Shared data access (analysis/data_access.py), reads only what the widgets select
+    from data_access import load_daily_values, load_map_html
+    return Path, base64, date, load_daily_values, load_map_html, mo, pl
 
 
 @app.cell
-def _(Path, pl):
-    # Get Göteborgs Stad air quality data
+def _(Path):
     notebook_dir = Path(__file__).parent
-    aq_path = notebook_dir.parent / "data" / "parquet_files" / "aq_data_2025.parquet"
-    df_aq = pl.read_parquet(aq_path)
-    df_aq = df_aq.sort(['date', 'time'])
-    return df_aq, notebook_dir
-
-
-@app.cell
-def _(df_aq, pl):
-    # Add datetime column to df 
-    df_air_quality = df_aq.with_columns(
-        pl.when(pl.col("time").str.starts_with("24:"))
-        .then(
-            (pl.col("date").cast(pl.Date) + pl.duration(days=1)).cast(pl.String) + " 00:" +
-            pl.col("time").str.slice(3)
-        )
-        .otherwise(
-            pl.col("date").cast(pl.String) + " " + pl.col("time")
-        )
-        .str.replace(r"\+\d{2}:\d{2}$", "")
-        .str.strptime(pl.Datetime, "%Y-%m-%d %H:%M")
-        .alias("datetime")
-    )
-    return (df_air_quality,)
+    return (notebook_dir,)
 
 
 @app.cell
-def _(pl):
-
-    def get_sensor_columns(pollutant: str, stations: list[str] = None, df: pl.DataFrame = None):
-        station_map = {
-            "femman": f"femman_{pollutant}",
-            "haga": f"hagasodra_{pollutant}" if "pm" in pollutant else f"haganorra_{pollutant}",
-            "mobil2": f"mobil2_{pollutant}",
-            "mobil3": f"mobil3_{pollutant}"
-        }
-
-        if stations is None:
-            stations = list(station_map.keys())
-
-        selected_columns = [station_map[station] for station in stations if station in station_map]
-
-        if df is not None:
-            existing_columns = set(df.columns)
-            selected_columns = [col for col in selected_columns if col in existing_columns]
-
-        return selected_columns
-
+def _(load_daily_values, pl):
 
     # WHO-limits: Recommended short-term (24-hour) AQG level and interim targets
     WHO_LIMITS = {
@@ -77,35 +39,19 @@ def _(pl):
         # nox: no limit value
     }
 
-    def clean_column(col_name):
-        return (
-            pl.col(col_name)
-            .str.strip_chars()
-            .replace("", None)
-            .cast(pl.Float64)
-        )
-
-    def compute_daily_averages(df: pl.DataFrame, pollutant: str, stations: list[str] = None):
-        columns = get_sensor_columns(pollutant, stations, df)
+    def compute_daily_averages(pollutant: str, stations: tuple[str, ...] = None, start=None, end=None):
+        # Daily averages from the aq_daily rollup, one column per station
+        daily = load_daily_values(pollutant, stations, start, end)
 
-        if not columns:
+        if daily.is_empty():
             raise ValueError("Inga giltiga kolumner hittades för angivna stationer och förorening.")
 
-        df_ext = df.with_columns([
-            pl.col("datetime").dt.truncate("1d").alias("day"),
-            *[clean_column(col) for col in columns]
-        ])
+        daily_wide = daily.pivot(on="station", index="date", values="value_mean").sort("date")
+        columns = [col for col in daily_wide.columns if col != "date"]
 
-        daily_avgs = {
-            col: df_ext.group_by("day")
-                .agg(pl.col(col).mean().alias(f"avg_{col}"))
-                .sort("day")
-            for col in columns
-        }
-
-        timestamps = daily_avgs[columns[0]]["day"].cast(pl.Datetime).to_list()
+        timestamps = daily_wide["date"].cast(pl.Datetime).to_list()
         daily_values = {
-            col: daily_avgs[col][f"avg_{col}"].to_list()
+            col: daily_wide[col].to_list()
             for col in columns
         }
 
@@ -186,7 +132,7 @@ def _(mo):
 
 
 @app.cell
-def _(mo):
+def _(date, mo):
     pollutant = mo.ui.dropdown(
         options=["pm10", "pm25", "no2", "nox"],
         value="pm25",
@@ -197,46 +143,55 @@ def _(mo):
     stations = mo.ui.dropdown(
         options={
             "All stations": None,
-            "Femman": "femman",
-            "Haga": "haga",
-            "Mobil2": "mobil2",
-            "Mobil3": "mobil3"
+            "Femman": ("femman",),
+            "Haga": ("haganorra", "hagasodra"),
+            "Mobil2": ("mobil2",),
+            "Mobil3": ("mobil3",)
         },
-        value=None,
+        value="All stations",
         label="Select station",
         full_width=True
     )
 
+    period = mo.ui.date_range(
+        start=date(2025, 1, 1),
+        value=(date(2025, 1, 1), date.today()),
+        label="Select period",
+        full_width=True
+    )
+
     mo.vstack([
-        mo.md("#### Select pollutant and station/stations"),
+        mo.md("#### Select pollutant, station/stations and period"),
         pollutant,
         stations,
+        period,
     ])
-    return pollutant, stations
+    return period, pollutant, stations
 
 
 @app.cell
-def _(compute_daily_averages, df_air_quality, pollutant, stations):
+def _(compute_daily_averages, period, pollutant, stations):
     #pollutant = "pm25"
-    #stations = ["femman"]
+    #stations = ("femman",)
 
-    timestamps, values, sensor_cols = compute_daily_averages(df_air_quality, pollutant.value, stations.value)
+    timestamps, values, sensor_cols = compute_daily_averages(pollutant.value, stations.value, *period.value)
     return sensor_cols, timestamps, values
 
 
 @app.cell
-def _(df_air_quality, pl):
-    # Temperature data
-    df_temp = df_air_quality.with_columns([
-        pl.col("datetime").dt.truncate("1d").alias("day"),
-        pl.col("lejonet_temp").str.strip_chars().replace("", None).cast(pl.Float64)
-    ])
-
-    temp_daily = df_temp.group_by("day").agg(
-        pl.col("lejonet_temp").mean().alias("avg_temp")
-    ).sort("day")
-
-    temperature_data = temp_daily["avg_temp"].to_list()
+def _(load_daily_values, period, pl, timestamps):
+    # Temperature data, daily averages from Lejonet aligned with the plotted days
+    temp_daily = load_daily_values("temp", ("lejonet",), *period.value)
+
+    temperature_data = None
+    if not temp_daily.is_empty():
+        temperature_data = (
+            pl.DataFrame({"date": timestamps})
+            .with_columns(pl.col("date").cast(pl.Date))
+            .join(temp_daily.select("date", "value_mean"), on="date", how="left")
+            ["value_mean"]
+            .to_list()
+        )
     return (temperature_data,)
 
 
@@ -282,9 +237,9 @@ def _(mo, notebook_dir):
 
 
 @app.cell
-def _(base64, map_selector, mo):
-    with open(map_selector.value, 'r', encoding='utf-8') as f:
-        map_html = f.read()
+def _(base64, load_map_html, map_selector, mo):
+    # Map page with its GeoJSON layers inlined, the relative layer urls do not resolve inside the iframe
+    map_html = load_map_html(map_selector.value)
 
     encoded = base64.b64encode(map_html.encode()).decode()
 
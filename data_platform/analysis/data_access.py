@@ -0,0 +1,200 @@
+import json
+import polars as pl
+import re
+from datetime import date
+from functools import lru_cache, wraps
+from pathlib import Path
+
+""" Shared data access for the analysis notebooks """
+# Reads the Parquet exported by the dbt models lazily with pl.scan_parquet. Filters on the date partition skip
+# whole files, station/pollutant/site filters skip row groups (the exports are sorted on them) and only the
+# selected columns are read. Results are cached per argument values (the widget values) and per version of the
+# files they read (modification times), so going back to an earlier selection does not read the files again but a
+# new dbt export or map table is picked up. refresh() drops every cached result. Arguments must be hashable:
+# tuples, not lists. start/end are inclusive dates (date or "YYYY-MM-DD"), None for no limit
+
+PARQUET_DIR = Path(__file__).parent.parent / "data" / "parquet_files"
+
+
+# Lazy frame over a dbt export: a Hive partitioned directory (aq_measurements) or a single file (aq_daily.parquet)
+def scan(name):
+    path = PARQUET_DIR / name
+    if path.is_dir():
+        return pl.scan_parquet(path / "**" / "*.parquet", hive_partitioning=True)
+    return pl.scan_parquet(path)
+
+
+def _in_range(lf, column, start=None, end=None):
+    if start is not None:
+        lf = lf.filter(pl.col(column) >= _as_date(start))
+    if end is not None:
+        lf = lf.filter(pl.col(column) <= _as_date(end))
+    return lf
+
+
+def _as_date(value):
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+# Version of an export or map table: modification time of the file, or the number and latest modification time
+# of the Parquet files of a partitioned directory. None while it does not exist
+def _version(path):
+    if path.is_dir():
+        mtimes = [f.stat().st_mtime_ns for f in path.glob("**/*.parquet")]
+        return len(mtimes), max(mtimes, default=0)
+    return path.stat().st_mtime_ns if path.exists() else None
+
+
+_caches = []
+
+# lru_cache keyed on the arguments and the versions of the given dbt exports
+def cached_exports(*names, maxsize=64):
+    def decorate(load):
+        cached = lru_cache(maxsize=maxsize)(lambda versions, *args, **kwargs: load(*args, **kwargs))
+        _caches.append(cached)
+
+        @wraps(load)
+        def wrapper(*args, **kwargs):
+            return cached(tuple(_version(PARQUET_DIR / name) for name in names), *args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# Drop all cached results, e.g. after files were replaced within the resolution of their modification times
+def refresh():
+    for cached in _caches:
+        cached.cache_clear()
+
+
+""" Air quality """
+
+# Wide GBGS table (date, time and one column per <station>_<pollutant>): the dbt export, or the sample committed
+# with the repository (an earlier single file export of the same model, measurements as text)
+GBGS_WIDE_EXPORT = "aq_data_2025"
+GBGS_WIDE_SAMPLE = "aq_data_2025.parquet"
+
+
+# Daily mean/min/max/count per station for one pollutant (aq_daily). Until dbt has exported aq_daily the same
+# values are computed from the wide GBGS table, so the notebook also runs on a fresh checkout with the sample
+@cached_exports("aq_daily.parquet", GBGS_WIDE_EXPORT, GBGS_WIDE_SAMPLE)
+def load_daily_values(pollutant, stations=None, start=None, end=None):
+    if (PARQUET_DIR / "aq_daily.parquet").exists():
+        lf = scan("aq_daily.parquet")
+    else:
+        lf = _daily_values_from_wide()
+    lf = lf.filter(pl.col("pollutant") == pollutant)
+    if stations:
+        lf = lf.filter(pl.col("station").is_in(stations))
+    lf = _in_range(lf, "date", start, end)
+    return lf.select("station", "date", "value_mean", "value_min", "value_max", "value_count").sort("station", "date").collect()
+
+
+# aq_daily computed from the wide GBGS table: every measurement column unpivoted to station, pollutant and value
+# (text trimmed and parsed, blanks and values that are not numbers dropped), grouped per GBGS date
+def _daily_values_from_wide():
+    name = GBGS_WIDE_EXPORT if (PARQUET_DIR / GBGS_WIDE_EXPORT).is_dir() else GBGS_WIDE_SAMPLE
+    wide = scan(name)
+    measurements = [
+        column for column in wide.collect_schema().names()
+        if column not in ("date", "time", "measured_at") and not column.startswith("_dlt")
+    ]
+    return (
+        wide.select(pl.col("date").cast(pl.String).str.to_date(), *measurements)
+        .unpivot(index="date", variable_name="measurement", value_name="value")
+        .with_columns(
+            pl.col("measurement").str.splitn("_", 2).struct.field("field_0").alias("station"),
+            pl.col("measurement").str.splitn("_", 2).struct.field("field_1").alias("pollutant"),
+            pl.col("value").cast(pl.String).str.strip_chars().cast(pl.Float64, strict=False),
+        )
+        .drop_nulls("value")
+        .group_by("station", "pollutant", "date")
+        .agg(
+            pl.col("value").mean().alias("value_mean"),
+            pl.col("value").min().alias("value_min"),
+            pl.col("value").max().alias("value_max"),
+            pl.col("value").count().cast(pl.Int64).alias("value_count"),
+        )
+    )
+
+
+# Hourly mean/min/max/count per station for one pollutant (aq_hourly, partitioned by date)
+@cached_exports("aq_hourly")
+def load_hourly_values(pollutant, stations=None, start=None, end=None):
+    lf = _in_range(scan("aq_hourly"), "date", start, end).filter(pl.col("pollutant") == pollutant)
+    if stations:
+        lf = lf.filter(pl.col("station").is_in(stations))
+    return lf.select("station", "hour", "date", "value_mean", "value_min", "value_max", "value_count").sort("station", "hour").collect()
+
+
+# Measurements per station for one pollutant (aq_measurements, partitioned by date)
+@cached_exports("aq_measurements")
+def load_measurements(pollutant, stations=None, start=None, end=None):
+    lf = _in_range(scan("aq_measurements"), "date", start, end).filter(pl.col("pollutant") == pollutant)
+    if stations:
+        lf = lf.filter(pl.col("station").is_in(stations))
+    return lf.select("station", "measured_at", "value").sort("station", "measured_at").collect()
+
+
+""" Traffic flow """
+
+# Hourly vehicle flow per detector site (tf_site_hourly, partitioned by date)
+@cached_exports("tf_site_hourly")
+def load_site_hourly(site_ids=None, start=None, end=None):
+    lf = _in_range(scan("tf_site_hourly"), "date", start, end)
+    if site_ids:
+        lf = lf.filter(pl.col("site_id").is_in(site_ids))
+    return lf.sort("site_id", "hour").collect()
+
+
+""" Air quality and traffic flow """
+
+# Hourly pollutant values aligned with the traffic flow of the matched detectors (station_detector_hourly).
+# detector_rank 1 is the closest detector of each station, None for all matched detectors
+@cached_exports("station_detector_hourly.parquet")
+def load_station_detector_hourly(pollutant, stations=None, start=None, end=None, detector_rank=1):
+    lf = scan("station_detector_hourly.parquet").filter(pl.col("pollutant") == pollutant)
+    if stations:
+        lf = lf.filter(pl.col("station").is_in(stations))
+    if detector_rank is not None:
+        lf = lf.filter(pl.col("detector_rank") == detector_rank)
+    lf = _in_range(lf, "date", start, end)
+    return lf.sort("station", "detector_rank", "hour").collect()
+
+
+""" Maps """
+
+MAP_TABLES_DIR = PARQUET_DIR.parent / "map_tables"
+
+# Coordinate table written by a map asset: monitoring_station_locations_map (stations), detector_locations_map
+# (detector sites), mapping_station_to_detector (station/detector matches) or merged_map (closest detector links)
+def load_map_table(asset_name):
+    path = MAP_TABLES_DIR / f"{asset_name}.parquet"
+    return _read_map_table(path, _version(path))
+
+
+@lru_cache(maxsize=8)
+def _read_map_table(path, version):
+    return pl.read_parquet(path)
+
+
+_caches.append(_read_map_table)
+
+
+LAYERS_SCRIPT = re.compile(r'(<script type="application/json" id="layers">)(.*?)(</script>)', re.S)
+
+# Map page (data/maps/*.html) with its GeoJSON layers inlined from the layer files next to it, for embedding where
+# the relative layer urls do not resolve (base64 iframe). Pages without a layer list are returned as they are
+def load_map_html(path):
+    path = Path(path)
+    html = path.read_text(encoding="utf-8")
+
+    match = LAYERS_SCRIPT.search(html)
+    if match is None:
+        return html
+
+    layers = json.loads(match.group(2))
+    for layer in layers:
+        layer["data"] = json.loads((path.parent / layer["url"]).read_text(encoding="utf-8"))
+
+    layers_json = json.dumps(layers, separators=(",", ":")).replace("</", "<\\/")
+    return html[:match.start(2)] + layers_json + html[match.end(2):]
@@ -0,0 +1,221 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+
+import dagster as dg
+from dagster_dbt import DbtCliResource
+from dagster_duckdb import DuckDBResource
+
+from benchmarks.local_storage import LocalArtifactStore, LocalDuckDBIOManager
+from benchmarks.stubs import START_DATE, GBGSStubServer, TVStubServer
+from data_platform.defs.assets import (
+    GBGS_raw_data, TV_raw_data, air_quality_dbt_assets,
+    monitoring_station_locations_map, detector_locations_map, mapping_station_to_detector, merged_map,
+)
+from data_platform.defs.io_managers.map_tables_io_manager import map_tables_io_manager
+from data_platform.defs.partitions import daily_partitions
+from data_platform.defs.resources import GBGSAPIClient, TVAPIClient
+
+""" End-to-end benchmark of the pipeline against local stand-ins
+
+Run from the data_platform folder:
+    python -m benchmarks.end_to_end --days 31 --sites 200 --sync-mode delta
+    python -m benchmarks.end_to_end --days 7 --sites 2000 --ingestion-mode rows --normalize-workers 4 --file-max-items 100000
+
+Materializes the real assets (raw ingestion, maps, dbt) over synthetic data of --days days and --sites detector
+sites. The APIs are local stub servers (benchmarks/stubs.py) and Azure blob storage is a local folder
+(benchmarks/local_storage.py), so runs are reproducible offline. Reports the wall time of every phase, the
+ingestion throughput and the IO manager transfer time from the run metrics of the assets
+"""
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+TRANSFORMATIONS_DIR = Path(__file__).parent.parent / "transformations"
+MAP_ASSETS = [monitoring_station_locations_map, detector_locations_map, mapping_station_to_detector, merged_map]
+
+
+# Environment variables set inside the block and restored to their previous values (or removed) afterwards
+@contextmanager
+def scoped_environ(**variables):
+    previous = {name: os.environ.get(name) for name in variables}
+    os.environ.update(variables)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+# partitions: (first, last) partition key of the run, or None for unpartitioned assets
+def materialize(assets, resources, instance, partitions=None, run_config=None):
+    tags = {}
+    if partitions is not None:
+        tags = {
+            "dagster/asset_partition_range_start": partitions[0],
+            "dagster/asset_partition_range_end": partitions[1],
+        }
+
+    started = time.perf_counter()
+    result = dg.materialize(
+        assets, resources=resources, instance=instance, tags=tags, run_config=run_config, raise_on_error=True
+    )
+    elapsed = time.perf_counter() - started
+
+    metadata = {}
+    for event in result.get_asset_materialization_events():
+        materialization = event.event_specific_data.materialization
+        metadata[materialization.asset_key.to_user_string()] = {
+            key: value.value for key, value in materialization.metadata.items() if isinstance(value.value, (int, float))
+        }
+    return elapsed, metadata
+
+
+# IO manager time of a raw asset run: database load in load_input and upload/push in handle_output
+def io_manager_seconds(metadata):
+    return metadata.get("duckdb_load_input_seconds", 0) + metadata.get("duckdb_handle_output_seconds", 0)
+
+
+def report(results):
+    print(f"{'phase':<22} {'seconds':>9} {'rows':>10} {'rows/s':>10}  details")
+    for phase in results["phases"]:
+        rows = phase.get("rows")
+        rate = f"{rows / phase['seconds']:>10.0f}" if rows else f"{'':>10}"
+        print(f"{phase['name']:<22} {phase['seconds']:>9.2f} {rows or '':>10} {rate}  {phase.get('details', '')}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=7, help="Days of synthetic data")
+    parser.add_argument("--sites", type=int, default=100, help="Trafikverket detector sites")
+    parser.add_argument("--interval-minutes", type=int, default=60, help="Minutes between traffic flow measurements")
+    parser.add_argument("--latency", type=float, default=0.0, help="Stub server latency per request in seconds")
+    parser.add_argument("--sync-mode", default="full", choices=["full", "delta", "partitioned"])
+    parser.add_argument("--work-dir", default=None, help="Folder for blobs, databases and exports (default: new temp "
+                        "folder). An existing folder is reused, the runs then measure incremental loads")
+    parser.add_argument("--ingestion-mode", default="arrow", choices=["arrow", "rows"])
+    parser.add_argument("--loader-file-format", default="parquet", choices=["parquet", "insert_values", "jsonl"])
+    parser.add_argument("--normalize-workers", type=int, default=1)
+    parser.add_argument("--normalize-start-method", default="spawn", choices=["spawn", "fork", "forkserver"])
+    parser.add_argument("--buffer-max-items", type=int, default=5000)
+    parser.add_argument("--file-max-items", type=int, default=None)
+    parser.add_argument("--skip-dbt", action="store_true")
+    parser.add_argument("--json", default=None, help="Write the results to this file")
+    args = parser.parse_args()
+
+    work_dir = Path(args.work_dir or tempfile.mkdtemp(prefix="data_platform_bench_"))
+    work_dir.mkdir(parents=True, exist_ok=True)
+
+    # Config of the raw assets (see data_platform/defs/ingestion.py)
+    ingestion = {
+        "mode": args.ingestion_mode,
+        "loader_file_format": args.loader_file_format,
+        "normalize_workers": args.normalize_workers,
+        "normalize_start_method": args.normalize_start_method,
+        "buffer_max_items": args.buffer_max_items,
+        "file_max_items": args.file_max_items,
+    }
+
+    instance = dg.DagsterInstance.ephemeral()
+    io_manager = LocalDuckDBIOManager(str(work_dir / "blob"), sync_mode=args.sync_mode)
+    phases = []
+
+    with GBGSStubServer(total_rows=args.days * 24, latency=args.latency) as gbgs, \
+            TVStubServer(sites=args.sites, days=args.days, interval_minutes=args.interval_minutes, latency=args.latency) as tv:
+
+        # Raw ingestion, one run per source: GBGS over all days (like a backfill window), TV into the current
+        # partition like the TV schedule (Trafikverket only serves current measurements)
+        synthetic_days = (START_DATE.isoformat(), (START_DATE + timedelta(days=args.days - 1)).isoformat())
+        current_day = (daily_partitions.get_last_partition_key(),) * 2
+        resources = {
+            "azure_duckdb_io_manager": io_manager,
+            "GBGS_api_client": GBGSAPIClient(gbgs.url),
+            "TV_api_client": TVAPIClient(tv.url, "benchmark"),
+        }
+        for name, asset, partitions in (
+            ("GBGS ingestion", GBGS_raw_data, synthetic_days),
+            ("TV ingestion", TV_raw_data, current_day),
+        ):
+            run_config = {"ops": {asset.key.to_user_string(): {"config": ingestion}}}
+            elapsed, metadata = materialize([asset], resources, instance, partitions=partitions, run_config=run_config)
+            metrics = metadata[asset.key.to_user_string()]
+            phases.append({
+                "name": name,
+                "seconds": elapsed,
+                "rows": metrics.get("loaded_rows", 0),
+                "details": (
+                    f"dlt {metrics.get('dlt_run_seconds', 0):.2f}s (extract {metrics.get('dlt_extract_seconds', 0):.2f}s, "
+                    f"normalize {metrics.get('dlt_normalize_seconds', 0):.2f}s, load {metrics.get('dlt_load_seconds', 0):.2f}s), "
+                    f"IO manager {io_manager_seconds(metrics):.2f}s"
+                ),
+                "metrics": metrics,
+            })
+
+    phases.append({
+        "name": "IO manager transfers",
+        "seconds": sum(io_manager_seconds(phase["metrics"]) for phase in phases),
+        "details": (
+            f"downloaded {sum(phase['metrics'].get('blob_download_bytes', 0) for phase in phases)} bytes, "
+            f"uploaded {sum(phase['metrics'].get('blob_upload_bytes', 0) for phase in phases)} bytes, "
+            f"database {phases[-1]['metrics'].get('duckdb_size_bytes', 0)} bytes"
+        ),
+    })
+
+    # dbt and the map assets work on a copy of the loaded database, like the database resource in the container
+    database_path = work_dir / "air_quality.duckdb"
+    shutil.copyfile(io_manager.current_database_path(), database_path)
+
+    # Maps before dbt, the station/detector mart reads the matches
+    map_resources = {
+        "artifact_store": LocalArtifactStore(str(work_dir / "artifacts")),
+        "monitoring_stations_data": dg.ResourceDefinition.hardcoded_resource(
+            json.loads((DATA_DIR / "monitoring_stations_data" / "monitoring_stations.json").read_text(encoding="utf-8"))
+        ),
+        "database": DuckDBResource(database=str(database_path)),
+        "map_tables_io_manager": map_tables_io_manager.configured({"base_dir": str(work_dir / "map_tables")}),
+    }
+    elapsed, metadata = materialize(MAP_ASSETS, map_resources, instance)
+    phases.append({
+        "name": "map generation",
+        "seconds": elapsed,
+        "rows": metadata["detector_locations_map"].get("detector_sites", 0),
+        "details": f"{sum(m.get('artifact_bytes', 0) for m in metadata.values())} artifact bytes",
+        "metrics": metadata,
+    })
+
+    if not args.skip_dbt:
+        (work_dir / "parquet_files").mkdir(exist_ok=True)
+        dbt = DbtCliResource(project_dir=str(TRANSFORMATIONS_DIR), profiles_dir=str(TRANSFORMATIONS_DIR))
+        # The dbt subprocess reads the database and export folder from the environment (profiles.yml and
+        # macros/export_partitions.sql), set for this phase only
+        with scoped_environ(DUCKDB_DATABASE_PATH=str(database_path), DBT_EXPORT_DIR=str(work_dir / "parquet_files")):
+            elapsed, metadata = materialize([air_quality_dbt_assets], {"dbt": dbt}, instance, partitions=synthetic_days)
+        phases.append({
+            "name": "dbt build",
+            "seconds": elapsed,
+            "details": f"{len(metadata)} models",
+        })
+
+    results = {
+        "days": args.days,
+        "sites": args.sites,
+        "interval_minutes": args.interval_minutes,
+        "sync_mode": args.sync_mode,
+        "ingestion": ingestion,
+        "work_dir": str(work_dir),
+        "phases": phases,
+    }
+    report(results)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2, default=str), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import argparse
+import time
+
+import requests
+
+from benchmarks.stubs import GBGSStubServer
+from data_platform.defs.fetch_data import fetch_GBGS_pages
+from data_platform.defs.resources import GBGSAPIClient
+
+""" Benchmark of GBGS pagination against a local stub server
+
+Run from the data_platform folder:
+    python -m benchmarks.gbgs_pagination --rows 20000 --page-size 100 --latency 0.05
+"""
+
+
+# The previous implementation: one blocking request per page, new connection every time and no prefetching
+def sequential_pages(url):
+    while url:
+        data = requests.get(url).json()
+        yield data.get("results", [])
+        url = data.get("next")
+
+
+def run(name, pages):
+    started = time.perf_counter()
+    n_pages = n_rows = 0
+    for results in pages:
+        n_pages += 1
+        n_rows += len(results)
+    elapsed = time.perf_counter() - started
+    print(f"{name:<24} {n_pages:>6} pages {n_rows:>8} rows {elapsed:>8.2f}s {n_rows / elapsed:>10.0f} rows/s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.05, help="Server latency per request in seconds")
+    parser.add_argument("--max-in-flight", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    with GBGSStubServer(total_rows=args.rows, page_size=args.page_size, latency=args.latency) as stub:
+        baseline = run("sequential (baseline)", sequential_pages(stub.url))
+
+        for max_in_flight in args.max_in_flight:
+            client = GBGSAPIClient(stub.url, max_in_flight=max_in_flight)
+            elapsed = run(f"prefetch in_flight={max_in_flight}", fetch_GBGS_pages(client, stub.url))
+            print(f"{'':<24} speedup {baseline / elapsed:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
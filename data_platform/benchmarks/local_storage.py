@@ -0,0 +1,57 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from fsspec.implementations.local import LocalFileSystem
+
+from data_platform.defs.io_managers.azure_duckdb_io_manager import AzureDuckDBIOManager
+
+""" Local stand-ins for Azure blob storage used by the benchmarks """
+
+
+# The Azure DuckDB IO manager with the blob container replaced by a local folder. Everything else (sync modes,
+# block transfers, segments, partitions, catalog) is the real implementation
+class LocalDuckDBIOManager(AzureDuckDBIOManager):
+    def __init__(self, root, sync_mode="full", **kwargs):
+        super().__init__(
+            account_name="local",
+            account_key="",
+            container=os.path.join(root, "container"),
+            database_path="air_quality.duckdb",
+            sync_mode=sync_mode,
+            local_cache_dir=os.path.join(root, "duckdb_cache"),
+            **kwargs,
+        )
+
+    def _get_fs(self):
+        return LocalFileSystem(auto_mkdir=True)
+
+    # Database with all loaded data as dbt and the map assets see it: the database blob in full mode, the
+    # persistent local copy in delta mode and the catalog database (views over the partitions) in partitioned mode
+    def current_database_path(self):
+        if self.sync_mode == "delta":
+            return self._get_local_path()
+        return self._get_remote_path()
+
+
+# Same interface as resources.ArtifactStore, blobs are files under root. An upload is skipped when the MD5 of the
+# content matches the stored file, like the Content-MD5 check against Azure
+class LocalArtifactStore:
+    def __init__(self, root, max_concurrency=4):
+        self.root = root
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+    def upload_bytes(self, blob_name, data, content_type="application/octet-stream"):
+        path = os.path.join(self.root, blob_name)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                if hashlib.md5(f.read()).digest() == hashlib.md5(data).digest():
+                    return False
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        return True
+
+    def submit(self, blob_name, data, content_type="application/octet-stream"):
+        return self.executor.submit(self.upload_bytes, blob_name, data, content_type)
@@ -0,0 +1,80 @@
+import argparse
+import time
+
+import numpy as np
+from geopy.distance import geodesic
+
+from data_platform.defs.matching import nearest_detectors
+
+""" Benchmark of station to detector matching
+
+Run from the data_platform folder:
+    python -m benchmarks.station_detector_matching --detectors 10000 --stations 1000
+
+The previous double loop (geodesic for every station-detector pair) is timed on --baseline-stations stations
+and extrapolated to all stations, it takes minutes at full size
+"""
+
+GBG_CENTER = (57.7089, 11.9746)
+
+
+def random_coordinates(rng, n, spread_deg=0.5):
+    return np.column_stack([
+        GBG_CENTER[0] + rng.uniform(-spread_deg, spread_deg, n) / 2,
+        GBG_CENTER[1] + rng.uniform(-spread_deg, spread_deg, n),
+    ])
+
+
+# The previous implementation in mapping_station_to_detector
+def double_loop(station_coords, detector_coords):
+    matches = []
+    for ms_coord in station_coords:
+        min_distance = float("inf")
+        closest = None
+        for j, det_coord in enumerate(detector_coords):
+            distance = geodesic(ms_coord, det_coord).kilometers
+            if distance < min_distance:
+                min_distance = distance
+                closest = j
+        matches.append((closest, min_distance))
+    return matches
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--detectors", type=int, default=10_000)
+    parser.add_argument("--stations", type=int, default=1_000)
+    parser.add_argument("--baseline-stations", type=int, default=5)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--radius-km", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    detectors = random_coordinates(rng, args.detectors)
+    stations = random_coordinates(rng, args.stations)
+    print(f"{args.stations} stations x {args.detectors} detectors")
+
+    started = time.perf_counter()
+    baseline = double_loop(stations[:args.baseline_stations], detectors)
+    baseline_elapsed = (time.perf_counter() - started) * args.stations / args.baseline_stations
+    print(f"{'double loop (estimated)':<28} {baseline_elapsed:>9.2f}s")
+
+    for name, kwargs in [
+        ("BallTree k=1", {"k": 1}),
+        (f"BallTree k={args.k}", {"k": args.k}),
+        (f"BallTree radius={args.radius_km}km", {"k": None, "radius_km": args.radius_km}),
+    ]:
+        started = time.perf_counter()
+        matches = nearest_detectors(stations, detectors, **kwargs)
+        elapsed = time.perf_counter() - started
+        print(f"{name:<28} {elapsed:>9.2f}s  speedup {baseline_elapsed / elapsed:>8.0f}x")
+
+        if kwargs.get("k") == 1:
+            # Same closest detector as the double loop
+            for (expected, _), station_matches in zip(baseline, matches):
+                assert station_matches[0][0] == expected
+
+
+if __name__ == "__main__":
+    main()
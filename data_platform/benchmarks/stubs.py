@@ -0,0 +1,142 @@
+import json
+import re
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from benchmarks.synthetic import START_DATE, gbgs_row, tv_records, tv_response_json
+
+""" Local stand-ins for the external APIs used by the benchmarks, serving data from benchmarks/synthetic.py """
+
+
+""" Stub GBGS API: Django REST style offset/limit pagination with count/next/results """
+class GBGSStubServer:
+    def __init__(self, total_rows=10_000, page_size=100, latency=0.05, start_date=START_DATE, seed=0):
+        self.total_rows = total_rows
+        self.page_size = page_size
+        self.latency = latency
+        self.start_date = start_date
+        self.seed = seed
+        self.requests = 0
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            # Keep-alive responses are written in two parts, avoid the delayed ACK stall
+            def setup(self):
+                super().setup()
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def do_GET(self):
+                stub.requests += 1
+                time.sleep(stub.latency)
+
+                query = parse_qs(urlparse(self.path).query)
+                limit = int(query.get("limit", [stub.page_size])[0])
+                offset = int(query.get("offset", [0])[0])
+                end = min(offset + limit, stub.total_rows)
+
+                next_url = None
+                if end < stub.total_rows:
+                    next_url = f"{stub.url}?{urlencode({'limit': limit, 'offset': end})}"
+
+                body = json.dumps({
+                    "count": stub.total_rows,
+                    "next": next_url,
+                    "results": [gbgs_row(i, stub.start_date, stub.seed) for i in range(offset, end)],
+                }).encode()
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/api"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+""" Stub Trafikverket API: XML query POST, JSON TrafficFlow response with LASTCHANGEID """
+# The first query (changeid 0) returns every measurement, queries with the returned change id return nothing.
+# The body is generated while it is sent (chunked transfer encoding), so memory does not grow with the response
+class TVStubServer:
+    def __init__(self, sites=100, days=1, interval_minutes=60, latency=0.05, start_date=START_DATE, seed=0):
+        self.sites = sites
+        self.days = days
+        self.interval_minutes = interval_minutes
+        self.latency = latency
+        self.start_date = start_date
+        self.seed = seed
+        self.total_rows = sites * days * 24 * 60 // interval_minutes
+        self.change_id = str(self.total_rows)
+        self.requests = 0
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def do_POST(self):
+                stub.requests += 1
+                time.sleep(stub.latency)
+
+                query = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+                change_id = re.search(r'changeid="(\d+)"', query).group(1)
+                records = iter(()) if change_id == stub.change_id else tv_records(
+                    stub.sites, stub.days, stub.interval_minutes, stub.start_date, stub.seed
+                )
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                _write_chunked(self.wfile, tv_response_json(records, stub.change_id))
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/data.json"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# Write text parts as HTTP chunks of about chunk_size bytes
+def _write_chunked(wfile, parts, chunk_size=64 * 1024):
+    buffer = []
+    size = 0
+    for part in parts:
+        data = part.encode("utf-8")
+        buffer.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            wfile.write(b"%x\r\n%s\r\n" % (size, b"".join(buffer)))
+            buffer, size = [], 0
+    if size:
+        wfile.write(b"%x\r\n%s\r\n" % (size, b"".join(buffer)))
+    wfile.write(b"0\r\n\r\n")
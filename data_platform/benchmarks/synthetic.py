@@ -0,0 +1,274 @@
+import argparse
+import json
+import math
+import os
+import time
+from datetime import date, datetime, timedelta, timezone
+from xml.sax.saxutils import escape
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from data_platform.defs.fetch_data import GBGS_MEASUREMENT_COLUMNS
+
+""" Synthetic GBGS and Trafikverket data for scale testing
+
+Run from the data_platform folder:
+    python -m benchmarks.synthetic gbgs --days 3650 --format parquet --out aq_synthetic.parquet
+    python -m benchmarks.synthetic tv --sites 2000 --days 31 --interval-minutes 5 --format xml --out tf.xml
+
+Rows and records are generated one at a time by generators and written as they are produced (JSON pages, a
+Trafikverket JSON/XML response or Parquet row groups), so memory stays constant with the volume. Every value
+is a function of (seed, row index, column), so the same arguments give the same data and the stub servers
+(benchmarks/stubs.py) can serve any page without generating the ones before it
+"""
+
+START_DATE = date(2025, 1, 1)
+
+# GBGS returns times in +01:00 all year
+GBGS_OFFSET = timezone(timedelta(hours=1))
+
+# Columns that are blank in every row of the real data (station not in service)
+GBGS_BLANK_COLUMNS = ("mobil3_no2", "mobil3_nox", "mobil3_pm10")
+
+# Per measurement: (level, amplitude of the daily cycle, noise, peak hour, minimum)
+GBGS_PROFILES = {
+    "airpressure": (1000.0, 0.0, 12.0, 0, 950.0),
+    "globrad": (-60.0, 200.0, 40.0, 13, 0.0),
+    "no2": (12.0, 8.0, 6.0, 8, 0.0),
+    "nox": (15.0, 12.0, 8.0, 8, 0.0),
+    "o3": (30.0, 10.0, 8.0, 15, 0.0),
+    "pm10": (12.0, 4.0, 6.0, 9, 0.0),
+    "pm25": (5.0, 2.0, 3.0, 9, 0.0),
+    "rain": (-0.5, 0.0, 1.5, 0, 0.0),
+    "rh": (80.0, -10.0, 8.0, 14, 20.0),
+    "temp": (8.0, 4.0, 2.0, 15, -30.0),
+    "winddir": (200.0, 0.0, 150.0, 0, 0.0),
+    "windspeed": (5.0, 1.5, 3.0, 14, 0.0),
+}
+
+# Values are right aligned in a 12 character field, blanks are 12 spaces (see fetch_data.normalize_GBGS_row)
+GBGS_FIELD_WIDTH = 12
+
+GBGS_SCHEMA = pa.schema(
+    [("date", pa.string()), ("time", pa.string())] + [(column, pa.string()) for column in GBGS_MEASUREMENT_COLUMNS]
+)
+
+# Flattened TrafficFlow records with the column names dlt gives them (the tables read by the dbt models)
+TV_SCHEMA = pa.schema([
+    ("county_no", pa.list_(pa.int64())),
+    ("measurement_or_calculation_period", pa.int64()),
+    ("measurement_time", pa.timestamp("us", tz="UTC")),
+    ("site_id", pa.int64()),
+    ("vehicle_flow_rate", pa.int64()),
+    ("vehicle_type", pa.string()),
+    ("geometry__wgs84", pa.string()),
+])
+
+
+# 64 bit hash of integer keys (splitmix64 finalizer), cheap and independent of generation order
+def _hash(*keys):
+    x = 0x9E3779B97F4A7C15
+    for key in keys:
+        x = (x ^ (key & 0xFFFFFFFFFFFFFFFF)) * 0xBF58476D1CE4E5B9 & 0xFFFFFFFFFFFFFFFF
+        x = (x ^ (x >> 31)) * 0x94D049BB133111EB & 0xFFFFFFFFFFFFFFFF
+    return x
+
+
+# Uniform value in [0, 1)
+def _unit(*keys):
+    return (_hash(*keys) >> 11) / float(1 << 53)
+
+
+# Approximately normal noise with standard deviation ~1 (sum of three uniforms from 21 bit parts of one hash)
+def _noise(*keys):
+    x = _hash(*keys)
+    return ((x & 0x1FFFFF) + (x >> 21 & 0x1FFFFF) + (x >> 42 & 0x1FFFFF)) / 0x100000 - 3.0
+
+
+""" GBGS """
+# Row i is hour i % 24 of day i // 24 after start_date. Times run 01:00..24:00: the 24:00 value is the last hour
+# of its date, not 00:00 of the next. Values follow a daily cycle per measurement plus a slow drift per day and
+# noise; blank_rate is the share of values left blank (instrument outages)
+def gbgs_row(i, start_date=START_DATE, seed=0, blank_rate=0.01):
+    day, hour = divmod(i, 24)
+    row = {
+        "date": (start_date + timedelta(days=day)).isoformat(),
+        "time": f"{hour + 1:02d}:00+01:00",
+    }
+    for j, column in enumerate(GBGS_MEASUREMENT_COLUMNS):
+        if column in GBGS_BLANK_COLUMNS or _unit(seed, i, j) < blank_rate:
+            row[column] = " " * GBGS_FIELD_WIDTH
+            continue
+
+        level, amplitude, noise, peak, minimum = GBGS_PROFILES[column.rsplit("_", 1)[1]]
+        cycle = math.cos(2 * math.pi * (hour + 1 - peak) / 24)
+        drift = _noise(seed, day, j, 2) * noise / 2
+        value = max(minimum, level + amplitude * cycle + drift + _noise(seed, i, j, 1) * noise / 2)
+        row[column] = f"{value:>{GBGS_FIELD_WIDTH}.6g}"
+    return row
+
+
+def gbgs_rows(days, start_date=START_DATE, seed=0, blank_rate=0.01, start=0):
+    for i in range(start, days * 24):
+        yield gbgs_row(i, start_date, seed, blank_rate)
+
+
+# One JSON file per page in the layout of the API (count/next/results), next is the file name of the next page
+def write_gbgs_pages(out_dir, days, page_size=100, start_date=START_DATE, seed=0, blank_rate=0.01):
+    os.makedirs(out_dir, exist_ok=True)
+    total_rows = days * 24
+    pages = math.ceil(total_rows / page_size)
+    size = 0
+    for page in range(pages):
+        offset = page * page_size
+        rows = [gbgs_row(i, start_date, seed, blank_rate) for i in range(offset, min(offset + page_size, total_rows))]
+        body = json.dumps({
+            "count": total_rows,
+            "next": f"page_{page + 1:06d}.json" if page + 1 < pages else None,
+            "results": rows,
+        })
+        with open(os.path.join(out_dir, f"page_{page:06d}.json"), "w", encoding="utf-8") as f:
+            size += f.write(body)
+    return total_rows, size
+
+
+""" Trafikverket """
+# Detector site around the center of Göteborg, spread over ~10 x 10 km
+def tv_site(site):
+    return 1000 + site, 57.66 + (site * 37 % 101) / 1000, 11.90 + (site * 53 % 103) / 700
+
+
+# Vehicles per hour at a local hour of day: night minimum, morning and afternoon rush hour peaks
+def _flow_profile(hour):
+    morning = math.exp(-((hour - 7.5) ** 2) / 2)
+    afternoon = math.exp(-((hour - 16.5) ** 2) / 3)
+    daytime = 0.35 if 6 <= hour <= 21 else 0.05
+    return daytime + 0.65 * max(morning, afternoon)
+
+
+# One measurement per site and interval, sites in the inner loop like the API. Each site has its own capacity
+# (busy arterials to side streets), weekends have less traffic
+def tv_records(sites, days, interval_minutes=60, start_date=START_DATE, seed=0):
+    start = datetime.combine(start_date, datetime.min.time(), tzinfo=GBGS_OFFSET)
+    capacity = [200 + int(_unit(seed, site) * 1800) for site in range(sites)]
+    for step in range(days * 24 * 60 // interval_minutes):
+        measured_at = start + timedelta(minutes=step * interval_minutes)
+        measured = measured_at.isoformat(timespec="milliseconds")
+        profile = _flow_profile(measured_at.hour + measured_at.minute / 60)
+        if measured_at.weekday() >= 5:
+            profile *= 0.6
+        for site in range(sites):
+            site_id, lat, lon = tv_site(site)
+            flow = capacity[site] * profile * (1 + 0.15 * _noise(seed, step, site))
+            yield {
+                "CountyNo": [14],
+                "MeasurementOrCalculationPeriod": interval_minutes,
+                "MeasurementTime": measured,
+                "SiteId": site_id,
+                "VehicleFlowRate": max(0, round(flow / 60) * 60),
+                "VehicleType": "anyVehicle",
+                "Geometry": {"WGS84": f"POINT ({lon:.6f} {lat:.6f})"},
+            }
+
+
+# Text parts of a JSON response of the Trafikverket API
+def tv_response_json(records, change_id):
+    yield '{"RESPONSE": {"RESULT": [{"TrafficFlow": ['
+    for i, record in enumerate(records):
+        yield ("," if i else "") + json.dumps(record)
+    yield f'], "INFO": {{"LASTCHANGEID": "{change_id}"}}}}]}}}}'
+
+
+def _xml_element(name, value):
+    if isinstance(value, dict):
+        return f"<{name}>" + "".join(_xml_element(key, item) for key, item in value.items()) + f"</{name}>"
+    if isinstance(value, list):
+        return "".join(_xml_element(name, item) for item in value)
+    return f"<{name}>{escape(str(value))}</{name}>"
+
+
+# Text parts of an XML response of the Trafikverket API (the format returned for data.xml)
+def tv_response_xml(records, change_id):
+    yield '<?xml version="1.0" encoding="utf-8"?><RESPONSE><RESULT>'
+    for record in records:
+        yield _xml_element("TrafficFlow", record)
+    yield f"<INFO><LASTCHANGEID>{change_id}</LASTCHANGEID></INFO></RESULT></RESPONSE>"
+
+
+def tv_flat_record(record):
+    return {
+        "county_no": record["CountyNo"],
+        "measurement_or_calculation_period": record["MeasurementOrCalculationPeriod"],
+        "measurement_time": datetime.fromisoformat(record["MeasurementTime"]),
+        "site_id": record["SiteId"],
+        "vehicle_flow_rate": record["VehicleFlowRate"],
+        "vehicle_type": record["VehicleType"],
+        "geometry__wgs84": record["Geometry"]["WGS84"],
+    }
+
+
+""" Writers """
+def write_text(path, parts):
+    size = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for part in parts:
+            size += f.write(part)
+    return size
+
+
+# Rows are collected into row groups of batch_size rows, one row group is in memory at a time
+def write_parquet(path, rows, schema, batch_size=20_000):
+    count = 0
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == batch_size:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                count += len(batch)
+                batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            count += len(batch)
+    return count, os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("source", choices=["gbgs", "tv"])
+    parser.add_argument("--format", default="parquet", choices=["pages", "json", "xml", "parquet"],
+                        help="gbgs: pages or parquet, tv: json, xml or parquet")
+    parser.add_argument("--out", required=True, help="Output file (folder for pages)")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--start-date", type=date.fromisoformat, default=START_DATE)
+    parser.add_argument("--sites", type=int, default=100, help="Trafikverket detector sites")
+    parser.add_argument("--interval-minutes", type=int, default=60, help="Minutes between traffic flow measurements")
+    parser.add_argument("--page-size", type=int, default=100, help="GBGS rows per page")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    formats = {"gbgs": ("pages", "parquet"), "tv": ("json", "xml", "parquet")}[args.source]
+    if args.format not in formats:
+        parser.error(f"--format for {args.source} must be one of {formats}")
+
+    started = time.perf_counter()
+    if args.source == "gbgs":
+        if args.format == "pages":
+            rows, size = write_gbgs_pages(args.out, args.days, args.page_size, args.start_date, args.seed)
+        else:
+            rows, size = write_parquet(args.out, gbgs_rows(args.days, args.start_date, args.seed), GBGS_SCHEMA)
+    else:
+        records = tv_records(args.sites, args.days, args.interval_minutes, args.start_date, args.seed)
+        rows = args.sites * (args.days * 24 * 60 // args.interval_minutes)
+        if args.format == "parquet":
+            rows, size = write_parquet(args.out, map(tv_flat_record, records), TV_SCHEMA)
+        else:
+            response = tv_response_json if args.format == "json" else tv_response_xml
+            size = write_text(args.out, response(records, str(rows)))
+
+    print(f"Wrote {rows} rows, {size} bytes to {args.out} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
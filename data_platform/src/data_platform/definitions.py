@@ -8,10 +8,12 @@ from dagster_dbt import DbtCliResource
 # from data_platform.defs.dbt_assets import air_quality_dbt_assets
 
 from data_platform.defs.assets import GBGS_raw_data, TV_raw_data, monitoring_station_locations_map, detector_locations_map, merged_map, mapping_station_to_detector, air_quality_dbt_assets
-from data_platform.defs.resources import GBGS_api_client, TV_api_client, monitoring_stations_data, database_resource
+from data_platform.defs.resources import GBGS_api_client, TV_api_client, monitoring_stations_data, database_resource, artifact_store
 from data_platform.defs.jobs import GBGS_update_job, TV_update_job
 from data_platform.defs.schedules import GBGS_update_schedule, TV_update_schedule
+from data_platform.defs.sensors import maps_automation_sensor
 from data_platform.defs.io_managers.azure_duckdb_io_manager import azure_duckdb_io_manager
+from data_platform.defs.io_managers.map_tables_io_manager import map_tables_io_manager
 
 # dbt resource
 # # Local path
@@ -45,11 +47,21 @@ defs = Definitions(
             "account_key": os.environ.get("AZURE_STORAGE_ACCOUNT_KEY"),
             "container": os.environ.get("AZURE_STORAGE_ACCOUNT_CONTAINER"),
             "database_path": os.environ.get("AZURE_STORAGE_ACCOUNT_DATABASE_PATH"),
+            # "full" (download/upload whole db every run), "delta" (local cache + Parquet segments)
+            # or "partitioned" (Parquet partitions per dataset + catalog db, raw jobs run in parallel)
+            # (dbt then reads the catalog with DBT_TARGET=partitioned, see transformations/profiles.yml)
+            "sync_mode": os.environ.get("AZURE_DUCKDB_SYNC_MODE", "full"),
+        }),
+        # Coordinate tables passed between the map assets, as Parquet under data/map_tables (see analysis/data_access.py)
+        "map_tables_io_manager": map_tables_io_manager.configured({
+            "base_dir": os.environ.get("MAP_TABLES_DIR", "/opt/dagster/app/data/map_tables"),
+            "format": os.environ.get("MAP_TABLES_FORMAT", "parquet"),
         }),
         "GBGS_api_client": GBGS_api_client,
         "TV_api_client": TV_api_client,
         "monitoring_stations_data": monitoring_stations_data,
         "database": database_resource,
+        "artifact_store": artifact_store,
         "dbt": dbt_resource
     },
     jobs=[
@@ -59,5 +71,8 @@ defs = Definitions(
     schedules=[
         GBGS_update_schedule,
         TV_update_schedule
+    ],
+    sensors=[
+        maps_automation_sensor
     ]
 )
\ No newline at end of file
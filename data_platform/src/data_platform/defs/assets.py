@@ -1,329 +1,385 @@
 import dagster as dg
 from pathlib import Path
 import dlt
-import folium
-from geopy.distance import geodesic
 import json
-import os
+import polars as pl
 
 from .fetch_data import fetch_GBGS_data, fetch_TV_data
+from .matching import nearest_detectors, detector_index_path, save_detector_index, load_detector_index, save_station_detector_matches
+from .detector_sites import upsert_detector_sites
+from .partitions import daily_partitions, run_partition_range, is_current_partition_run, DBT_BACKFILL_PARTITIONS_PER_RUN, GBGS_BACKFILL_PARTITIONS_PER_RUN, RAW_DATA_POOL, DBT_DATABASE_POOL
+from .versions import asset_content_version, latest_data_version, raw_data_updated, upstream_version_changed
+from .map_tables import stations_table, detectors_table, matches_table, matches_json
+from .instrumentation import RunMetrics, record_dlt_trace
+from .ingestion import INGESTION_CONFIG_SCHEMA, configure_pipeline, log_ingestion_config, pipeline_working_dir
+from .map_layers import (
+    point_features, line_features, geojson_bytes, map_layer, map_shell,
+    STATIONS_LAYER, DETECTORS_LAYER, LINKS_LAYER, GEOJSON_CONTENT_TYPE,
+)
 
 from dagster_dbt import DbtProject
 from dagster_dbt import DbtCliResource, dbt_assets
-from dagster_duckdb import DuckDBResource
-
-# Azure
-from azure.storage.blob import BlobServiceClient
 
 """ Asset for fetching and loading the air quality data into duckdb """
+# A backfill runs one crawl of the API per window of GBGS_BACKFILL_PARTITIONS_PER_RUN days (see partitions.py)
 @dg.asset(
     kinds={"python", "dlt", "duckdb"},
     required_resource_keys={"GBGS_api_client"},
     io_manager_key="azure_duckdb_io_manager", 
-    group_name="raw_data"
+    group_name="raw_data",
+    partitions_def=daily_partitions,
+    backfill_policy=dg.BackfillPolicy.multi_run(max_partitions_per_run=GBGS_BACKFILL_PARTITIONS_PER_RUN),
+    config_schema=INGESTION_CONFIG_SCHEMA,
+    pool=RAW_DATA_POOL
 )
 def GBGS_raw_data(context):
 
+    # Timings and counters of this run, added to the materialization metadata (see instrumentation.py)
+    metrics = RunMetrics()
+
     az_duckdb_io_manager = context.resources.azure_duckdb_io_manager
     # Use load_input function of io manager to get connection to Azure blob storage container and temp local path
     # (conn, tmp_path): tuple från IO managern
-    conn, tmp_path = az_duckdb_io_manager.load_input(context)
+    conn, tmp_path = az_duckdb_io_manager.load_input(context, metrics)
 
     context.log.info(f"Connected to local duckdb: {tmp_path}")
 
-    pipeline = dlt.pipeline(
-        destination=dlt.destinations.duckdb(conn),
-        dataset_name="air_quality_data"
-    )
-
-    info = pipeline.run(
-        fetch_GBGS_data(context),
-        table_name="GBGS_air_quality_data",
-        write_disposition="merge",
-        primary_key=["date", "time"]
-    )
-
-    context.log.info(f"Loaded {info.loads_ids}")
+    # Named pipeline so the incremental cursor state is restored from the destination
+    with pipeline_working_dir("GBGS_raw_data") as pipelines_dir:
+        pipeline = dlt.pipeline(
+            pipeline_name="GBGS_raw_data",
+            destination=dlt.destinations.duckdb(conn),
+            dataset_name="air_quality_data",
+            pipelines_dir=pipelines_dir
+        )
+
+        # Ingestion mode, load file format, normalize workers and buffer sizes from the asset config (see ingestion.py)
+        ingestion = context.op_config
+        configure_pipeline(pipeline.pipeline_name, ingestion)
+        log_ingestion_config(context, ingestion)
+
+        # Table name, merge and primary key are declared on the incremental dlt resource
+        with metrics.stage("dlt_run"):
+            info = pipeline.run(
+                fetch_GBGS_data(context, metrics, arrow=ingestion["mode"] == "arrow"),
+                loader_file_format=ingestion["loader_file_format"],
+            )
+
+        context.log.info(f"Loaded {info.loads_ids}")
+        record_dlt_trace(metrics, pipeline, "gbgs_air_quality_data")
+
+    # Rows received from the API compared to rows loaded after the incremental cursor filtered old ones out
+    fetched_rows = metrics.get("fetched_rows")
+    loaded_rows = metrics.get("loaded_rows")
+    metrics.set("skipped_rows", fetched_rows - loaded_rows)
+    context.log.info(f"Fetched {fetched_rows} rows, loaded {loaded_rows}, skipped {fetched_rows - loaded_rows}")
+    context.add_output_metadata(metrics.emit(context))
 
     # Return tuple for IO Manager (to use in handle_output)
     return conn, tmp_path
 
 """ Asset for fetching and loading the traffic flow data into duckdb """
+# Trafikverket only serves current measurements. A backfill is a single run over the whole range, which fetches
+# once if the range includes the current day and otherwise returns without touching the database
 @dg.asset(
     kinds={"python", "dlt", "duckdb"},
     required_resource_keys={"TV_api_client"},
     io_manager_key="azure_duckdb_io_manager",
     group_name="raw_data",
+    partitions_def=daily_partitions,
+    backfill_policy=dg.BackfillPolicy.single_run(),
+    config_schema=INGESTION_CONFIG_SCHEMA,
+    pool=RAW_DATA_POOL
 )
 def TV_raw_data(context):
 
+    # Past partitions have nothing to fetch, no database download or upload (handle_output gets None)
+    key_range = run_partition_range(context)
+    if key_range is not None and key_range.end != daily_partitions.get_last_partition_key():
+        context.log.info(f"No historical traffic flow data for {key_range.start} to {key_range.end}, nothing to fetch")
+        return None
+
+    # Timings and counters of this run, added to the materialization metadata (see instrumentation.py)
+    metrics = RunMetrics()
+
     az_duckdb_io_manager = context.resources.azure_duckdb_io_manager
     # Use load_input function of io manager to get connection to Azure blob storage container and temp local path
     # (conn, tmp_path): tuple från IO managern
-    conn, tmp_path = az_duckdb_io_manager.load_input(context)
+    conn, tmp_path = az_duckdb_io_manager.load_input(context, metrics)
 
     context.log.info(f"Connected to local duckdb: {tmp_path}")
 
-    pipeline = dlt.pipeline(
-        destination=dlt.destinations.duckdb(conn),
-        dataset_name="traffic_flow_data"
-    )
-
-
-    info = pipeline.run(
-        fetch_TV_data(context),
-        table_name="TV_traffic_flow_data",
-        write_disposition="merge",
-        primary_key=["SiteId", "MeasurementTime"]
-    )
-
-    context.log.info(f"Loaded {info.loads_ids}")
+    # Named pipeline so the change id state is restored from the destination
+    with pipeline_working_dir("TV_raw_data") as pipelines_dir:
+        pipeline = dlt.pipeline(
+            pipeline_name="TV_raw_data",
+            destination=dlt.destinations.duckdb(conn),
+            dataset_name="traffic_flow_data",
+            pipelines_dir=pipelines_dir
+        )
+
+        # Ingestion mode, load file format, normalize workers and buffer sizes from the asset config (see ingestion.py)
+        ingestion = context.op_config
+        configure_pipeline(pipeline.pipeline_name, ingestion)
+        log_ingestion_config(context, ingestion)
+
+        # Table name, merge and primary key are declared on the incremental dlt resource
+        with metrics.stage("dlt_run"):
+            info = pipeline.run(
+                fetch_TV_data(context, metrics, arrow=ingestion["mode"] == "arrow"),
+                loader_file_format=ingestion["loader_file_format"],
+            )
+
+        context.log.info(f"Loaded {info.loads_ids}")
+        record_dlt_trace(metrics, pipeline, "tv_traffic_flow_data")
+        context.log.info(f"Fetched {metrics.get('fetched_rows')} changed measurements, loaded {metrics.get('loaded_rows')}")
+
+        # Keep the detector_sites dimension up to date with the sites of this run
+        with metrics.stage("detector_sites_upsert"):
+            upserted_sites = upsert_detector_sites(pipeline, conn, info.loads_ids)
+        metrics.set("upserted_detector_sites", upserted_sites)
+        context.log.info(f"Upserted {upserted_sites} detector sites")
+
+    context.add_output_metadata(metrics.emit(context))
 
     # Return tuple for IO Manager (to use in handle_output)
     return conn, tmp_path
 
 
 """ Asset for getting air quality stations coordinates and map """
+# Data version: hash of the monitoring stations JSON and the code version. Runs after every GBGS load but only
+# rebuilds the layer when the stations or the code changed
 @dg.asset(
     kinds={"python"},
-    required_resource_keys={"monitoring_stations_data"},
+    required_resource_keys={"monitoring_stations_data", "artifact_store"},
     deps=[GBGS_raw_data],
-    group_name = "maps"
+    io_manager_key="map_tables_io_manager",
+    group_name = "maps",
+    code_version="2",
+    automation_condition=raw_data_updated()
 )
 def monitoring_station_locations_map(context: dg.AssetExecutionContext):
 
+    metrics = RunMetrics()
     monitoring_stations_data = context.resources.monitoring_stations_data
-    coordinates = []
-    station_names = []
-
-    for loc in monitoring_stations_data["locations"]:
-        coordinates.append(loc["coordinates"])
-        station_names.append(loc["name"])
-
-    gbg_center = [57.7089, 11.9746]
-    map_gbg = folium.Map(location=gbg_center, zoom_start=13)
-
-    for coord, station_name in zip(coordinates, station_names):
-        folium.Marker(
-            location=coord,
-            popup=f"Lat: {coord[0]}, Lon: {coord[1]}, Station name: {station_name}",
-            icon=folium.Icon(color='red', icon='info-sign')
-        ).add_to(map_gbg)
+    stations = stations_table(monitoring_stations_data["locations"])
+    metrics.set("stations", stations.height)
 
-    # Temporary local path
-    local_map_path = "/tmp/monitoring_stations.html"
-    map_gbg.save(local_map_path)
+    data_version = asset_content_version(context, monitoring_stations_data)
+    if data_version == latest_data_version(context):
+        context.log.info(f"Monitoring stations unchanged (data version {data_version.value}), skipped map")
+        return dg.Output(stations, data_version=data_version, metadata=metrics.emit(context))
 
-    # Upload to Azure blob storage
-    conn_str = os.environ.get("AZURE_STORAGE_CONNECTION_STRING")
-    if not conn_str:
-        raise ValueError("Missing AZURE_STORAGE_CONNECTION_STRING env var")
+    # Stations layer and a thin map page referencing it
+    with metrics.stage("build_layers"):
+        stations_layer = point_features(
+            stations.select("lat", "lon").rows(),
+            [{"Station name": name} for name in stations["station_name"]],
+        )
+        page = map_shell("Monitoring stations", [map_layer("Monitoring stations", STATIONS_LAYER, "red")])
+        artifacts = {
+            f"maps/{STATIONS_LAYER}": (geojson_bytes(stations_layer), GEOJSON_CONTENT_TYPE),
+            "maps/monitoring_stations.html": (page.encode("utf-8"), "text/html"),
+        }
 
-    blob_service = BlobServiceClient.from_connection_string(conn_str)
-    blob_client = blob_service.get_blob_client(container="dagster-storage", blob="maps/monitoring_stations.html")
+    # Upload from memory, each upload skipped if identical to the stored blob
+    _wait_uploads(context, metrics, _submit_uploads(context, metrics, artifacts))
 
-    with open(local_map_path, "rb") as data:
-        blob_client.upload_blob(data, overwrite=True)
-        context.log.info("Uploaded monitoring_stations.html to Azure blob storage in maps folder")
-
-    # Remove temporary local file
-    os.remove(local_map_path)
-
-    return coordinates, station_names
+    return dg.Output(stations, data_version=data_version, metadata=metrics.emit(context))
 
 
 """ Asset for getting trafficflow detector coordinates and map """
+# Data version: hash of the distinct detector sites and the code version. Runs after every TV load but only
+# rebuilds the layer and the spatial index when sites were added or moved, or the code changed.
+# Reads the dbt database, so it runs in the dbt pool
 @dg.asset(
     kinds={"python"},
+    required_resource_keys={"database", "artifact_store"},
     deps=[TV_raw_data],
-    group_name = "maps"
+    io_manager_key="map_tables_io_manager",
+    group_name = "maps",
+    code_version="2",
+    pool=DBT_DATABASE_POOL,
+    automation_condition=raw_data_updated()
 )
-def detector_locations_map(context: dg.AssetExecutionContext, database: DuckDBResource):
+def detector_locations_map(context: dg.AssetExecutionContext):
 
+    metrics = RunMetrics()
+    database = context.resources.database
+
+    # Small dimension table maintained by TV_raw_data, no scan of the raw traffic flow table
     query = """
-    SELECT DISTINCT site_id, geometry__wgs84
-    FROM traffic_flow_data.tv_traffic_flow_data
+    SELECT site_id, lat, lon
+    FROM traffic_flow_data.detector_sites
+    ORDER BY site_id
     """
-    with database.get_connection() as conn:
-        df = conn.execute(query).pl()
-
-    coordinates = []
-    site_ids = []
-    
-    for row in df.iter_rows(named=True):
-
-        wgs84_str = row["geometry__wgs84"]
-        stripped = wgs84_str.replace('POINT (', '').replace(')', '')
-        lon_str, lat_str = stripped.strip().split()
-        lat = float(lat_str)
-        lon = float(lon_str)
-        siteid = int(row['site_id'])
-        coordinate = [lat, lon]
-        coordinates.append(coordinate)
-        site_ids.append(siteid)
-
-    gbg_center = [57.7089, 11.9746]
-    map_gbg = folium.Map(location=gbg_center, zoom_start=13)
-
-    for coord, siteid in zip(coordinates, site_ids):
-        folium.Marker(
-            location=coord,
-            popup=f"Lat: {coord[0]}, Lon: {coord[1]}, Siteid:{siteid}",
-            icon=folium.Icon(color='blue', icon='info-sign')
-        ).add_to(map_gbg)
-
-    # Temporary local path
-    local_map_path = "/tmp/detectors.html"
-    map_gbg.save(local_map_path)
-
-    # Upload to Azure blob storage
-    conn_str = os.environ.get("AZURE_STORAGE_CONNECTION_STRING")
-    if not conn_str:
-        raise ValueError("Missing AZURE_STORAGE_CONNECTION_STRING env var")
-
-    blob_service = BlobServiceClient.from_connection_string(conn_str)
-    blob_client = blob_service.get_blob_client(container="dagster-storage", blob="maps/detectors.html")
-
-    with open(local_map_path, "rb") as data:
-        blob_client.upload_blob(data, overwrite=True)
-        context.log.info("Uploaded detectors.html to Azure blob storage in maps folder")
-
-    # Remove temporary local file
-    os.remove(local_map_path)
-    return coordinates, site_ids
+    with metrics.stage("query"), database.get_connection() as conn:
+        detectors = detectors_table(conn.execute(query).pl())
+    metrics.set("detector_sites", detectors.height)
+
+    coordinates = [[lat, lon] for lat, lon in detectors.select("lat", "lon").iter_rows()]
+    site_ids = detectors["site_id"].to_list()
+
+    data_version = asset_content_version(context, [site_ids, coordinates])
+    if data_version == latest_data_version(context):
+        context.log.info(f"Detector sites unchanged (data version {data_version.value}), skipped map")
+        return dg.Output(detectors, data_version=data_version, metadata=metrics.emit(context))
+
+    # Clustered detectors layer (also used by merged_map) and a thin map page referencing it
+    with metrics.stage("build_layers"):
+        detectors_layer = point_features(coordinates, [{"Site id": site_id} for site_id in site_ids])
+        page = map_shell("Detectors", [map_layer("Detectors", DETECTORS_LAYER, "blue", cluster=True)])
+        artifacts = {
+            f"maps/{DETECTORS_LAYER}": (geojson_bytes(detectors_layer), GEOJSON_CONTENT_TYPE),
+            "maps/detectors.html": (page.encode("utf-8"), "text/html"),
+        }
+
+    # Upload from memory in the background, each upload skipped if identical to the stored blob
+    uploads = _submit_uploads(context, metrics, artifacts)
+
+    # Spatial index of the sites next to the database, rebuilt only when the sites change
+    with metrics.stage("detector_index"):
+        save_detector_index(detector_index_path(database), coordinates)
+
+    _wait_uploads(context, metrics, uploads)
+
+    return dg.Output(detectors, data_version=data_version, metadata=metrics.emit(context))
 
 
 """ Asset for matching monitoring stations to closest detector """
+# k: number of nearest detectors listed per station (None for all within radius_km)
+# radius_km: only list detectors within this distance
+# Only requested when the station or detector data version changed (see versions.py). Writes the matches table to
+# the dbt database, so it runs in the dbt pool
 @dg.asset(
-    kinds={"python"},
-    group_name = "maps"
+    kinds={"python", "duckdb"},
+    required_resource_keys={"database", "artifact_store", "monitoring_stations_data"},
+    config_schema={
+        "k": dg.Field(dg.Noneable(int), default_value=1, is_required=False),
+        "radius_km": dg.Field(dg.Noneable(float), default_value=None, is_required=False),
+    },
+    io_manager_key="map_tables_io_manager",
+    group_name = "maps",
+    code_version="2",
+    pool=DBT_DATABASE_POOL,
+    automation_condition=upstream_version_changed()
 )
 def mapping_station_to_detector(
     context: dg.AssetExecutionContext,
-    monitoring_station_locations_map: tuple, 
-    detector_locations_map: tuple
+    monitoring_station_locations_map: pl.DataFrame,
+    detector_locations_map: pl.DataFrame
 ):
-    coordinates_ms, station_names = monitoring_station_locations_map
-    coordinates_d, site_ids = detector_locations_map
-
-    matches = []
-    
-    for i, ms_coord in enumerate(coordinates_ms):
-        min_distance = float('inf')
-        closest_detector = None
-        closest_id = None
-        
-        for j, det_coord in enumerate(coordinates_d):
-            distance = geodesic(ms_coord, det_coord).kilometers
-            
-            if distance < min_distance:
-                min_distance = distance
-                closest_detector = det_coord
-                closest_id = site_ids[j]
-        
-        matches.append({
-            'monitoring_station_index': i,
-            'monitoring_station_name': station_names[i] if i < len(station_names) else f"Station_{i}",
-            'monitoring_coord': ms_coord,
-            'closest_detector_id': closest_id,
-            'closest_detector_coord': closest_detector,
-            'distance_km': min_distance
-        })
-    
-    # Temporary JSON file path
-    local_json_path = "/tmp/station_detector_matches.json"
-    with open(local_json_path, 'w') as f:
-        json.dump(matches, f, indent=2, default=str)
-    
-    # Upload to Azure blob storage
-    conn_str = os.environ.get("AZURE_STORAGE_CONNECTION_STRING")
-    if not conn_str:
-        raise ValueError("Missing AZURE_STORAGE_CONNECTION_STRING env var")
-
-    blob_service = BlobServiceClient.from_connection_string(conn_str)
-    blob_client = blob_service.get_blob_client(container="dagster-storage", blob="json_files/station_detector_matches.json")
-
-    with open(local_json_path, "rb") as data:
-        blob_client.upload_blob(data, overwrite=True)
-        context.log.info("Uploaded station_detector_matches.json to Azure blob storage in json_files folder")
-
-    # Remove temporary file
-    os.remove(local_json_path)
-    return matches
+    metrics = RunMetrics()
+    database = context.resources.database
+    stations = monitoring_station_locations_map
+    detectors = detector_locations_map
+    coordinates_d = detectors.select("lat", "lon").to_numpy()
+
+    # BallTree (haversine) candidates re-ranked with exact geodesic distance.
+    # Uses the index saved by detector_locations_map when it matches the detector coordinates
+    with metrics.stage("matching"):
+        nearest = nearest_detectors(
+            stations.select("lat", "lon").to_numpy(),
+            coordinates_d,
+            k=context.op_config["k"],
+            radius_km=context.op_config["radius_km"],
+            tree=load_detector_index(detector_index_path(database), coordinates_d),
+        )
+
+        # One row per station and matched detector
+        matches = matches_table(stations, detectors, nearest)
+
+    # Upload JSON from memory, skipped if identical to the stored matches
+    artifacts = {
+        "json_files/station_detector_matches.json": (json.dumps(matches_json(matches), indent=2, default=str, allow_nan=False).encode("utf-8"), "application/json"),
+    }
+    _wait_uploads(context, metrics, _submit_uploads(context, metrics, artifacts))
+
+    # Matches as a table for the dbt station/detector mart
+    with metrics.stage("save_matches"), database.get_connection() as conn:
+        saved_rows = save_station_detector_matches(conn, matches)
+    metrics.set("matches", saved_rows)
+    context.log.info(f"Saved {saved_rows} station/detector matches to maps.station_detector_matches")
+
+    return dg.Output(matches, metadata=metrics.emit(context))
 
 
 """ Asset for merging monitoring stations and detectors locations into map """
+# Only requested when an upstream map data version changed (see versions.py)
 @dg.asset(
     kinds={"python"},
-    group_name = "maps"
+    required_resource_keys={"artifact_store"},
+    io_manager_key="map_tables_io_manager",
+    group_name = "maps",
+    code_version="2",
+    automation_condition=upstream_version_changed()
 )
 def merged_map(
     context: dg.AssetExecutionContext,
-    monitoring_station_locations_map: tuple, 
-    detector_locations_map: tuple,
-    mapping_station_to_detector: list  
+    monitoring_station_locations_map: pl.DataFrame,
+    detector_locations_map: pl.DataFrame,
+    mapping_station_to_detector: pl.DataFrame
 ):
-    coordinates_ms, station_names = monitoring_station_locations_map
-    coordinates_d, site_ids = detector_locations_map
-    matches = mapping_station_to_detector
-
-    gbg_center = [57.7089, 11.9746]
-    combined_map = folium.Map(location=gbg_center, zoom_start=13)
-    
-    # Add monitoring station markers
-    for coord, name in zip(coordinates_ms, station_names):
-        folium.Marker(
-            location=coord,
-            popup=f"Monitoring Station: {name}<br>Lat: {coord[0]}<br>Lon: {coord[1]}",
-            icon=folium.Icon(color='red', icon='info-sign')
-        ).add_to(combined_map)
-    
-    # Add detector markers
-    for coord, siteid in zip(coordinates_d, site_ids):
-        folium.Marker(
-            location=coord,
-            popup=f"Detector Site ID: {siteid}<br>Lat: {coord[0]}<br>Lon: {coord[1]}",
-            icon=folium.Icon(color='blue', icon='info-sign')
-        ).add_to(combined_map)
-    
-    # Add connection lines between matched stations and detectors
-    for match in matches:
-        ms_coord = match['monitoring_coord']
-        det_coord = match['closest_detector_coord']
-        station_name = match['monitoring_station_name']
-        detector_id = match['closest_detector_id']
-        distance = match['distance_km']
-        
-        # Add connection line
-        folium.PolyLine(
-            locations=[ms_coord, det_coord],
-            color='green',
-            weight=4,
-            opacity=0.8,
-            popup=f"Connection: {station_name} → {detector_id}<br>Distance: {distance:.2f} km"
-        ).add_to(combined_map)
-    
-    # combined_map.save("/opt/dagster/app/data/maps/merged_map.html")
-
-    # Temporary local path
-    local_map_path = "/tmp/detectors.html"
-    combined_map.save(local_map_path)
-
-    # Upload to Azure blob storage
-    conn_str = os.environ.get("AZURE_STORAGE_CONNECTION_STRING")
-    if not conn_str:
-        raise ValueError("Missing AZURE_STORAGE_CONNECTION_STRING env var")
-
-    blob_service = BlobServiceClient.from_connection_string(conn_str)
-    blob_client = blob_service.get_blob_client(container="dagster-storage", blob="maps/merged_map.html")
-
-    with open(local_map_path, "rb") as data:
-        blob_client.upload_blob(data, overwrite=True)
-        context.log.info("Uploaded merged_map.html to Azure blob storage in maps folder")
-
-    # Remove temporary local file
-    os.remove(local_map_path)    
-    return combined_map
+    metrics = RunMetrics()
+
+    # Connection lines between each station and its closest detector, skipping stations without a detector within
+    # the configured radius. Station and detector markers are the layers uploaded by the upstream map assets
+    with metrics.stage("build_layers"):
+        links = mapping_station_to_detector.filter(pl.col("rank") == 1).select(
+            "station_name", "station", "detector_id", "station_lat", "station_lon", "detector_lat", "detector_lon", "distance_km"
+        )
+        links_layer = line_features(
+            [
+                [[station_lat, station_lon], [detector_lat, detector_lon]]
+                for station_lat, station_lon, detector_lat, detector_lon
+                in links.select("station_lat", "station_lon", "detector_lat", "detector_lon").iter_rows()
+            ],
+            [
+                {
+                    "Connection": f"{station_name} → {detector_id}",
+                    "Distance (km)": round(distance_km, 2),
+                }
+                for station_name, detector_id, distance_km in links.select("station_name", "detector_id", "distance_km").iter_rows()
+            ],
+        )
+        page = map_shell("Monitoring stations and detectors", [
+            map_layer("Monitoring stations", STATIONS_LAYER, "red"),
+            map_layer("Detectors", DETECTORS_LAYER, "blue", cluster=True),
+            map_layer("Connections", LINKS_LAYER, "green"),
+        ])
+        artifacts = {
+            f"maps/{LINKS_LAYER}": (geojson_bytes(links_layer), GEOJSON_CONTENT_TYPE),
+            "maps/merged_map.html": (page.encode("utf-8"), "text/html"),
+        }
+    metrics.set("links", links.height)
+
+    # Upload from memory, each upload skipped if identical to the stored blob
+    _wait_uploads(context, metrics, _submit_uploads(context, metrics, artifacts))
+
+    return dg.Output(links, metadata=metrics.emit(context))
+
+
+# Upload artifacts (blob name -> (data, content type)) in the background, returns blob name -> future
+def _submit_uploads(context, metrics, artifacts):
+    artifact_store = context.resources.artifact_store
+    uploads = {}
+    for blob_name, (data, content_type) in artifacts.items():
+        metrics.count("artifact_bytes", len(data))
+        uploads[blob_name] = artifact_store.submit(blob_name, data, content_type)
+    return uploads
+
+
+# Wait for background uploads and log which ones were skipped. upload_wait_seconds is the time spent waiting
+# after the asset's own work, artifacts_uploaded/artifacts_skipped count the blobs
+def _wait_uploads(context, metrics, uploads):
+    with metrics.stage("upload_wait"):
+        for blob_name, upload in uploads.items():
+            if upload.result():
+                metrics.count("artifacts_uploaded")
+                context.log.info(f"Uploaded {blob_name} to Azure blob storage")
+            else:
+                metrics.count("artifacts_skipped")
+                context.log.info(f"{blob_name} unchanged, skipped upload")
 
 
 """ dbt assets """
@@ -346,8 +402,23 @@ air_quality_project = DbtProject(
 air_quality_project.prepare_if_dev()
 
 # Create dbt assets (all dbt models in dbt project)
+# Partitioned like the raw data. A backfill runs one dbt build per window of DBT_BACKFILL_PARTITIONS_PER_RUN days.
+# All dbt runs write the database at DUCKDB_DATABASE_PATH, so the dbt pool lets one step at a time use it
+# (see partitions.py)
 @dbt_assets(
-    manifest=air_quality_project.manifest_path # dbt's complied project representations in dbt/target/ - for dagster to 'understand' dbt models and their relationships
+    manifest=air_quality_project.manifest_path, # dbt's complied project representations in dbt/target/ - for dagster to 'understand' dbt models and their relationships
+    partitions_def=daily_partitions,
+    backfill_policy=dg.BackfillPolicy.multi_run(max_partitions_per_run=DBT_BACKFILL_PARTITIONS_PER_RUN),
+    pool=DBT_DATABASE_POOL
 )
 def air_quality_dbt_assets(context: dg.AssetExecutionContext, dbt: DbtCliResource):
-    yield from dbt.cli(["build"], context=context).stream() # manifest generated when running dbt commands (build/run...)
\ No newline at end of file
+    args = ["build"]
+
+    # Partition window as dbt vars, the models only rebuild these days (see macros/partition_window.sql). Runs of the
+    # current day take the dlt loads since the last build instead (see partitions.py)
+    if not is_current_partition_run(context):
+        start, end = context.partition_time_window
+        dbt_vars = {"min_date": start.strftime("%Y-%m-%d"), "max_date": end.strftime("%Y-%m-%d")}
+        args += ["--vars", json.dumps(dbt_vars)]
+
+    yield from dbt.cli(args, context=context).stream() # manifest generated when running dbt commands (build/run...)
\ No newline at end of file
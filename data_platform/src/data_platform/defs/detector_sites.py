@@ -0,0 +1,60 @@
+""" detector_sites dimension table
+
+One row per Trafikverket detector site with parsed lat/lon, upserted by TV_raw_data from the rows of each new
+load. The map and matching assets read this small table instead of scanning tv_traffic_flow_data.
+It is loaded through the same dlt pipeline (merge on site_id), so it is synced by the IO manager like the raw table
+"""
+
+# Sites seen in the given loads, or in the whole raw table the first time (when detector_sites does not exist yet)
+# The WGS84 'POINT (lon lat)' string is parsed in SQL with one regexp_extract per site (same pattern as the
+# wgs84_point dbt macro), no Python loop over rows
+WGS84_POINT_PATTERN = r"^POINT\s*\(\s*(\S+)\s+(\S+)\s*\)$"
+
+NEW_SITES_QUERY = """
+WITH sites AS (
+    SELECT
+        site_id,
+        any_value(geometry__wgs84) AS geometry__wgs84,
+        max(measurement_time) AS last_seen
+    FROM traffic_flow_data.tv_traffic_flow_data
+    {where}
+    GROUP BY site_id
+),
+parsed AS (
+    SELECT *, regexp_extract(geometry__wgs84, '""" + WGS84_POINT_PATTERN + """', ['lon', 'lat']) AS point
+    FROM sites
+)
+SELECT
+    site_id,
+    geometry__wgs84,
+    CAST(point.lat AS DOUBLE) AS lat,
+    CAST(point.lon AS DOUBLE) AS lon,
+    last_seen
+FROM parsed
+"""
+
+
+def detector_sites_exist(conn):
+    return conn.execute("""
+        SELECT count(*) FROM information_schema.tables
+        WHERE table_schema = 'traffic_flow_data' AND table_name = 'detector_sites'
+    """).fetchone()[0] > 0
+
+
+def new_detector_sites(conn, load_ids):
+    if detector_sites_exist(conn):
+        if not load_ids:
+            return []
+        load_id_list = ", ".join(f"'{load_id}'" for load_id in load_ids)
+        where = f"WHERE _dlt_load_id IN ({load_id_list})"
+    else:
+        where = ""
+
+    return conn.execute(NEW_SITES_QUERY.format(where=where)).pl().to_dicts()
+
+
+def upsert_detector_sites(pipeline, conn, load_ids):
+    sites = new_detector_sites(conn, load_ids)
+    if sites:
+        pipeline.run(sites, table_name="detector_sites", write_disposition="merge", primary_key="site_id")
+    return len(sites)
@@ -1,51 +1,388 @@
+import codecs
 import dagster as dg
-import requests
+import dlt
+import json
+import math
+import pyarrow as pa
+import pyarrow.compute as pc
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from urllib.parse import parse_qs, urlencode, urlparse, urlunparse
 
-def fetch_GBGS_data(context: dg.AssetExecutionContext):
+from .partitions import is_current_partition_run
+
+def fetch_GBGS_data(context: dg.AssetExecutionContext, metrics=None, arrow=False):
 
     GBGS_api_client = context.resources.GBGS_api_client
-    url = GBGS_api_client.base_url
 
-    while True:
-        response = requests.get(url)
-        
-        if response.status_code == 200:
-            data = response.json()
-            results = data.get("results", [])
-            yield results
+    # Runs of a past day or a backfill window load the days of the partition window without reading or moving the
+    # stored cursor, so they can run independently. Runs of the current day follow the cursor (see partitions.py)
+    if not is_current_partition_run(context):
+        start, end = context.partition_time_window
+        cursor = dlt.sources.incremental(
+            "date",
+            initial_value=start.strftime("%Y-%m-%d"),
+            end_value=end.strftime("%Y-%m-%d"),
+            row_order=GBGS_api_client.row_order,
+        )
+    else:
+        cursor = dlt.sources.incremental("date", row_order=GBGS_api_client.row_order)
+    return GBGS_air_quality_data(GBGS_api_client, metrics, arrow, cursor=cursor)
 
-            next_url = data.get("next")
+""" Incremental dlt resource for GBGS data """
+# The last loaded date is kept in the pipeline state. Rows at or before it are dropped before normalize, rows on
+# the last loaded date are deduplicated on the primary key, so the merge only touches new rows.
+# If the API supports a date filter (date_filter_param) only newer dates are requested, and if it returns rows
+# sorted by date (row_order) the crawl stops as soon as it reaches already loaded dates.
+# metrics (instrumentation.RunMetrics) counts the pages and rows received from the API, to compare with rows loaded.
+# Rows are loaded typed (see normalize_GBGS_row), date and time are kept as the key and cursor.
+# Only raw tables created with typed rows get DOUBLE measurement columns. In a raw table created before, the
+# measurement columns stay VARCHAR: dlt keeps the stored column types and loads the floats (rows and arrow mode) as
+# text, and only columns added later are DOUBLE. dbt reads every measurement column with try_cast
+# (gbgs_measurements in macros/gbgs.sql), so both layouts give the same models.
+# With arrow each page is yielded as a pyarrow Table with the declared GBGS schema (ingestion mode "arrow", see
+# ingestion.py and GBGS_arrow_page)
+@dlt.resource(
+    table_name="GBGS_air_quality_data",
+    write_disposition="merge",
+    primary_key=["date", "time"],
+    columns={"measured_at": {"data_type": "timestamp", "timezone": True}},
+)
+def GBGS_air_quality_data(GBGS_api_client, metrics=None, arrow=False, cursor=dlt.sources.incremental("date")):
 
-            if next_url:
-                url = next_url
-            else:
-                break
+    url = GBGS_api_client.base_url
+    if GBGS_api_client.date_filter_param and cursor.last_value:
+        url = _with_query(url, **{GBGS_api_client.date_filter_param: cursor.last_value})
 
+    for results in fetch_GBGS_pages(GBGS_api_client, url, metrics):
+        if metrics is not None:
+            metrics.count("fetched_pages")
+            metrics.count("fetched_rows", len(results))
+        if arrow:
+            yield GBGS_arrow_page(results, metrics)
         else:
-            raise RuntimeError(f"API request failed with status code: {response.status_code}")
+            yield [normalize_GBGS_row(row, metrics) for row in results]
+
+GBGS_KEY_COLUMNS = ("date", "time")
+GBGS_TIMEZONE = ZoneInfo("Europe/Stockholm")
+
+""" Typed GBGS row """
+# measured_at: timezone aware timestamp from date and time. "24:00" is midnight of the next day and the offset in
+# time ("+01:00") is kept, times without offset are local time. Every other column is a measurement: parsed to a
+# float, blanks become None. Values that are not numbers become None as well (counted as invalid_values in
+# metrics), so a column never gets a text variant
+def normalize_GBGS_row(row, metrics=None):
+
+    typed = {"date": row["date"], "time": row["time"], "measured_at": _GBGS_measured_at(row["date"], row["time"])}
+    for column, value in row.items():
+        if column not in GBGS_KEY_COLUMNS:
+            typed[column] = _GBGS_value(value, metrics)
+    return typed
+
+def _GBGS_measured_at(date, time):
+
+    clock, offset = re.match(r"(\d{1,2}:\d{2})([+-]\d{2}:\d{2})?$", time.strip()).groups()
+    hours, minutes = map(int, clock.split(":"))
+    midnight = datetime.fromisoformat(f"{date}T00:00{offset or ''}")
+    if midnight.tzinfo is None:
+        midnight = midnight.replace(tzinfo=GBGS_TIMEZONE)
+    return midnight + timedelta(hours=hours, minutes=minutes)
+
+def _GBGS_value(value, metrics=None):
+
+    if isinstance(value, str):
+        value = value.strip()
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    elif value is None or isinstance(value, float):
+        return value
+    elif isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+
+    if metrics is not None:
+        metrics.count("invalid_values")
+    return None
+
+""" Arrow page of GBGS data with a fixed schema """
+# date and time as strings, measured_at in UTC and every measurement as float64. The known measurement columns are
+# always present (null when the API leaves them out), so the table schema does not depend on the page. Columns the
+# API adds are appended as float64. Measurements are parsed per column (whitespace trimmed, blanks to null); a
+# column with values that are not numbers is parsed value by value and those values become null (counted as
+# invalid_values in metrics), like in rows mode
+# Station-measurement columns of the GBGS API (as in data/parquet_files/aq_data_2025.parquet), also the columns of
+# the synthetic GBGS data (benchmarks/synthetic.py)
+GBGS_MEASUREMENT_COLUMNS = (
+    "femman_airpressure", "femman_globrad", "femman_no2", "femman_nox", "femman_o3", "femman_pm10", "femman_pm25",
+    "femman_rain", "femman_rh", "femman_temp", "femman_winddir", "femman_windspeed",
+    "haganorra_no2", "haganorra_nox", "hagasodra_pm10", "hagasodra_pm25",
+    "lejonet_airpressure", "lejonet_globrad", "lejonet_rain", "lejonet_rh", "lejonet_temp", "lejonet_winddir",
+    "lejonet_windspeed",
+    "mobil1_no2", "mobil1_nox", "mobil1_pm10", "mobil2_no2", "mobil2_nox", "mobil2_pm10", "mobil2_pm25",
+    "mobil3_no2", "mobil3_nox", "mobil3_pm10",
+)
+
+GBGS_ARROW_SCHEMA = pa.schema(
+    [("date", pa.string()), ("time", pa.string()), ("measured_at", pa.timestamp("us", tz="UTC"))]
+    + [(column, pa.float64()) for column in GBGS_MEASUREMENT_COLUMNS]
+)
+
+def GBGS_arrow_page(results, metrics=None):
+
+    schema = GBGS_ARROW_SCHEMA
+    known = set(schema.names)
+    extra = sorted({column for row in results for column in row} - known)
+    if extra:
+        schema = pa.schema(list(schema) + [(column, pa.float64()) for column in extra])
+
+    columns = {
+        "date": pa.array([row["date"] for row in results], pa.string()),
+        "time": pa.array([row["time"] for row in results], pa.string()),
+        "measured_at": pa.array([_GBGS_measured_at(row["date"], row["time"]) for row in results], pa.timestamp("us", tz="UTC")),
+    }
+    for column in schema.names[3:]:
+        columns[column] = _GBGS_float_column([row.get(column) for row in results], metrics)
+
+    return pa.Table.from_pydict(columns, schema=schema)
+
+def _GBGS_float_column(values, metrics=None):
+
+    if all(value is None or isinstance(value, str) for value in values):
+        trimmed = pc.utf8_trim_whitespace(pa.array(values, pa.string()))
+        try:
+            return pc.if_else(pc.equal(trimmed, ""), None, trimmed).cast(pa.float64())
+        except pa.ArrowInvalid:
+            pass
+
+    return pa.array([_GBGS_value(value, metrics) for value in values], pa.float64())
+
+""" Paginated fetch of GBGS data, yields the results of each page in order """
+# The first page is fetched alone. If the pagination pattern (offset/limit or page number) and total count are
+# known, the remaining pages are prefetched with at most client.max_in_flight requests in flight over the
+# client's keep-alive session. Otherwise the next links are followed one at a time.
+# With metrics the latency of every request is recorded (gbgs_http_*)
+def fetch_GBGS_pages(GBGS_api_client, url, metrics=None):
+
+    get_json = GBGS_api_client.get_json
+    if metrics is not None:
+        get_json = metrics.timed("gbgs_http", get_json)
+
+    data = get_json(url)
+    yield data.get("results", [])
+
+    page_urls = _GBGS_page_urls(data)
+
+    if page_urls:
+        in_flight = deque()
+        with ThreadPoolExecutor(max_workers=GBGS_api_client.max_in_flight) as pool:
+            for page_url in page_urls:
+                in_flight.append(pool.submit(get_json, page_url))
+
+                if len(in_flight) >= GBGS_api_client.max_in_flight:
+                    data = in_flight.popleft().result()
+                    yield data.get("results", [])
+
+            while in_flight:
+                data = in_flight.popleft().result()
+                yield data.get("results", [])
+
+    # Follow next links (all pages if the pattern is unknown, or pages added while prefetching)
+    next_url = data.get("next")
+    while next_url:
+        data = get_json(next_url)
+        yield data.get("results", [])
+        next_url = data.get("next")
+
+# Build the urls of all remaining pages from the next link of the first page, None if the pattern is unknown
+def _GBGS_page_urls(first_page):
+
+    next_url = first_page.get("next")
+    count = first_page.get("count")
+    page_size = len(first_page.get("results", []))
+
+    if not next_url or not count or not page_size:
+        return None
+
+    query = parse_qs(urlparse(next_url).query)
+
+    if "offset" in query:
+        limit = int(query["limit"][0]) if "limit" in query else page_size
+        first_offset = int(query["offset"][0])
+        return [_with_query(next_url, offset=offset) for offset in range(first_offset, count, limit)]
+
+    if "page" in query:
+        last_page = math.ceil(count / page_size)
+        first_page_number = int(query["page"][0])
+        return [_with_query(next_url, page=page) for page in range(first_page_number, last_page + 1)]
+
+    return None
+
+# Set (or replace) query parameters of an url
+def _with_query(url, **params):
+    parts = urlparse(url)
+    query = {**parse_qs(parts.query), **{key: [str(value)] for key, value in params.items()}}
+    return urlunparse(parts._replace(query=urlencode(query, doseq=True)))
         
-def fetch_TV_data(context: dg.AssetExecutionContext):
-    
+def fetch_TV_data(context: dg.AssetExecutionContext, metrics=None, arrow=False):
+
     TV_api_client = context.resources.TV_api_client
-    response = TV_api_client.response
-    print(response)
-    
-    if response.status_code == 200:
-        data = response.json()
+    return TV_traffic_flow_data(TV_api_client, metrics, arrow)
 
-        if 'RESPONSE' in data and 'RESULT' in data['RESPONSE']:
-            result = data['RESPONSE']['RESULT'][0]
+""" Incremental dlt resource for Trafikverket data """
+# The LASTCHANGEID of the previous response is kept in the resource state and sent as changeid, so only changed
+# measurements are returned. It is only updated once the whole response has been read, so a failed run
+# fetches the same changes again. Measurements are yielded in batches of TV_api_client.batch_size, as pyarrow
+# Tables with the declared TrafficFlow schema with arrow (see TV_arrow_batch)
+@dlt.resource(table_name="TV_traffic_flow_data", write_disposition="merge", primary_key=["SiteId", "MeasurementTime"])
+def TV_traffic_flow_data(TV_api_client, metrics=None, arrow=False):
 
-        if "TrafficFlow" in result:
-            traffic_data = result['TrafficFlow']
+    state = dlt.current.resource_state()
+    info = {}
 
-        # # Neglect old data by filtering on current minute (maybe not needed since DLT handles)
-        # current_minute = arrow.now().floor('minute')
-        # print(current_minute)
-        # current_traffic_data = [row for row in traffic_data 
-        #                 if arrow.get(row['MeasurementTime']).floor('minute') == current_minute]
+    for batch in fetch_TV_batches(TV_api_client, state.get("last_change_id", "0"), info, metrics):
+        if metrics is not None:
+            metrics.count("fetched_batches")
+            metrics.count("fetched_rows", len(batch))
+        yield TV_arrow_batch(batch) if arrow else batch
 
-        yield traffic_data
+    if info.get("last_change_id"):
+        state["last_change_id"] = info["last_change_id"]
 
-    else:
-        raise RuntimeError(f"API request failed with status code: {response.status_code}")
\ No newline at end of file
+""" Arrow batch of TrafficFlow measurements with a fixed schema """
+# Columns of the TrafficFlow object (schema version 1) under the names dlt gives them: Geometry.WGS84 is flattened
+# to geometry__wgs84 like dlt does for rows, lists (CountyNo) are list columns instead of a child table.
+# Fields the API leaves out are null columns, fields not in the schema are dropped, so the table schema is the
+# same for every batch. Timestamps are parsed per column to UTC
+TV_ARROW_FIELDS = (
+    ("average_vehicle_speed", "AverageVehicleSpeed", pa.float64()),
+    ("county_no", "CountyNo", pa.list_(pa.int64())),
+    ("deleted", "Deleted", pa.bool_()),
+    ("measurement_or_calculation_period", "MeasurementOrCalculationPeriod", pa.int64()),
+    ("measurement_side", "MeasurementSide", pa.string()),
+    ("measurement_time", "MeasurementTime", pa.timestamp("us", tz="UTC")),
+    ("modified_time", "ModifiedTime", pa.timestamp("us", tz="UTC")),
+    ("region_id", "RegionId", pa.int64()),
+    ("site_id", "SiteId", pa.int64()),
+    ("specific_lane", "SpecificLane", pa.string()),
+    ("vehicle_flow_rate", "VehicleFlowRate", pa.int64()),
+    ("vehicle_type", "VehicleType", pa.string()),
+    ("geometry__wgs84", "Geometry.WGS84", pa.string()),
+    ("geometry__sweref99tm", "Geometry.SWEREF99TM", pa.string()),
+)
+
+TV_ARROW_SCHEMA = pa.schema([(name, data_type) for name, _, data_type in TV_ARROW_FIELDS])
+
+def TV_arrow_batch(batch):
+
+    columns = {}
+    for name, field, data_type in TV_ARROW_FIELDS:
+        key, _, nested_key = field.partition(".")
+        if nested_key:
+            values = [(item.get(key) or {}).get(nested_key) for item in batch]
+        else:
+            values = [item.get(key) for item in batch]
+
+        if pa.types.is_timestamp(data_type):
+            columns[name] = pa.array(values, pa.string()).cast(data_type)
+        else:
+            columns[name] = pa.array(values, data_type)
+
+    return pa.Table.from_pydict(columns, schema=TV_ARROW_SCHEMA)
+
+""" Streamed fetch of TrafficFlow measurements """
+# The response body is decoded chunk by chunk and the objects of the TrafficFlow array are parsed one at a time,
+# so memory scales with the batch size and not with the size of the response.
+# info["last_change_id"] is set from RESULT INFO once the response has been read.
+# With metrics the time until the response headers (tv_http_*) and the bytes of the body are recorded
+def fetch_TV_batches(TV_api_client, change_id, info, metrics=None):
+
+    outside = []
+    batch = []
+
+    post_query = TV_api_client.post_query
+    if metrics is not None:
+        post_query = metrics.timed("tv_http", post_query)
+
+    with post_query(change_id) as response:
+        decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")()
+        text_chunks = (decoder.decode(chunk) for chunk in _count_bytes(response.iter_content(chunk_size=64 * 1024), metrics))
+
+        for item in _iter_json_array_items(text_chunks, "TrafficFlow", outside):
+            batch.append(item)
+            if len(batch) >= TV_api_client.batch_size:
+                yield batch
+                batch = []
+
+    if batch:
+        yield batch
+
+    match = _LAST_CHANGE_ID.search("".join(outside))
+    if match:
+        info["last_change_id"] = match.group(1)
+
+_LAST_CHANGE_ID = re.compile(r'"LASTCHANGEID"\s*:\s*"?(\d+)')
+
+def _count_bytes(chunks, metrics):
+
+    for chunk in chunks:
+        if metrics is not None:
+            metrics.count("response_bytes", len(chunk))
+        yield chunk
+
+# Yield the objects of every array named `key` from a stream of JSON text chunks.
+# Text outside the arrays (e.g. RESULT INFO) is collected in `outside`
+def _iter_json_array_items(text_chunks, key, outside):
+
+    decoder = json.JSONDecoder()
+    array_start = re.compile(r'"' + re.escape(key) + r'"\s*:\s*\[')
+    buffer = ""
+    in_array = False
+
+    for chunk in text_chunks:
+        buffer += chunk
+        pos = 0
+
+        while True:
+            if not in_array:
+                match = array_start.search(buffer, pos)
+                if match is None:
+                    # Keep a tail in case the key is split between chunks
+                    keep = max(pos, len(buffer) - len(key) - 16)
+                    outside.append(buffer[pos:keep])
+                    buffer = buffer[keep:]
+                    break
+                outside.append(buffer[pos:match.start()])
+                pos = match.end()
+                in_array = True
+
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+
+            if pos >= len(buffer):
+                buffer = ""
+                break
+
+            if buffer[pos] == "]":
+                in_array = False
+                pos += 1
+                continue
+
+            try:
+                item, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Object not complete yet, wait for the next chunk
+                buffer = buffer[pos:]
+                break
+
+            yield item
+
+    if in_array:
+        raise RuntimeError(f"Truncated response, {key} array was not closed")
+
+    outside.append(buffer)
@@ -0,0 +1,91 @@
+import dagster as dg
+import dlt
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+""" Ingestion settings of the raw data dlt pipelines """
+# Set per run in the config of GBGS_raw_data and TV_raw_data, e.g. in the launchpad:
+#   ops:
+#     TV_raw_data:
+#       config: {mode: arrow, normalize_workers: 4, file_max_items: 200000}
+# mode="arrow": every page or batch is converted to a pyarrow Table with a declared schema in the resource
+#   (GBGS_arrow_page and TV_arrow_batch in fetch_data.py), dlt writes it without normalizing rows and the table
+#   schema does not change when the API leaves fields out.
+# mode="rows": the resources yield lists of dicts, dlt infers the schema and normalizes them one row at a time
+#   (nested objects to __ columns, lists to child tables).
+# loader_file_format="parquet": normalize writes Parquet files, DuckDB loads each file in bulk. "insert_values"
+#   loads with INSERT statements (the dlt default for DuckDB).
+# normalize_workers > 1: normalize runs in a process pool with one job per extracted file, so set file_max_items
+#   to split a large extract into several files. Workers are started with normalize_start_method: "spawn" (the dlt
+#   default) starts fresh interpreters, which takes seconds per run; "fork" starts at once but copies the Dagster
+#   process. Only worth it in rows mode with several cores, arrow batches need almost no normalizing.
+# buffer_max_items: rows kept in memory per table before they are written to the current file
+#
+# The default mode is "rows", the layout existing raw tables were loaded with. A deployment opts in to arrow with
+# DLT_INGESTION_MODE=arrow (a new database, or once its tables are migrated as below). The two modes store the
+# TrafficFlow CountyNo list differently:
+# rows mode in the child table traffic_flow_data.tv_traffic_flow_data__county_no (value, _dlt_parent_id,
+# _dlt_list_idx), arrow mode in the county_no column (JSON list) of tv_traffic_flow_data. After switching a database
+# to arrow the child table gets no new rows and county_no is null for the rows loaded before. The dbt models read
+# neither; to move the old values over once:
+#   UPDATE traffic_flow_data.tv_traffic_flow_data AS t SET county_no = to_json(c.county_no)
+#   FROM (
+#       SELECT _dlt_parent_id, list(value ORDER BY _dlt_list_idx) AS county_no
+#       FROM traffic_flow_data.tv_traffic_flow_data__county_no GROUP BY _dlt_parent_id
+#   ) AS c
+#   WHERE c._dlt_parent_id = t._dlt_id AND t.county_no IS NULL
+INGESTION_MODES = ("rows", "arrow")
+LOADER_FILE_FORMATS = ("parquet", "insert_values", "jsonl")
+START_METHODS = ("spawn", "fork", "forkserver")
+
+INGESTION_CONFIG_SCHEMA = {
+    "mode": dg.Field(str, default_value=os.environ.get("DLT_INGESTION_MODE", "rows"), is_required=False),
+    "loader_file_format": dg.Field(str, default_value="parquet", is_required=False),
+    "normalize_workers": dg.Field(int, default_value=1, is_required=False),
+    "normalize_start_method": dg.Field(str, default_value="spawn", is_required=False),
+    "buffer_max_items": dg.Field(int, default_value=5000, is_required=False),
+    "file_max_items": dg.Field(dg.Noneable(int), default_value=None, is_required=False),
+}
+
+
+# Set the dlt configuration of the named pipeline from the asset config. The values are scoped to the pipeline
+# name, so the GBGS and TV pipelines can be tuned independently in the same process
+def configure_pipeline(pipeline_name, config):
+    if config["mode"] not in INGESTION_MODES:
+        raise ValueError(f"Unknown ingestion mode '{config['mode']}', expected one of {INGESTION_MODES}")
+    if config["loader_file_format"] not in LOADER_FILE_FORMATS:
+        raise ValueError(f"Unknown loader file format '{config['loader_file_format']}', expected one of {LOADER_FILE_FORMATS}")
+    if config["normalize_start_method"] not in START_METHODS:
+        raise ValueError(f"Unknown start method '{config['normalize_start_method']}', expected one of {START_METHODS}")
+
+    dlt.config[f"{pipeline_name}.normalize.workers"] = config["normalize_workers"]
+    dlt.config[f"{pipeline_name}.normalize.start_method"] = config["normalize_start_method"]
+    dlt.config[f"{pipeline_name}.data_writer.buffer_max_items"] = config["buffer_max_items"]
+    # None is no limit, one file per table
+    dlt.config[f"{pipeline_name}.data_writer.file_max_items"] = config["file_max_items"]
+    # Arrow rows get the _dlt_load_id (read by the incremental dbt models) and _dlt_id of normalized rows, the
+    # tables keep the same columns in both modes
+    dlt.config[f"{pipeline_name}.normalize.parquet_normalizer.add_dlt_load_id"] = True
+    dlt.config[f"{pipeline_name}.normalize.parquet_normalizer.add_dlt_id"] = True
+
+
+def log_ingestion_config(context, config):
+    context.log.info(
+        f"Ingestion mode {config['mode']}, {config['loader_file_format']} load files, "
+        f"{config['normalize_workers']} normalize workers, buffer {config['buffer_max_items']} rows, "
+        f"file limit {config['file_max_items'] or 'none'}"
+    )
+
+
+# Working folder of a dlt pipeline for one run, removed afterwards. Runs of the same pipeline in parallel (backfill
+# windows in partitioned mode) never pick up each other's extracted or normalized packages. The pipeline state and
+# schema are restored from the destination database at the start of the run
+@contextmanager
+def pipeline_working_dir(pipeline_name):
+    pipelines_dir = tempfile.mkdtemp(prefix=f"dlt_{pipeline_name}_")
+    try:
+        yield pipelines_dir
+    finally:
+        shutil.rmtree(pipelines_dir, ignore_errors=True)
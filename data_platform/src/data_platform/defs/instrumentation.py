@@ -0,0 +1,96 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+""" Run metrics for the pipeline assets """
+# RunMetrics collects the timings and counters of one asset run:
+#   stage(name)        times a block, <name>_seconds (summed if the stage runs several times)
+#   timed(name, func)  wraps a function, every call is an observation: <name>_count, <name>_mean_ms, <name>_max_ms
+#   count(name, n)     adds to a counter, set(name, value) records a gauge (e.g. a file size)
+# It is safe to use from the prefetch and upload threads. emit() logs all values as one JSON line and returns them
+# as metadata for the materialization, so each value is plotted per run in the Dagster UI (asset > Plots)
+
+
+class RunMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.observations = {}
+        self.values = {}
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def timed(self, name, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.observe(name, time.perf_counter() - started)
+        return wrapper
+
+    def observe(self, name, seconds):
+        with self._lock:
+            count, total, maximum = self.observations.get(name, (0, 0.0, 0.0))
+            self.observations[name] = (count + 1, total + seconds, max(maximum, seconds))
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.values[name] = self.values.get(name, 0) + value
+
+    def set(self, name, value):
+        with self._lock:
+            self.values[name] = value
+
+    def get(self, name, default=0):
+        return self.values.get(name, default)
+
+    def metadata(self):
+        with self._lock:
+            metadata = {f"{name}_seconds": round(seconds, 3) for name, seconds in self.stages.items()}
+            for name, (count, total, maximum) in self.observations.items():
+                metadata[f"{name}_count"] = count
+                metadata[f"{name}_mean_ms"] = round(total / count * 1000, 1)
+                metadata[f"{name}_max_ms"] = round(maximum * 1000, 1)
+            metadata.update(self.values)
+        return metadata
+
+    # Log the metrics as one structured line and return them as metadata
+    def emit(self, context):
+        metadata = self.metadata()
+        context.log.info(f"Run metrics {json.dumps(metadata, sort_keys=True)}")
+        return metadata
+
+
+# Timings of the extract, normalize and load steps of the last dlt run and the rows of `table` in each step
+def record_dlt_trace(metrics, pipeline, table):
+    trace = pipeline.last_trace
+    for step in trace.steps:
+        if step.step in ("extract", "normalize", "load") and step.finished_at is not None:
+            metrics.add_time(f"dlt_{step.step}", (step.finished_at - step.started_at).total_seconds())
+
+    extracted = 0
+    if trace.last_extract_info is not None:
+        for load_metrics in trace.last_extract_info.metrics.values():
+            for step_metrics in load_metrics:
+                table_metrics = step_metrics["table_metrics"].get(table)
+                extracted += table_metrics.items_count if table_metrics else 0
+    metrics.set("extracted_rows", extracted)
+
+    normalized = trace.last_normalize_info.row_counts.get(table, 0) if trace.last_normalize_info else 0
+    metrics.set("normalized_rows", normalized)
+    # Every normalized row is in the load packages committed by the load step
+    metrics.set("loaded_rows", normalized if trace.last_load_info is not None else 0)
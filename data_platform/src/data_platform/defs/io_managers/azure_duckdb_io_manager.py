@@ -1,71 +1,769 @@
 import duckdb
+import json
+import os
+import shutil
 import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 import dagster as dg
 from dagster import IOManager
 from adlfs import AzureBlobFileSystem
 from filelock import FileLock
 
+from ..instrumentation import RunMetrics
+
 """ IO Manager for duckdb in Azure blob storage """
 
+# sync_mode="full":  download the whole database in load_input and upload the whole database in handle_output
+# sync_mode="delta": keep a persistent local copy validated against the blob ETag and only push the rows of
+#                    new dlt loads as Parquet segments next to the database blob. Segments are compacted into
+#                    a new full snapshot every `compact_every` segments (or when the dlt schema changes)
+# sync_mode="partitioned": every asset (and every backfill window of past days) keeps its own local staging
+#                    database and lock, and pushes the rows of new dlt loads as Parquet partitions per
+#                    dataset/table/load_date. The blob at database_path becomes a small DuckDB catalog with views
+#                    over the partitions, so GBGS and TV runs never write the same file and can run in parallel.
+#                    Rows are deleted from the staging database once they are pushed, only the dlt state tables
+#                    are kept there. load_date is the date of the dlt load (from _dlt_load_id), not the date of
+#                    the measurements: a backfill of old days lands in the partition of the day it was loaded.
+#                    Filter on the data columns (date, measurement_time) to select measurement days
+# In full and delta mode all assets write the same database, so their runs take turns on one lock per database_path
+SYNC_MODES = ("full", "delta", "partitioned")
+
+# Database transfers are streamed in blocks of `block_size` bytes with at most `max_concurrency` blocks in flight,
+# so peak memory stays around block_size * max_concurrency regardless of the database size
+DEFAULT_BLOCK_SIZE = 8 * 1024 * 1024
+DEFAULT_MAX_CONCURRENCY = 4
+
+# Version of the catalog views in partitioned mode, the catalog is rebuilt when the pushed version differs
+CATALOG_VERSION = 2
+
+# Blob transfers are recorded in a RunMetrics: blob_download/blob_upload seconds and bytes, plus the time spent
+# in load_input/handle_output and the size of the local database. load_input records into the metrics passed by
+# the asset, handle_output adds its own metrics to the output metadata
+
+
 class AzureDuckDBIOManager(IOManager):
-    def __init__(self, account_name, account_key, container, database_path):
+    def __init__(self, account_name, account_key, container, database_path,
+                 sync_mode="full", local_cache_dir="/opt/dagster/app/data/duckdb_cache", compact_every=96,
+                 block_size=DEFAULT_BLOCK_SIZE, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        if sync_mode not in SYNC_MODES:
+            raise ValueError(f"Unknown sync_mode '{sync_mode}', expected one of {SYNC_MODES}")
+
         self.account_name = account_name
         self.account_key = account_key
         self.container = container
         self.database_path = database_path
+        self.sync_mode = sync_mode
+        self.local_cache_dir = local_cache_dir
+        self.compact_every = compact_every
+        self.block_size = block_size
+        self.max_concurrency = max_concurrency
+        # Locks held between load_input and handle_output, by local database path
+        self._held_locks = {}
 
     def _get_fs(self):
-        return AzureBlobFileSystem(account_name=self.account_name, account_key=self.account_key)
+        return AzureBlobFileSystem(
+            account_name=self.account_name,
+            account_key=self.account_key,
+            blocksize=self.block_size,
+            max_concurrency=self.max_concurrency,
+        )
 
     def _get_remote_path(self):
         return f"{self.container}/{self.database_path}"
 
-    def _get_local_path(self):
+    # In partitioned mode every asset (scope) has its own local staging database
+    def _get_local_path(self, scope=None):
+        if self.sync_mode == "partitioned":
+            os.makedirs(self.local_cache_dir, exist_ok=True)
+            return os.path.join(self.local_cache_dir, f"{scope}.duckdb")
+        if self.sync_mode == "delta":
+            os.makedirs(self.local_cache_dir, exist_ok=True)
+            return os.path.join(self.local_cache_dir, self.database_path.replace("/", "_"))
         return tempfile.mktemp(suffix=".duckdb")
 
+    # Backfill windows of past partitions stage in their own database (<asset>_<first>_<last>), removed after the
+    # push, so the windows of one asset run in parallel. Runs that include the last partition use the staging
+    # database of the asset, which keeps its dlt state between runs
+    def _get_scope(self, context):
+        if self.sync_mode != "partitioned":
+            return None
+
+        scope = context.asset_key.path[-1]
+        key_range, partitions_def = _partition_range(context)
+        if key_range is not None and key_range.end != partitions_def.get_last_partition_key():
+            scope = f"{scope}_{key_range.start}_{key_range.end}"
+        return scope
+
+    # Segments pushed in delta mode, one folder per run: <database_path>.segments/<segment_id>/
+    def _get_segments_path(self):
+        return f"{self._get_remote_path()}.segments"
+
+    # Partitions pushed in partitioned mode: <database_path>.partitions/<dataset>/<table>/load_date=<date>/,
+    # keyed by the date of the dlt load
+    def _get_partitions_path(self):
+        return f"{self._get_remote_path()}.partitions"
+
+    # Sidecar file describing which remote snapshot (ETag), segments and loads the local copy contains
+    def _get_state_path(self, scope=None):
+        return f"{self._get_local_path(scope)}.state.json"
+
+    def _read_state(self, scope=None):
+        state_path = self._get_state_path(scope)
+        if os.path.exists(state_path) and os.path.exists(self._get_local_path(scope)):
+            with open(state_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return None
+
+    def _write_state(self, state, scope=None):
+        with open(self._get_state_path(scope), "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+
     # Function to manage paralell runs
-    # Creates a unique lock-file for tmp db uses filelock.FileLock to handle just one process at the time 
-    def _acquire_lock(self):
-        lock_file = f"/tmp/{self.database_path.replace('/', '_')}.lock"
-        return FileLock(lock_file)
+    # Creates a unique lock-file for tmp db uses filelock.FileLock to handle just one process at the time
+    # In partitioned mode each scope (asset, or the shared catalog) gets its own lock.
+    # One lock object per path in the process (is_singleton), acquired in load_input and released in handle_output
+    def _acquire_lock(self, scope=None):
+        lock_name = self.database_path.replace('/', '_')
+        if scope is not None:
+            lock_name = f"{lock_name}_{scope}"
+        return FileLock(f"/tmp/{lock_name}.lock", thread_local=False, is_singleton=True)
 
-    def load_input(self, context):
+    # The lock is held from load_input until handle_output has pushed the changes, so two runs never work on the
+    # same database (or staging database) at the same time. If the asset fails in between, the lock is released
+    # when the step process exits
+    def load_input(self, context, metrics=None):
+        metrics = metrics if metrics is not None else RunMetrics()
+        started = time.perf_counter()
         fs = self._get_fs()
         remote_path = self._get_remote_path()
-        local_path = self._get_local_path()
+        scope = self._get_scope(context)
+        local_path = self._get_local_path(scope)
 
-        with self._acquire_lock():
-            if fs.exists(remote_path):
-                with fs.open(remote_path, "rb") as remote_file, open(local_path, "wb") as local_file:
-                    local_file.write(remote_file.read())
+        lock = self._acquire_lock(scope)
+        lock.acquire()
+        try:
+            if self.sync_mode == "partitioned":
+                # The staging database is local only, the partitions in blob storage are the source of truth
+                if self._read_state(scope) is None:
+                    conn = duckdb.connect(local_path)
+                    self._write_state({"loads": sorted(_load_ids(conn))}, scope)
+                    conn.close()
+                remote_path = local_path
+            elif self.sync_mode == "delta":
+                self._sync_local_copy(context, fs, remote_path, local_path, metrics)
+            elif fs.exists(remote_path):
+                self._download(context, fs, remote_path, local_path, metrics)
             else:
                 # Create empty file if db not exist in Azure blob storage
                 conn = duckdb.connect(local_path)
                 conn.close()
 
-        conn = duckdb.connect(local_path)
+            conn = duckdb.connect(local_path)
+        except BaseException:
+            lock.release()
+            raise
+
+        self._held_locks[local_path] = (lock, scope)
+        metrics.add_time("duckdb_load_input", time.perf_counter() - started)
+        metrics.set("duckdb_input_size_bytes", os.path.getsize(local_path))
         context.log.info(f"Loaded DuckDB from {remote_path}")
         # Return connection och tmp path for asset
         return conn, local_path
 
     def handle_output(self, context, obj):
+        # The asset had nothing to load and never opened the database
+        if obj is None:
+            context.log.info("Nothing loaded, database unchanged")
+            return
+
         conn, local_path = obj
-        conn.close()
 
+        metrics = RunMetrics()
         fs = self._get_fs()
         remote_path = self._get_remote_path()
 
-        with self._acquire_lock():
-            with open(local_path, "rb") as local_file, fs.open(remote_path, "wb") as remote_file:
-                remote_file.write(local_file.read())
+        # Lock and scope taken by load_input for this database, or taken here if the connection was opened elsewhere
+        if local_path in self._held_locks:
+            lock, scope = self._held_locks.pop(local_path)
+        else:
+            scope = self._get_scope(context)
+            lock = self._acquire_lock(scope)
+            lock.acquire()
+
+        try:
+            with metrics.stage("duckdb_handle_output"):
+                if self.sync_mode == "partitioned":
+                    self._push_partitions(context, fs, conn, scope, metrics)
+                    conn.close()
+                elif self.sync_mode == "delta":
+                    self._push_delta(context, fs, conn, remote_path, local_path, metrics)
+                    conn.close()
+                else:
+                    conn.close()
+                    self._upload(context, fs, local_path, remote_path, metrics)
+                    context.log.info(f"Uploaded DuckDB to {remote_path}")
+            metrics.set("duckdb_size_bytes", os.path.getsize(local_path))
+            # Staging database of a backfill window, everything in it is pushed
+            if scope is not None and scope != context.asset_key.path[-1]:
+                os.remove(local_path)
+                os.remove(self._get_state_path(scope))
+        finally:
+            lock.release()
+
+        context.add_output_metadata(metrics.emit(context))
+
+    # Download the blob as ranged reads of block_size bytes, max_concurrency ranges in flight at a time.
+    # Blocks are written to the local file in order as soon as their window completes
+    def _download(self, context, fs, remote_path, local_path, metrics):
+        size = fs.size(remote_path)
+        progress = _TransferProgress(context, "Downloaded", remote_path, size, metrics, "blob_download")
+
+        def read_block(start):
+            return fs.cat_file(remote_path, start=start, end=min(start + self.block_size, size))
+
+        offsets = list(range(0, size, self.block_size))
+        with open(local_path, "wb") as local_file, ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            for i in range(0, len(offsets), self.max_concurrency):
+                for block in pool.map(read_block, offsets[i:i + self.max_concurrency]):
+                    local_file.write(block)
+                    progress.update(len(block))
+
+        progress.done()
+
+    # Upload the local file in windows of block_size * max_concurrency bytes.
+    # On Azure each flushed window is staged as max_concurrency blocks in parallel and committed on close
+    def _upload(self, context, fs, local_path, remote_path, metrics):
+        size = os.path.getsize(local_path)
+        progress = _TransferProgress(context, "Uploaded", remote_path, size, metrics, "blob_upload")
+        window = self.block_size * self.max_concurrency
+
+        with open(local_path, "rb") as local_file, fs.open(remote_path, "wb", block_size=self.block_size) as remote_file:
+            while True:
+                chunk = local_file.read(window)
+                if not chunk:
+                    break
+                remote_file.write(chunk)
+                progress.update(len(chunk))
+
+        progress.done()
+
+    """ Delta mode """
+
+    # Make sure the persistent local copy matches the remote snapshot and all pushed segments
+    def _sync_local_copy(self, context, fs, remote_path, local_path, metrics):
+        state = self._read_state()
+
+        if fs.exists(remote_path):
+            etag = _blob_version(fs.info(remote_path))
+            if state is None or state["etag"] != etag:
+                context.log.info(f"Local copy of {remote_path} is stale, downloading snapshot")
+                self._download(context, fs, remote_path, local_path, metrics)
+                state = {"etag": etag, "segments": []}
+            else:
+                context.log.info(f"Local copy of {remote_path} matches ETag {etag}, skipping download")
+        elif state is None:
+            # Create empty file if db not exist in Azure blob storage
+            conn = duckdb.connect(local_path)
+            conn.close()
+            state = {"etag": None, "segments": []}
+
+        # Replay segments pushed after the snapshot that the local copy has not seen yet
+        segments_path = self._get_segments_path()
+        remote_segments = sorted(fs.ls(segments_path, detail=False)) if fs.exists(segments_path) else []
+        missing = [s for s in remote_segments if s.rsplit("/", 1)[-1] not in state["segments"]]
+
+        if missing:
+            conn = duckdb.connect(local_path)
+            try:
+                for segment in missing:
+                    manifest = _apply_segment(conn, fs, segment, metrics)
+                    state["segments"].append(segment.rsplit("/", 1)[-1])
+                    if "loads" in state:
+                        state["loads"] = sorted(set(state["loads"]) | set(manifest["loads"]))
+            finally:
+                conn.close()
+            context.log.info(f"Applied {len(missing)} segment(s) from {segments_path}")
+
+        if "loads" not in state:
+            conn = duckdb.connect(local_path)
+            state["loads"] = sorted(_load_ids(conn))
+            state["schema_versions"] = _schema_version_count(conn)
+            conn.close()
+
+        self._write_state(state)
+
+    # Push the rows of all dlt loads that are not in the remote copy yet
+    def _push_delta(self, context, fs, conn, remote_path, local_path, metrics):
+        state = self._read_state() or {"etag": None, "segments": [], "loads": [], "schema_versions": 0}
+        new_loads = sorted(_load_ids(conn) - set(state["loads"]))
+        schema_versions = _schema_version_count(conn)
+
+        if not new_loads:
+            context.log.info(f"No new loads, nothing to upload to {remote_path}")
+            return
+
+        compact = (
+            state["etag"] is None
+            or schema_versions != state["schema_versions"]
+            or len(state["segments"]) + 1 >= self.compact_every
+        )
+
+        if compact:
+            # Full snapshot, replaces the base blob and drops all segments
+            conn.execute("CHECKPOINT")
+            self._upload(context, fs, local_path, remote_path, metrics)
+            segments_path = self._get_segments_path()
+            if fs.exists(segments_path):
+                fs.rm(segments_path, recursive=True)
+
+            state = {
+                "etag": _blob_version(fs.info(remote_path)),
+                "segments": [],
+                "loads": sorted(_load_ids(conn)),
+                "schema_versions": schema_versions,
+            }
+            self._write_state(state)
+            context.log.info(f"Compacted and uploaded DuckDB snapshot to {remote_path}")
+            return
+
+        segment_id = f"{time.time_ns():020d}"
+        remote_segment = f"{self._get_segments_path()}/{segment_id}"
+        tmp_dir = tempfile.mkdtemp(prefix="duckdb_segment_")
+        try:
+            manifest = _export_loads(conn, tmp_dir, new_loads)
+            with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=2)
+
+            for file_name in os.listdir(tmp_dir):
+                _put_file(fs, os.path.join(tmp_dir, file_name), f"{remote_segment}/{file_name}", metrics)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        state["segments"].append(segment_id)
+        state["loads"] = sorted(set(state["loads"]) | set(new_loads))
+        self._write_state(state)
+
+        rows = sum(table["rows"] for table in manifest["tables"])
+        context.log.info(f"Uploaded segment {segment_id} ({rows} rows from {len(new_loads)} load(s)) to {remote_segment}")
+
+
+    """ Partitioned mode """
+
+    # Push the rows of new dlt loads of this asset as Parquet partitions and refresh the catalog if needed
+    def _push_partitions(self, context, fs, conn, scope, metrics):
+        state = self._read_state(scope) or {"loads": []}
+        new_loads = sorted(_load_ids(conn) - set(state["loads"]))
+
+        if not new_loads:
+            context.log.info(f"No new loads for {scope}, nothing to upload")
+            return
+
+        partitions_path = self._get_partitions_path()
+        tmp_dir = tempfile.mkdtemp(prefix="duckdb_partitions_")
+        new_tables = False
+        try:
+            tables = _export_partitions(conn, tmp_dir, new_loads)
+            for table in tables:
+                table_path = f"{partitions_path}/{table['schema']}/{table['table']}"
+                table_json = f"{table_path}/_table.json"
+                if not fs.exists(table_json):
+                    new_tables = True
+
+                local_table_dir = os.path.join(tmp_dir, table["schema"], table["table"])
+                for root, _, files in os.walk(local_table_dir):
+                    for file_name in files:
+                        local_file = os.path.join(root, file_name)
+                        relative = os.path.relpath(local_file, local_table_dir).replace(os.sep, "/")
+                        _put_file(fs, local_file, f"{table_path}/{relative}", metrics)
+
+                with fs.open(table_json, "w") as f:
+                    json.dump({"primary_key": table["primary_key"]}, f)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        state["loads"] = sorted(set(state["loads"]) | set(new_loads))
+        self._write_state(state, scope)
+
+        rows = sum(table["rows"] for table in tables)
+        context.log.info(f"Uploaded {rows} rows from {len(new_loads)} load(s) of {scope} to {partitions_path}")
+
+        # The pushed rows live in the partitions now, the staging database keeps only the dlt state
+        pruned = _prune_loads(conn, new_loads)
+        context.log.info(f"Pruned {pruned} pushed rows from the staging database of {scope}")
+
+        if new_tables or not fs.exists(self._get_remote_path()) or self._catalog_version(fs) != CATALOG_VERSION:
+            with self._acquire_lock("catalog"):
+                self._write_catalog(context, fs, metrics)
+
+    # Version of the views in the pushed catalog, None for catalogs written before it was recorded
+    def _catalog_version(self, fs):
+        catalog_json = f"{self._get_partitions_path()}/_catalog.json"
+        if not fs.exists(catalog_json):
+            return None
+        with fs.open(catalog_json, "r") as f:
+            return json.load(f).get("version")
+
+    # Rebuild the catalog database with one view per partitioned table. Root tables are deduplicated on the dlt
+    # primary key. Nested (child) tables have no primary key, their view keeps the rows of the root rows left by
+    # that dedup (same _dlt_root_id and _dlt_load_id), so re-exported child rows are not read twice.
+    # DuckDB binds a view when it is created, so the partitions in the container must be readable from here
+    def _write_catalog(self, context, fs, metrics):
+        partitions_path = self._get_partitions_path()
+        local_path = tempfile.mktemp(suffix=".duckdb")
+        conn = duckdb.connect(local_path)
+        try:
+            if isinstance(fs, AzureBlobFileSystem):
+                configure_azure_access(conn, self.account_name, self.account_key)
+            tables = {}
+            for table_json in fs.glob(f"{partitions_path}/*/*/_table.json"):
+                table_path = table_json.rsplit("/", 1)[0]
+                schema, table = table_path.split("/")[-2:]
+                with fs.open(table_json, "r") as f:
+                    tables[(schema, table)] = (table_path, json.load(f)["primary_key"])
+
+            # Root views first, child views select from them
+            for schema, table in sorted(tables, key=lambda key: (key[0], key[1].count("__"), key[1])):
+                table_path, primary_key = tables[(schema, table)]
+                root_table = table.split("__", 1)[0]
+
+                url = f"az://{table_path}" if isinstance(fs, AzureBlobFileSystem) else table_path
+                source = f"read_parquet('{url}/*/*.parquet', hive_partitioning = true, union_by_name = true)"
+                if primary_key:
+                    keys = ", ".join(f'"{key}"' for key in primary_key)
+                    query = f"""
+                        SELECT * EXCLUDE (load_date)
+                        FROM {source}
+                        QUALIFY row_number() OVER (PARTITION BY {keys} ORDER BY _dlt_load_id DESC) = 1
+                    """
+                elif root_table != table and (schema, root_table) in tables:
+                    query = f"""
+                        SELECT c.* EXCLUDE (load_date)
+                        FROM {source} AS c
+                        SEMI JOIN "{schema}"."{root_table}" AS r
+                            ON c._dlt_root_id = r._dlt_id AND c._dlt_load_id = r._dlt_load_id
+                        QUALIFY row_number() OVER (PARTITION BY c._dlt_id ORDER BY c._dlt_load_id DESC) = 1
+                    """
+                else:
+                    query = f"SELECT * EXCLUDE (load_date) FROM {source}"
+
+                conn.execute(f'CREATE SCHEMA IF NOT EXISTS "{schema}"')
+                conn.execute(f'CREATE OR REPLACE VIEW "{schema}"."{table}" AS {query}')
+        finally:
+            conn.close()
+
+        self._upload(context, fs, local_path, self._get_remote_path(), metrics)
+        os.remove(local_path)
+        with fs.open(f"{partitions_path}/_catalog.json", "w") as f:
+            json.dump({"version": CATALOG_VERSION}, f)
+        context.log.info(f"Updated DuckDB catalog {self._get_remote_path()}")
+
+
+# Partition key range and partitions definition of the run, from the asset context (load_input is called by the
+# asset) or the output context (handle_output). A single partition is a range of one key, so both give the same
+# scope. None for unpartitioned runs
+def _partition_range(context):
+    if isinstance(context, dg.OutputContext):
+        if context.has_asset_partitions:
+            return context.asset_partition_key_range, context.asset_partitions_def
+    elif context.has_partition_key or context.has_partition_key_range:
+        return context.partition_key_range, context.assets_def.partitions_def
+    return None, None
+
+
+""" Reading the catalog """
+
+# The catalog views read the partitions from az:// URLs through DuckDB's azure extension, so every reader of the
+# catalog (dbt, notebooks) needs the extension and a secret for the storage account in its session:
+#   conn = duckdb.connect()
+#   configure_azure_access(conn, account_name, account_key)
+#   conn.execute("ATTACH 'az://<container>/<database_path>' AS raw (READ_ONLY)")
+# dbt does the same in the "partitioned" target of transformations/profiles.yml (DBT_TARGET=partitioned)
+def configure_azure_access(conn, account_name, account_key):
+    connection_string = (
+        f"DefaultEndpointsProtocol=https;AccountName={account_name};AccountKey={account_key};"
+        "EndpointSuffix=core.windows.net"
+    )
+    conn.execute("INSTALL azure")
+    conn.execute("LOAD azure")
+    conn.execute(f"""
+        CREATE OR REPLACE SECRET azure_storage (
+            TYPE azure,
+            CONNECTION_STRING '{connection_string.replace("'", "''")}'
+        )
+    """)
+
+
+""" Transfer progress """
+
+# Logs progress every `log_every` fraction of the transfer and the throughput when done.
+# The transferred bytes and time are added to `metric` (e.g. blob_download) of metrics
+class _TransferProgress:
+    def __init__(self, context, action, path, total_bytes, metrics=None, metric=None, log_every=0.1):
+        self.context = context
+        self.action = action
+        self.path = path
+        self.total_bytes = total_bytes
+        self.metrics = metrics
+        self.metric = metric
+        self.log_every = log_every
+        self.transferred = 0
+        self.next_log = log_every
+        self.started = time.monotonic()
+
+    def update(self, n_bytes):
+        self.transferred += n_bytes
+        if self.total_bytes and self.transferred / self.total_bytes >= self.next_log and self.transferred < self.total_bytes:
+            elapsed = max(time.monotonic() - self.started, 1e-9)
+            self.context.log.info(
+                f"{self.action} {_mib(self.transferred):.1f}/{_mib(self.total_bytes):.1f} MiB "
+                f"({self.transferred / self.total_bytes:.0%}, {_mib(self.transferred) / elapsed:.1f} MiB/s) {self.path}"
+            )
+            while self.next_log <= self.transferred / self.total_bytes:
+                self.next_log += self.log_every
+
+    def done(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        if self.metrics is not None:
+            self.metrics.add_time(self.metric, elapsed)
+            self.metrics.count(f"{self.metric}_bytes", self.transferred)
+        self.context.log.info(
+            f"{self.action} {_mib(self.transferred):.1f} MiB in {elapsed:.2f}s "
+            f"({_mib(self.transferred) / elapsed:.1f} MiB/s) {self.path}"
+        )
+
+def _mib(n_bytes):
+    return n_bytes / (1024 * 1024)
+
+# Single file transfers of segments and partitions, recorded like the streamed transfers
+def _put_file(fs, local_file, remote_file, metrics):
+    with metrics.stage("blob_upload"):
+        fs.put_file(local_file, remote_file)
+    metrics.count("blob_upload_bytes", os.path.getsize(local_file))
+
+def _get_file(fs, remote_file, local_file, metrics):
+    with metrics.stage("blob_download"):
+        fs.get_file(remote_file, local_file)
+    metrics.count("blob_download_bytes", os.path.getsize(local_file))
+
+
+""" Helpers for delta segments """
+
+def _blob_version(info):
+    # ETag on Azure blob storage, falls back to last modified for other filesystems
+    return str(info.get("etag") or info.get("last_modified") or info.get("mtime"))
+
+def _dataset_schemas(conn):
+    rows = conn.execute("""
+        SELECT DISTINCT table_schema FROM information_schema.tables
+        WHERE table_name = '_dlt_loads'
+    """).fetchall()
+    return [row[0] for row in rows]
+
+def _load_ids(conn):
+    load_ids = set()
+    for schema in _dataset_schemas(conn):
+        rows = conn.execute(f'SELECT load_id FROM "{schema}"._dlt_loads').fetchall()
+        load_ids.update(row[0] for row in rows)
+    return load_ids
+
+def _schema_version_count(conn):
+    count = 0
+    for schema in _dataset_schemas(conn):
+        count += conn.execute(f'SELECT count(*) FROM "{schema}"._dlt_version').fetchone()[0]
+    return count
+
+# Primary keys per table, read from the latest dlt schema stored in the dataset
+def _primary_keys(conn, schema):
+    row = conn.execute(f'SELECT schema FROM "{schema}"._dlt_version ORDER BY inserted_at DESC LIMIT 1').fetchone()
+    if row is None:
+        return {}
+    tables = json.loads(row[0]).get("tables", {})
+    return {
+        table_name: [name for name, column in table.get("columns", {}).items() if column.get("primary_key")]
+        for table_name, table in tables.items()
+    }
+
+# Write the rows of the given loads to one Parquet file per table and return the segment manifest
+def _export_loads(conn, target_dir, load_ids):
+    load_id_list = ", ".join(f"'{load_id}'" for load_id in load_ids)
+    manifest = {"loads": list(load_ids), "tables": []}
+
+    for schema in _dataset_schemas(conn):
+        primary_keys = _primary_keys(conn, schema)
+        primary_keys["_dlt_loads"] = ["load_id"]
+
+        tables = conn.execute("""
+            SELECT table_name,
+                   bool_or(column_name = '_dlt_load_id') AS has_load_id
+            FROM information_schema.columns
+            WHERE table_schema = ?
+            GROUP BY table_name
+        """, [schema]).fetchall()
+
+        for table_name, has_load_id in tables:
+            if table_name == "_dlt_loads":
+                where = f"load_id IN ({load_id_list})"
+            elif has_load_id:
+                where = f"_dlt_load_id IN ({load_id_list})"
+            else:
+                continue
+
+            rows = conn.execute(f'SELECT count(*) FROM "{schema}"."{table_name}" WHERE {where}').fetchone()[0]
+            if rows == 0:
+                continue
+
+            file_name = f"{schema}.{table_name}.parquet"
+            conn.execute(f"""
+                COPY (SELECT * FROM "{schema}"."{table_name}" WHERE {where})
+                TO '{os.path.join(target_dir, file_name)}' (FORMAT PARQUET)
+            """)
+            manifest["tables"].append({
+                "schema": schema,
+                "table": table_name,
+                "file": file_name,
+                "primary_key": primary_keys.get(table_name, []),
+                "rows": rows,
+            })
+
+    return manifest
+
+# Write the rows of the given loads of all data tables as Hive partitions <schema>/<table>/load_date=<date>/.
+# load_date is the date of the dlt load, so rows of a backfill are written to the partition of the day they were
+# loaded, not of the day they were measured.
+# Nested (child) tables have no _dlt_load_id, their rows get the load id of their root row
+def _export_partitions(conn, target_dir, load_ids):
+    load_id_list = ", ".join(f"'{load_id}'" for load_id in load_ids)
+    tables = []
+
+    for schema in _dataset_schemas(conn):
+        primary_keys = _primary_keys(conn, schema)
+        table_columns = conn.execute("""
+            SELECT table_name,
+                   bool_or(column_name = '_dlt_load_id') AS has_load_id,
+                   bool_or(column_name = '_dlt_root_id') AS has_root_id
+            FROM information_schema.columns
+            WHERE table_schema = ? AND NOT starts_with(table_name, '_dlt')
+            GROUP BY table_name
+        """, [schema]).fetchall()
+        table_names = {table_name for table_name, _, _ in table_columns}
+
+        for table_name, has_load_id, has_root_id in table_columns:
+            root_table = table_name.split("__", 1)[0]
+            if has_load_id:
+                source = f'SELECT * FROM "{schema}"."{table_name}" WHERE _dlt_load_id IN ({load_id_list})'
+            elif has_root_id and root_table in table_names:
+                source = f"""
+                    SELECT c.*, r._dlt_load_id
+                    FROM "{schema}"."{table_name}" AS c
+                    JOIN "{schema}"."{root_table}" AS r ON c._dlt_root_id = r._dlt_id
+                    WHERE r._dlt_load_id IN ({load_id_list})
+                """
+            else:
+                continue
+
+            rows = conn.execute(f"SELECT count(*) FROM ({source})").fetchone()[0]
+            if rows == 0:
+                continue
+
+            table_dir = os.path.join(target_dir, schema, table_name)
+            os.makedirs(table_dir, exist_ok=True)
+            conn.execute(f"""
+                COPY (
+                    SELECT *, CAST(to_timestamp(CAST(_dlt_load_id AS DOUBLE)) AS DATE) AS load_date
+                    FROM ({source})
+                )
+                TO '{table_dir}' (FORMAT PARQUET, PARTITION_BY (load_date), FILENAME_PATTERN 'part_{{uuid}}')
+            """)
+            tables.append({
+                "schema": schema,
+                "table": table_name,
+                "primary_key": primary_keys.get(table_name, []),
+                "rows": rows,
+            })
+
+    return tables
+
+# Delete the rows of the given loads from all data tables, and the rows of their nested (child) tables, keeping
+# the dlt tables with the load history and pipeline state. Returns the number of deleted rows
+def _prune_loads(conn, load_ids):
+    load_id_list = ", ".join(f"'{load_id}'" for load_id in load_ids)
+    pruned = 0
+
+    for schema in _dataset_schemas(conn):
+        tables = conn.execute("""
+            SELECT table_name,
+                   bool_or(column_name = '_dlt_load_id') AS has_load_id,
+                   bool_or(column_name = '_dlt_root_id') AS has_root_id
+            FROM information_schema.columns
+            WHERE table_schema = ? AND NOT starts_with(table_name, '_dlt')
+            GROUP BY table_name
+        """, [schema]).fetchall()
+        table_names = {table_name for table_name, _, _ in tables}
+
+        # Root tables first, the child tables are then pruned by the missing root rows
+        for table_name, has_load_id, _ in tables:
+            if has_load_id:
+                pruned += conn.execute(
+                    f'DELETE FROM "{schema}"."{table_name}" WHERE _dlt_load_id IN ({load_id_list})'
+                ).fetchone()[0]
+
+        for table_name, has_load_id, has_root_id in tables:
+            # dlt names nested tables <root table>__<field>
+            root_table = table_name.split("__", 1)[0]
+            if has_load_id or not has_root_id or root_table not in table_names:
+                continue
+            pruned += conn.execute(f"""
+                DELETE FROM "{schema}"."{table_name}"
+                WHERE _dlt_root_id NOT IN (SELECT _dlt_id FROM "{schema}"."{root_table}")
+            """).fetchone()[0]
+
+        # Merge loads go through <dataset>_staging, a scratch copy of the last load that dlt refills on every merge
+        staging_tables = conn.execute("""
+            SELECT table_name FROM information_schema.tables
+            WHERE table_schema = ? AND NOT starts_with(table_name, '_dlt')
+        """, [f"{schema}_staging"]).fetchall()
+        for (table_name,) in staging_tables:
+            conn.execute(f'DELETE FROM "{schema}_staging"."{table_name}"')
+
+    conn.execute("CHECKPOINT")
+    return pruned
+
+# Upsert the rows of a remote segment into the local database
+def _apply_segment(conn, fs, remote_segment, metrics):
+    tmp_dir = tempfile.mkdtemp(prefix="duckdb_segment_")
+    try:
+        _get_file(fs, f"{remote_segment}/manifest.json", os.path.join(tmp_dir, "manifest.json"), metrics)
+        with open(os.path.join(tmp_dir, "manifest.json"), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        for table in manifest["tables"]:
+            local_file = os.path.join(tmp_dir, table["file"])
+            _get_file(fs, f"{remote_segment}/{table['file']}", local_file, metrics)
+            target = f'"{table["schema"]}"."{table["table"]}"'
+            source = f"read_parquet('{local_file}')"
+
+            conn.execute(f'CREATE SCHEMA IF NOT EXISTS "{table["schema"]}"')
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {target} AS SELECT * FROM {source} LIMIT 0")
+            if table["primary_key"]:
+                condition = " AND ".join(f'{target}."{key}" = s."{key}"' for key in table["primary_key"])
+                conn.execute(f"DELETE FROM {target} USING {source} AS s WHERE {condition}")
+            conn.execute(f"INSERT INTO {target} BY NAME SELECT * FROM {source}")
+        return manifest
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
 
-        context.log.info(f"Uploaded DuckDB to {remote_path}")
 
 @dg.io_manager(config_schema={
     "account_name": str,
     "account_key": str,
     "container": str,
     "database_path": str,
+    "sync_mode": dg.Field(str, default_value="full", is_required=False),
+    "local_cache_dir": dg.Field(str, default_value="/opt/dagster/app/data/duckdb_cache", is_required=False),
+    "compact_every": dg.Field(int, default_value=96, is_required=False),
+    "block_size": dg.Field(int, default_value=DEFAULT_BLOCK_SIZE, is_required=False),
+    "max_concurrency": dg.Field(int, default_value=DEFAULT_MAX_CONCURRENCY, is_required=False),
 })
 def azure_duckdb_io_manager(init_context):
     return AzureDuckDBIOManager(
@@ -73,4 +771,9 @@ def azure_duckdb_io_manager(init_context):
         account_key=init_context.resource_config["account_key"],
         container=init_context.resource_config["container"],
         database_path=init_context.resource_config["database_path"],
+        sync_mode=init_context.resource_config["sync_mode"],
+        local_cache_dir=init_context.resource_config["local_cache_dir"],
+        compact_every=init_context.resource_config["compact_every"],
+        block_size=init_context.resource_config["block_size"],
+        max_concurrency=init_context.resource_config["max_concurrency"],
     )
@@ -0,0 +1,68 @@
+import os
+import dagster as dg
+from dagster import IOManager
+import polars as pl
+import pyarrow as pa
+
+""" IO Manager for the coordinate tables passed between the map assets """
+
+# Outputs (polars DataFrames or pyarrow Tables) are written to <base_dir>/<asset key>.<ext> and loaded as polars
+# DataFrames. format="parquet": compressed Parquet, smallest on disk and readable from the notebooks.
+# format="arrow": uncompressed Arrow IPC, memory mapped on load so the columns are used without copying
+FORMATS = ("parquet", "arrow")
+
+
+class MapTablesIOManager(IOManager):
+    def __init__(self, base_dir, format="parquet"):
+        if format not in FORMATS:
+            raise ValueError(f"Unknown format '{format}', expected one of {FORMATS}")
+
+        self.base_dir = base_dir
+        self.format = format
+
+    def _get_path(self, asset_key):
+        return os.path.join(self.base_dir, *asset_key.path) + f".{self.format}"
+
+    def handle_output(self, context, obj):
+        if isinstance(obj, pa.Table):
+            obj = pl.from_arrow(obj)
+        if not isinstance(obj, pl.DataFrame):
+            raise TypeError(f"{context.asset_key.to_user_string()} must return a polars DataFrame or pyarrow Table, got {type(obj).__name__}")
+
+        path = self._get_path(context.asset_key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Written next to the target and renamed, readers never see a partial file
+        tmp_path = f"{path}.tmp"
+        if self.format == "parquet":
+            obj.write_parquet(tmp_path, compression="zstd", statistics=True)
+        else:
+            obj.write_ipc(tmp_path, compression="uncompressed")
+        os.replace(tmp_path, path)
+
+        context.add_output_metadata({
+            "path": dg.MetadataValue.path(path),
+            "rows": obj.height,
+            "size_bytes": os.path.getsize(path),
+            "schema": dg.MetadataValue.table_schema(dg.TableSchema(columns=[
+                dg.TableColumn(name, str(dtype)) for name, dtype in obj.schema.items()
+            ])),
+        })
+
+    def load_input(self, context):
+        path = self._get_path(context.upstream_output.asset_key)
+        if self.format == "parquet":
+            return pl.read_parquet(path)
+        with pa.memory_map(path) as source:
+            return pl.from_arrow(pa.ipc.open_file(source).read_all(), rechunk=False)
+
+
+@dg.io_manager(config_schema={
+    "base_dir": dg.Field(str, default_value="/opt/dagster/app/data/map_tables", is_required=False),
+    "format": dg.Field(str, default_value="parquet", is_required=False),
+})
+def map_tables_io_manager(init_context):
+    return MapTablesIOManager(
+        base_dir=init_context.resource_config["base_dir"],
+        format=init_context.resource_config["format"],
+    )
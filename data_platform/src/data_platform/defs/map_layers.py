@@ -0,0 +1,132 @@
+import json
+from string import Template
+
+""" Map layers and HTML shells for the map assets """
+# Markers are stored as compact GeoJSON layers and drawn by a thin Leaflet page (canvas circle markers, clustered
+# layers through Leaflet.markercluster, popups built from the feature properties when opened). The page only
+# references the layers, so its size does not depend on the number of markers and shared layers (detectors) are
+# stored once for all maps.
+
+GBG_CENTER = [57.7089, 11.9746]
+
+# Layer files, relative to the maps folder
+STATIONS_LAYER = "layers/monitoring_stations.geojson"
+DETECTORS_LAYER = "layers/detectors.geojson"
+LINKS_LAYER = "layers/station_detector_links.geojson"
+GEOJSON_CONTENT_TYPE = "application/geo+json"
+
+# Decimals kept in coordinates (~0.1 m)
+COORDINATE_DECIMALS = 6
+
+
+# FeatureCollection of points. coordinates: [lat, lon] pairs, properties: one dict per point
+def point_features(coordinates, properties):
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature", "geometry": {"type": "Point", "coordinates": _lon_lat(coord)}, "properties": props}
+            for coord, props in zip(coordinates, properties)
+        ],
+    }
+
+
+# FeatureCollection of lines. lines: lists of [lat, lon] pairs, properties: one dict per line
+def line_features(lines, properties):
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature", "geometry": {"type": "LineString", "coordinates": [_lon_lat(coord) for coord in line]}, "properties": props}
+            for line, props in zip(lines, properties)
+        ],
+    }
+
+
+def geojson_bytes(collection):
+    return json.dumps(collection, separators=(",", ":"), default=str).encode("utf-8")
+
+
+# GeoJSON is [lon, lat]
+def _lon_lat(coord):
+    return [round(float(coord[1]), COORDINATE_DECIMALS), round(float(coord[0]), COORDINATE_DECIMALS)]
+
+
+# Layer of a map shell. url is relative to the page (maps/layers/... next to maps/*.html)
+def map_layer(name, url, color, cluster=False):
+    return {"name": name, "url": url, "color": color, "cluster": cluster}
+
+
+# Thin HTML page drawing the given layers. A layer with a "data" key is drawn from it instead of fetching url
+# (used to inline layers where relative urls do not resolve, e.g. the notebooks)
+def map_shell(title, layers, center=GBG_CENTER, zoom=13):
+    return _MAP_SHELL.substitute(
+        title=title,
+        center=json.dumps(center),
+        zoom=zoom,
+        layers=layers_json(layers),
+    )
+
+
+# Layer list as embedded in the page, "</" escaped so layer data cannot close the script tag
+def layers_json(layers):
+    return json.dumps(layers, separators=(",", ":"), default=str).replace("</", "<\\/")
+
+
+_MAP_SHELL = Template("""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>$title</title>
+<meta name="viewport" content="width=device-width, initial-scale=1.0">
+<link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/leaflet@1.9.4/dist/leaflet.css">
+<link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/leaflet.markercluster@1.5.3/dist/MarkerCluster.css">
+<link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/leaflet.markercluster@1.5.3/dist/MarkerCluster.Default.css">
+<script src="https://cdn.jsdelivr.net/npm/leaflet@1.9.4/dist/leaflet.js"></script>
+<script src="https://cdn.jsdelivr.net/npm/leaflet.markercluster@1.5.3/dist/leaflet.markercluster.js"></script>
+<style>html, body, #map { height: 100%; margin: 0; }</style>
+</head>
+<body>
+<div id="map"></div>
+<script type="application/json" id="layers">$layers</script>
+<script>
+var map = L.map("map", {preferCanvas: true}).setView($center, $zoom);
+L.tileLayer("https://tile.openstreetmap.org/{z}/{x}/{y}.png", {
+  maxZoom: 19,
+  attribution: "&copy; OpenStreetMap contributors"
+}).addTo(map);
+var control = L.control.layers(null, {}).addTo(map);
+
+function popup(feature) {
+  var properties = feature.properties || {};
+  var lines = Object.keys(properties).map(function (key) { return key + ": " + properties[key]; });
+  if (feature.geometry.type === "Point") {
+    lines.push("Lat: " + feature.geometry.coordinates[1], "Lon: " + feature.geometry.coordinates[0]);
+  }
+  return lines.join("<br>");
+}
+
+function addLayer(layer, data) {
+  var geojson = L.geoJSON(data, {
+    pointToLayer: function (feature, latlng) {
+      return L.circleMarker(latlng, {radius: 6, color: layer.color, fillOpacity: 0.8});
+    },
+    style: function () { return {color: layer.color, weight: 4, opacity: 0.8}; },
+    onEachFeature: function (feature, marker) {
+      marker.bindPopup(function () { return popup(feature); });
+    }
+  });
+  var overlay = layer.cluster ? L.markerClusterGroup({chunkedLoading: true}).addLayer(geojson) : geojson;
+  overlay.addTo(map);
+  control.addOverlay(overlay, layer.name);
+}
+
+JSON.parse(document.getElementById("layers").textContent).forEach(function (layer) {
+  if (layer.data) {
+    addLayer(layer, layer.data);
+  } else {
+    fetch(layer.url).then(function (response) { return response.json(); }).then(function (data) { addLayer(layer, data); });
+  }
+});
+</script>
+</body>
+</html>
+""")
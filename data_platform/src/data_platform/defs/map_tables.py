@@ -0,0 +1,92 @@
+import polars as pl
+
+""" Typed coordinate tables passed between the map assets """
+# Stored as Parquet by the map tables IO manager (io_managers/map_tables_io_manager.py), so the outputs can be
+# read by other assets and the notebooks without unpickling Python objects
+
+STATIONS_SCHEMA = {
+    "station_name": pl.String,
+    "station": pl.String,
+    "lat": pl.Float64,
+    "lon": pl.Float64,
+}
+
+DETECTORS_SCHEMA = {
+    "site_id": pl.Int64,
+    "lat": pl.Float64,
+    "lon": pl.Float64,
+}
+
+# One row per station and matched detector (rank 1 is the closest). A station without any detector within the
+# configured radius has a single row with null rank/detector columns
+MATCHES_SCHEMA = {
+    "station_index": pl.Int32,
+    "station_name": pl.String,
+    "station": pl.String,
+    "station_lat": pl.Float64,
+    "station_lon": pl.Float64,
+    "rank": pl.Int32,
+    "detector_id": pl.Int64,
+    "detector_lat": pl.Float64,
+    "detector_lon": pl.Float64,
+    "distance_km": pl.Float64,
+}
+
+
+# Monitoring stations from the monitoring stations JSON. station is the GBGS column prefix (femman, haganorra, ...)
+def stations_table(locations):
+    return pl.DataFrame(
+        {
+            "station_name": [loc["name"] for loc in locations],
+            "station": [loc.get("station") for loc in locations],
+            "lat": [loc["coordinates"][0] for loc in locations],
+            "lon": [loc["coordinates"][1] for loc in locations],
+        },
+        schema=STATIONS_SCHEMA,
+    )
+
+
+def detectors_table(df):
+    return df.select(pl.col(column).cast(dtype) for column, dtype in DETECTORS_SCHEMA.items())
+
+
+# nearest: one list of (detector_row, distance_km) per station, as returned by matching.nearest_detectors
+def matches_table(stations, detectors, nearest):
+    rows = []
+    for i, (station_name, station, lat, lon) in enumerate(stations.select("station_name", "station", "lat", "lon").iter_rows()):
+        station_row = (i, station_name, station, lat, lon)
+        if not nearest[i]:
+            rows.append(station_row + (None, None, None, None, None))
+        for rank, (j, distance) in enumerate(nearest[i], start=1):
+            site_id, detector_lat, detector_lon = detectors.row(j)
+            rows.append(station_row + (rank, site_id, detector_lat, detector_lon, distance))
+
+    return pl.DataFrame(rows, schema=MATCHES_SCHEMA, orient="row")
+
+
+# Matches in the nested layout of json_files/station_detector_matches.json
+# Stations without a detector (none within radius_km) get null for the closest detector and its distance
+def matches_json(matches):
+    stations = []
+    for (station_index,), rows in matches.sort("station_index", "rank", nulls_last=True).group_by("station_index", maintain_order=True):
+        first = rows.row(0, named=True)
+        nearest = [
+            {
+                "detector_id": row["detector_id"],
+                "detector_coord": [row["detector_lat"], row["detector_lon"]],
+                "distance_km": row["distance_km"],
+            }
+            for row in rows.filter(pl.col("detector_id").is_not_null()).iter_rows(named=True)
+        ]
+        closest = nearest[0] if nearest else {}
+        stations.append({
+            "monitoring_station_index": station_index,
+            "monitoring_station_name": first["station_name"],
+            "station": first["station"],
+            "monitoring_coord": [first["station_lat"], first["station_lon"]],
+            "closest_detector_id": closest.get("detector_id"),
+            "closest_detector_coord": closest.get("detector_coord"),
+            "distance_km": closest.get("distance_km"),
+            "nearest_detectors": nearest,
+        })
+    return stations
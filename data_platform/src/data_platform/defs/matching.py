@@ -0,0 +1,131 @@
+import hashlib
+import numpy as np
+import os
+import pickle
+import polars as pl
+from pathlib import Path
+from geopy.distance import geodesic
+from sklearn.neighbors import BallTree
+
+""" Nearest neighbour matching between monitoring stations and detectors """
+
+# Mean earth radius used by the haversine pre-filter
+EARTH_RADIUS_KM = 6371.0088
+
+# The haversine distance differs from the ellipsoidal (geodesic) distance by up to ~0.5%, so the tree is queried
+# with a radius RADIUS_MARGIN larger than the geodesic distance wanted and the candidates are re-ranked with the
+# exact geodesic distance
+RADIUS_MARGIN = 1.01
+
+
+# Returns one list per station of (detector_index, distance_km) sorted by geodesic distance.
+# k: number of nearest detectors per station (None for all detectors within radius_km)
+# radius_km: only detectors within this geodesic distance
+# tree: prebuilt BallTree over detector_coords (see load_detector_index), built here if None
+def nearest_detectors(station_coords, detector_coords, k=1, radius_km=None, tree=None):
+    station_coords = np.asarray(station_coords, dtype=float).reshape(-1, 2)
+    detector_coords = np.asarray(detector_coords, dtype=float).reshape(-1, 2)
+
+    if len(station_coords) == 0:
+        return []
+    if len(detector_coords) == 0:
+        return [[] for _ in station_coords]
+    if k is None and radius_km is None:
+        raise ValueError("Either k or radius_km must be given")
+
+    if tree is None:
+        tree = build_detector_index(detector_coords)
+    stations_rad = np.radians(station_coords)
+
+    if radius_km is not None:
+        candidates = tree.query_radius(stations_rad, r=radius_km * RADIUS_MARGIN / EARTH_RADIUS_KM)
+    else:
+        # The k nearest detectors by haversine bound the geodesic distance of the k-th nearest. Every detector
+        # within that bound is in the radius query, so no detector that ranks in the top k is missed
+        _, nearest = tree.query(stations_rad, k=min(len(detector_coords), k))
+        bounds_km = np.array([
+            max(geodesic(station, detector_coords[j]).kilometers for j in station_nearest)
+            for station, station_nearest in zip(station_coords, nearest)
+        ])
+        candidates = tree.query_radius(stations_rad, r=bounds_km * RADIUS_MARGIN / EARTH_RADIUS_KM)
+
+    matches = []
+    for station, station_candidates in zip(station_coords, candidates):
+        ranked = sorted(
+            ((int(j), geodesic(station, detector_coords[j]).kilometers) for j in station_candidates),
+            key=lambda match: match[1],
+        )
+        if radius_km is not None:
+            ranked = [match for match in ranked if match[1] <= radius_km]
+        if k is not None:
+            ranked = ranked[:k]
+        matches.append(ranked)
+
+    return matches
+
+
+""" Persistent detector index """
+
+def build_detector_index(detector_coords):
+    return BallTree(np.radians(np.asarray(detector_coords, dtype=float).reshape(-1, 2)), metric="haversine")
+
+# Saved next to the DuckDB database used by the map assets
+def detector_index_path(database):
+    return Path(database.database).with_name("detector_sites_index.pkl")
+
+def _fingerprint(detector_coords):
+    return hashlib.sha256(np.asarray(detector_coords, dtype=float).tobytes()).hexdigest()
+
+# Build and save the index unless the saved one already covers the same coordinates
+def save_detector_index(path, detector_coords):
+    if len(detector_coords) == 0:
+        return False
+
+    fingerprint = _fingerprint(detector_coords)
+    if load_detector_index(path, detector_coords, fingerprint) is not None:
+        return False
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump({"fingerprint": fingerprint, "tree": build_detector_index(detector_coords)}, f)
+    os.replace(tmp_path, path)
+    return True
+
+# The saved index, or None if it is missing or was built for other coordinates
+def load_detector_index(path, detector_coords, fingerprint=None):
+    if len(detector_coords) == 0 or not os.path.exists(path):
+        return None
+
+    with open(path, "rb") as f:
+        saved = pickle.load(f)
+
+    if saved.get("fingerprint") != (fingerprint or _fingerprint(detector_coords)):
+        return None
+    return saved["tree"]
+
+
+""" Station to detector matches in DuckDB """
+
+# One row per station and matched detector (rank 1 is the closest), read by the dbt station/detector mart.
+# matches: table from map_tables.matches_table, stations without a matched detector are left out
+def save_station_detector_matches(conn, matches):
+    rows = matches.filter(pl.col("detector_id").is_not_null()).select(
+        "station", "station_name", "detector_id", "rank", "distance_km"
+    ).to_arrow()
+
+    conn.execute("CREATE SCHEMA IF NOT EXISTS maps")
+    conn.execute("BEGIN TRANSACTION")
+    conn.register("station_detector_rows", rows)
+    conn.execute("""
+        CREATE OR REPLACE TABLE maps.station_detector_matches AS
+        SELECT
+            station::VARCHAR AS station,
+            station_name::VARCHAR AS station_name,
+            detector_id::BIGINT AS detector_id,
+            rank::INTEGER AS rank,
+            distance_km::DOUBLE AS distance_km
+        FROM station_detector_rows
+    """)
+    conn.unregister("station_detector_rows")
+    conn.execute("COMMIT")
+    return rows.num_rows
@@ -0,0 +1,47 @@
+import dagster as dg
+import os
+import re
+
+""" Daily partitions shared by the raw data assets and the dbt models """
+# Days in local time. end_offset=1 adds the current (still open) day, so the hourly schedules load into today's
+# partition and a single bad day can be reprocessed on its own
+daily_partitions = dg.DailyPartitionsDefinition(
+    start_date=os.environ.get("PARTITIONS_START_DATE", "2025-01-01"),
+    timezone="Europe/Stockholm",
+    end_offset=1,
+)
+
+# Partition key range of an asset run, a single partition is a range of one key. None for unpartitioned runs
+def run_partition_range(context):
+    if context.has_partition_key or context.has_partition_key_range:
+        return context.partition_key_range
+    return None
+
+# Runs of only the current (still open) day follow the incremental state: the GBGS date cursor, the Trafikverket
+# change id and the dlt loads since the last dbt build. Every other partitioned run (one past day materialized from
+# the UI, a backfill window) processes exactly the days of its partition window
+def is_current_partition_run(context):
+    key_range = run_partition_range(context)
+    return key_range is None or key_range.start == daily_partitions.get_last_partition_key()
+
+# Number of days each dbt run covers in a backfill (one dbt build per window instead of one per day)
+DBT_BACKFILL_PARTITIONS_PER_RUN = int(os.environ.get("DBT_BACKFILL_PARTITIONS_PER_RUN", "31"))
+
+# Concurrency pool of the steps that open the DuckDB database at DUCKDB_DATABASE_PATH (limit 1 in dagster.yaml):
+# the dbt models and the map assets that read or write it through the database resource (detector sites, station
+# to detector matches). DuckDB allows one writing process per file, so these steps take turns
+DBT_DATABASE_POOL = "dbt"
+
+# Number of days each GBGS_raw_data run covers in a backfill. Every run crawls the API once (from the window start
+# if the API has a date filter, see fetch_data.py, otherwise all pages), so a backfill crawls once per window
+# instead of once per day
+GBGS_BACKFILL_PARTITIONS_PER_RUN = int(os.environ.get("GBGS_BACKFILL_PARTITIONS_PER_RUN", "31"))
+
+# Concurrency pool of the raw data assets (limit in dagster.yaml). In full and delta mode GBGS_raw_data and
+# TV_raw_data write the same DuckDB database, so they share one pool per database_path and take turns. In
+# partitioned mode every asset and backfill window stages its own database, so no pool and the backfill runs fan
+# out up to the dagster/backfill limit
+if os.environ.get("AZURE_DUCKDB_SYNC_MODE", "full") == "partitioned":
+    RAW_DATA_POOL = None
+else:
+    RAW_DATA_POOL = "duckdb_" + re.sub(r"\W", "_", os.environ.get("AZURE_STORAGE_ACCOUNT_DATABASE_PATH") or "raw_data")
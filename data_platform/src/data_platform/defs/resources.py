@@ -1,5 +1,6 @@
 import dagster as dg
 from dagster_duckdb import DuckDBResource
+import hashlib
 import requests
 import os
 from pathlib import Path
@@ -9,43 +10,115 @@ from adlfs import AzureBlobFileSystem
 from dagster import ConfigurableResource
 import tempfile
 import duckdb
+from concurrent.futures import ThreadPoolExecutor
+
+# Azure
+from azure.core.exceptions import ResourceNotFoundError
+from azure.storage.blob import BlobServiceClient, ContentSettings
 
 from dotenv import load_dotenv
 load_dotenv()
 
-@dg.resource()
-def GBGS_api_client():
-    GBGS_API_URL = os.getenv("GOTEBORGS_STAD_API_URL")
+""" Client for the Göteborgs Stad air quality API """
+# One keep-alive session with a connection pool sized for the number of requests in flight
+class GBGSAPIClient:
+    def __init__(self, base_url, timeout=30.0, max_in_flight=4, date_filter_param=None, row_order=None):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        # Optional query parameter for only requesting rows from a date, and the date order of the API rows
+        # ("asc"/"desc") which lets the incremental cursor stop the crawl early
+        self.date_filter_param = date_filter_param
+        self.row_order = row_order
 
-    class GBGSAPIClient:
-        def __init__(self):
-            self.base_url = GBGS_API_URL
-        
-    return GBGSAPIClient()
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
 
-@dg.resource()
-def TV_api_client():
+    def get_json(self, url):
+        response = self.session.get(url, timeout=self.timeout)
 
-    TV_API_URL = os.getenv("TRAFIKVERKET_API_URL")
-    TV_API_KEY = os.getenv("TRAFIKVERKET_API_KEY")
+        if response.status_code != 200:
+            raise RuntimeError(f"API request failed with status code: {response.status_code}")
 
-    # CountyNo = '14' (Västra Götalands län)
-    xml_request = f"""
+        return response.json()
+
+@dg.resource(config_schema={
+    "timeout": dg.Field(float, default_value=30.0, is_required=False),
+    "max_in_flight": dg.Field(int, default_value=4, is_required=False),
+    "date_filter_param": dg.Field(dg.Noneable(str), default_value=None, is_required=False),
+    "row_order": dg.Field(dg.Noneable(str), default_value=None, is_required=False),
+})
+def GBGS_api_client(init_context):
+    GBGS_API_URL = os.getenv("GOTEBORGS_STAD_API_URL")
+
+    return GBGSAPIClient(
+        GBGS_API_URL,
+        timeout=init_context.resource_config["timeout"],
+        max_in_flight=init_context.resource_config["max_in_flight"],
+        date_filter_param=init_context.resource_config["date_filter_param"],
+        row_order=init_context.resource_config["row_order"],
+    )
+
+""" Client for the Trafikverket TrafficFlow API """
+# The request is only sent when data is fetched, not when the resource is built.
+# With a change id the API only returns measurements changed since that id (changeid="0" returns everything)
+class TVAPIClient:
+    def __init__(self, url, api_key, county_no="14", timeout=30.0, batch_size=5000):
+        self.url = url
+        self.api_key = api_key
+        self.county_no = county_no
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.session = requests.Session()
+
+    def query(self, change_id="0"):
+        return f"""
     <REQUEST>
-        <LOGIN authenticationkey="{TV_API_KEY}" />
-        <QUERY objecttype="TrafficFlow" schemaversion="1">
+        <LOGIN authenticationkey="{self.api_key}" />
+        <QUERY objecttype="TrafficFlow" schemaversion="1" changeid="{change_id}">
             <FILTER>
-                <EQ name="CountyNo" value="14" />
+                <EQ name="CountyNo" value="{self.county_no}" />
             </FILTER>
         </QUERY>
     </REQUEST>
     """
 
-    class TVAPIClient:
-        def __init__(self):
-            self.response = requests.post(TV_API_URL, data=xml_request, headers={"Content-Type": "text/xml; charset=utf-8"})
+    # Streamed response, the body is read incrementally by the caller
+    def post_query(self, change_id="0"):
+        response = self.session.post(
+            self.url,
+            data=self.query(change_id),
+            headers={"Content-Type": "text/xml; charset=utf-8"},
+            timeout=self.timeout,
+            stream=True,
+        )
+
+        if response.status_code != 200:
+            response.close()
+            raise RuntimeError(f"API request failed with status code: {response.status_code}")
 
-    return TVAPIClient()
+        return response
+
+@dg.resource(config_schema={
+    # CountyNo = '14' (Västra Götalands län)
+    "county_no": dg.Field(str, default_value="14", is_required=False),
+    "timeout": dg.Field(float, default_value=30.0, is_required=False),
+    "batch_size": dg.Field(int, default_value=5000, is_required=False),
+})
+def TV_api_client(init_context):
+
+    TV_API_URL = os.getenv("TRAFIKVERKET_API_URL")
+    TV_API_KEY = os.getenv("TRAFIKVERKET_API_KEY")
+
+    return TVAPIClient(
+        TV_API_URL,
+        TV_API_KEY,
+        county_no=init_context.resource_config["county_no"],
+        timeout=init_context.resource_config["timeout"],
+        batch_size=init_context.resource_config["batch_size"],
+    )
 
 @dg.resource()
 def monitoring_stations_data():
@@ -56,6 +129,57 @@ def monitoring_stations_data():
         
     return data
 
+""" Store for map/JSON artifacts in Azure blob storage """
+# One BlobServiceClient (and its connection pool) shared by all map assets for the whole run.
+# Artifacts are uploaded from memory, no temp files, and an upload is skipped when the MD5 of the content matches
+# the Content-MD5 of the existing blob. submit() uploads in a thread pool so several artifacts can be in flight
+class ArtifactStore:
+    def __init__(self, connection_string, container="dagster-storage", max_concurrency=4):
+        if not connection_string:
+            raise ValueError("Missing AZURE_STORAGE_CONNECTION_STRING env var")
+
+        self.container = container
+        self.blob_service = BlobServiceClient.from_connection_string(connection_string)
+        self.container_client = self.blob_service.get_container_client(container)
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+    # Returns True if the blob was uploaded, False if identical content was already stored
+    def upload_bytes(self, blob_name, data, content_type="application/octet-stream"):
+        blob_client = self.container_client.get_blob_client(blob_name)
+        content_md5 = hashlib.md5(data).digest()
+
+        try:
+            existing_md5 = blob_client.get_blob_properties().content_settings.content_md5
+        except ResourceNotFoundError:
+            existing_md5 = None
+
+        if existing_md5 is not None and bytes(existing_md5) == content_md5:
+            return False
+
+        blob_client.upload_blob(
+            data,
+            overwrite=True,
+            content_settings=ContentSettings(content_type=content_type, content_md5=content_md5),
+        )
+        return True
+
+    # Non-blocking upload, returns a Future with the result of upload_bytes
+    def submit(self, blob_name, data, content_type="application/octet-stream"):
+        return self.executor.submit(self.upload_bytes, blob_name, data, content_type)
+
+@dg.resource(config_schema={
+    "container": dg.Field(str, default_value="dagster-storage", is_required=False),
+    "max_concurrency": dg.Field(int, default_value=4, is_required=False),
+})
+def artifact_store(init_context):
+    store = ArtifactStore(
+        os.environ.get("AZURE_STORAGE_CONNECTION_STRING"),
+        container=init_context.resource_config["container"],
+        max_concurrency=init_context.resource_config["max_concurrency"],
+    )
+    yield store
+    store.executor.shutdown(wait=True)
+
 # Create resource for duckdb
 database_resource = DuckDBResource(
     database="/opt/dagster/app/data/air_quality.duckdb"
@@ -1,14 +1,24 @@
 import dagster as dg
 from data_platform.defs.jobs import GBGS_update_job, TV_update_job
+from data_platform.defs.partitions import daily_partitions
 
 # Create schedule for GBGS update job
-GBGS_update_schedule = dg.ScheduleDefinition(
+# Every run loads into the partition of the current day
+@dg.schedule(
     job=GBGS_update_job,
-    cron_schedule="0 * * * *" # every hour
+    cron_schedule="0 * * * *", # every hour
+    execution_timezone="Europe/Stockholm"
 )
+def GBGS_update_schedule(context: dg.ScheduleEvaluationContext):
+    partition_key = daily_partitions.get_partition_key_for_timestamp(context.scheduled_execution_time.timestamp())
+    return dg.RunRequest(partition_key=partition_key)
 
-# Create schedule for GBGS update job
-TV_update_schedule = dg.ScheduleDefinition(
+# Create schedule for TV update job
+@dg.schedule(
     job=TV_update_job,
-    cron_schedule="*/15 * * * *" # every 15th minute starting on top of every hour 
-)
\ No newline at end of file
+    cron_schedule="*/15 * * * *", # every 15th minute starting on top of every hour 
+    execution_timezone="Europe/Stockholm"
+)
+def TV_update_schedule(context: dg.ScheduleEvaluationContext):
+    partition_key = daily_partitions.get_partition_key_for_timestamp(context.scheduled_execution_time.timestamp())
+    return dg.RunRequest(partition_key=partition_key)
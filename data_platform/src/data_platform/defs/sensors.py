@@ -0,0 +1,10 @@
+import dagster as dg
+
+# Evaluates the automation conditions of the maps group: the station/detector maps run after new raw data, the
+# matching and merged map only when their data versions changed
+maps_automation_sensor = dg.AutomationConditionSensorDefinition(
+    name="maps_automation_sensor",
+    target=dg.AssetSelection.groups("maps"),
+    default_status=dg.DefaultSensorStatus.RUNNING,
+    minimum_interval_seconds=60
+)
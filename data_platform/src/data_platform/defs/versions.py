@@ -0,0 +1,52 @@
+import dagster as dg
+import hashlib
+import json
+
+""" Data versions for the map assets """
+# The map inputs (station coordinates, detector sites) rarely change while the raw data they hang off lands every
+# hour. The first map assets record a hash of their inputs as data version, the rest of the chain only runs when
+# one of these versions (or a code version) changes
+
+DATA_VERSION_TAG = "dagster/data_version"
+
+
+# Stable hash of a JSON serializable value (dict keys sorted)
+def content_version(value):
+    payload = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+    return dg.DataVersion(hashlib.sha256(payload).hexdigest()[:16])
+
+
+# Data version of an asset's output: hash of its inputs and its code version, so a code version bump rebuilds the
+# output even when the inputs did not change
+def asset_content_version(context, value):
+    return content_version([context.assets_def.code_versions_by_key[context.asset_key], value])
+
+
+# Data version of the last materialization of the asset, None if never materialized
+def latest_data_version(context):
+    event = context.instance.get_latest_materialization_event(context.asset_key)
+    if event is None or event.asset_materialization is None:
+        return None
+
+    value = event.asset_materialization.tags.get(DATA_VERSION_TAG)
+    return dg.DataVersion(value) if value else None
+
+
+# Automation condition for the first map assets, downstream of the daily partitioned raw data: eager() without its
+# missing dependencies clause. The schedules only load today's partition, so past partitions stay missing and
+# any_deps_missing() would block every run. Requested when a raw data partition was updated
+def raw_data_updated():
+    AC = dg.AutomationCondition
+    return AC.eager().without(~AC.any_deps_missing()).with_label("raw_data_updated")
+
+
+# Automation condition for assets downstream of the versioned map assets: requested when an upstream data version
+# changed, the code version changed or the asset is missing. Upstream runs with unchanged versions are ignored
+def upstream_version_changed():
+    AC = dg.AutomationCondition
+    return (
+        (AC.newly_missing() | AC.code_version_changed() | AC.any_deps_match(AC.data_version_changed())).since_last_handled()
+        & ~AC.any_deps_missing()
+        & ~AC.any_deps_in_progress()
+        & ~AC.in_progress()
+    ).with_label("upstream_version_changed")
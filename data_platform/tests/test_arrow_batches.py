@@ -0,0 +1,80 @@
+from datetime import datetime, timezone
+
+import pyarrow as pa
+
+from data_platform.defs.fetch_data import (
+    GBGS_arrow_page, _GBGS_float_column, GBGS_ARROW_SCHEMA,
+    TV_arrow_batch, TV_ARROW_SCHEMA,
+)
+from data_platform.defs.instrumentation import RunMetrics
+
+
+def test_float_column_blanks_are_null():
+    column = _GBGS_float_column(["1.5", " 2 ", "", "  ", None])
+
+    assert column.type == pa.float64()
+    assert column.to_pylist() == [1.5, 2.0, None, None, None]
+
+
+def test_float_column_non_numeric_values_are_null():
+    metrics = RunMetrics()
+
+    column = _GBGS_float_column(["1.5", "n/a", "", 3, True], metrics)
+
+    assert column.to_pylist() == [1.5, None, None, 3.0, None]
+    assert metrics.get("invalid_values") == 2
+
+
+def test_page_schema_is_fixed():
+    page = GBGS_arrow_page([
+        {"date": "2025-03-01", "time": "01:00", "femman_no2": "4.2"},
+        {"date": "2025-03-01", "time": "24:00", "femman_no2": "", "femman_pm10": "bad"},
+    ])
+
+    assert page.schema == GBGS_ARROW_SCHEMA
+    assert page.column("measured_at").to_pylist() == [
+        datetime(2025, 3, 1, 0, 0, tzinfo=timezone.utc), datetime(2025, 3, 1, 23, 0, tzinfo=timezone.utc),
+    ]
+    assert page.column("femman_no2").to_pylist() == [4.2, None]
+    assert page.column("femman_pm10").to_pylist() == [None, None]
+    # Known columns the API left out are null
+    assert page.column("mobil3_pm10").null_count == 2
+
+
+def test_page_appends_extra_columns_sorted():
+    page = GBGS_arrow_page([
+        {"date": "2025-03-01", "time": "01:00", "zz_new": "1", "aa_new": "x"},
+        {"date": "2025-03-01", "time": "02:00", "aa_new": "2"},
+    ])
+
+    assert page.schema.names[:len(GBGS_ARROW_SCHEMA)] == GBGS_ARROW_SCHEMA.names
+    assert page.schema.names[len(GBGS_ARROW_SCHEMA):] == ["aa_new", "zz_new"]
+    assert page.schema.field("aa_new").type == pa.float64()
+    assert page.column("aa_new").to_pylist() == [None, 2.0]
+    assert page.column("zz_new").to_pylist() == [1.0, None]
+
+
+def test_tv_batch_missing_fields_are_null():
+    batch = TV_arrow_batch([
+        {"SiteId": 1, "MeasurementTime": "2025-09-25T10:00:00.000+02:00", "Geometry": {"WGS84": "POINT (11.97 57.70)"},
+         "CountyNo": [14], "Unknown": "dropped"},
+        {"SiteId": 2, "MeasurementTime": "2025-09-25T10:01:00.000+02:00", "Geometry": None},
+        {"SiteId": 3},
+    ])
+
+    assert batch.schema == TV_ARROW_SCHEMA
+    assert batch.column("site_id").to_pylist() == [1, 2, 3]
+    assert batch.column("geometry__wgs84").to_pylist() == ["POINT (11.97 57.70)", None, None]
+    assert batch.column("county_no").to_pylist() == [[14], None, None]
+    assert batch.column("measurement_time").to_pylist()[2] is None
+    assert batch.column("vehicle_flow_rate").null_count == 3
+
+
+def test_tv_batch_keeps_sub_millisecond_timestamps():
+    batch = TV_arrow_batch([{"SiteId": 1, "MeasurementTime": "2025-09-25T10:00:00.123456+02:00"}])
+
+    assert batch.column("measurement_time").to_pylist() == [datetime(2025, 9, 25, 8, 0, 0, 123456, tzinfo=timezone.utc)]
+
+
+def test_empty_tv_batch():
+    assert TV_arrow_batch([]).schema == TV_ARROW_SCHEMA
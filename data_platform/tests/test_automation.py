@@ -0,0 +1,63 @@
+import dagster as dg
+
+from data_platform.defs.assets import (
+    GBGS_raw_data, TV_raw_data, monitoring_station_locations_map, detector_locations_map,
+    mapping_station_to_detector, merged_map,
+)
+from data_platform.defs.partitions import daily_partitions
+from data_platform.defs.versions import DATA_VERSION_TAG
+
+
+# The conditions are only evaluated, no asset runs, so the resources are placeholders
+def maps_definitions():
+    none = dg.ResourceDefinition.none_resource()
+    return dg.Definitions(
+        assets=[GBGS_raw_data, TV_raw_data, monitoring_station_locations_map, detector_locations_map,
+                mapping_station_to_detector, merged_map],
+        resources={
+            "azure_duckdb_io_manager": dg.mem_io_manager,
+            "map_tables_io_manager": dg.mem_io_manager,
+            **{key: none for key in ["GBGS_api_client", "TV_api_client", "monitoring_stations_data", "database", "artifact_store"]},
+        },
+    )
+
+
+def requested(result):
+    return {item.key.to_user_string() for item in result.results if item.true_subset.size}
+
+
+def materialize_maps(instance, data_version):
+    for key in ["monitoring_station_locations_map", "detector_locations_map"]:
+        instance.report_runless_asset_event(dg.AssetMaterialization(key, tags={DATA_VERSION_TAG: data_version}))
+
+
+# Like the schedules: only today's raw data partition is materialized, every past partition is missing
+def test_map_chain_runs_with_partially_materialized_raw_data():
+    defs = maps_definitions()
+    instance = dg.DagsterInstance.ephemeral()
+    result = dg.evaluate_automation_conditions(defs=defs, instance=instance)
+    assert requested(result) == set()
+
+    today = daily_partitions.get_last_partition_key()
+    instance.report_runless_asset_event(dg.AssetMaterialization("GBGS_raw_data", partition=today))
+    instance.report_runless_asset_event(dg.AssetMaterialization("TV_raw_data", partition=today))
+    result = dg.evaluate_automation_conditions(defs=defs, instance=instance, cursor=result.cursor)
+    assert requested(result) == {"monitoring_station_locations_map", "detector_locations_map"}
+
+    materialize_maps(instance, "v1")
+    result = dg.evaluate_automation_conditions(defs=defs, instance=instance, cursor=result.cursor)
+    assert requested(result) == {"mapping_station_to_detector", "merged_map"}
+
+    instance.report_runless_asset_event(dg.AssetMaterialization("mapping_station_to_detector"))
+    instance.report_runless_asset_event(dg.AssetMaterialization("merged_map"))
+    result = dg.evaluate_automation_conditions(defs=defs, instance=instance, cursor=result.cursor)
+    assert requested(result) == set()
+
+    # Map runs with unchanged data versions do not request the matching
+    materialize_maps(instance, "v1")
+    result = dg.evaluate_automation_conditions(defs=defs, instance=instance, cursor=result.cursor)
+    assert requested(result) == set()
+
+    materialize_maps(instance, "v2")
+    result = dg.evaluate_automation_conditions(defs=defs, instance=instance, cursor=result.cursor)
+    assert requested(result) == {"mapping_station_to_detector", "merged_map"}
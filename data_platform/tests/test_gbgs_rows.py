@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from data_platform.defs.fetch_data import _GBGS_measured_at, normalize_GBGS_row, GBGS_TIMEZONE
+from data_platform.defs.instrumentation import RunMetrics
+
+
+def test_24_00_is_midnight_of_the_next_day():
+    assert _GBGS_measured_at("2025-01-31", "24:00") == datetime(2025, 2, 1, tzinfo=GBGS_TIMEZONE)
+    assert _GBGS_measured_at("2025-12-31", "24:00+01:00") == datetime(2026, 1, 1, tzinfo=timezone(timedelta(hours=1)))
+
+
+@pytest.mark.parametrize("time, utc", [
+    ("13:00+01:00", datetime(2025, 3, 1, 12, 0, tzinfo=timezone.utc)),
+    ("13:00-02:30", datetime(2025, 3, 1, 15, 30, tzinfo=timezone.utc)),
+    # Without offset the time is local time (CET in winter)
+    ("13:00", datetime(2025, 3, 1, 12, 0, tzinfo=timezone.utc)),
+    (" 7:30 ", datetime(2025, 3, 1, 6, 30, tzinfo=timezone.utc)),
+])
+def test_offset_is_kept(time, utc):
+    assert _GBGS_measured_at("2025-03-01", time) == utc
+
+
+def test_local_time_follows_daylight_saving():
+    assert _GBGS_measured_at("2025-07-01", "13:00") == datetime(2025, 7, 1, 11, 0, tzinfo=timezone.utc)
+
+
+def test_row_values_are_floats_or_none():
+    metrics = RunMetrics()
+    row = {
+        "date": "2025-03-01", "time": "13:00",
+        "femman_no2": "12.5", "femman_pm10": " 3 ", "femman_o3": "", "femman_rh": None,
+        "femman_temp": 4, "femman_rain": 0.2, "femman_nox": "n/a", "femman_winddir": True, "femman_globrad": [1],
+    }
+
+    typed = normalize_GBGS_row(row, metrics)
+
+    assert typed["date"] == "2025-03-01" and typed["time"] == "13:00"
+    assert typed["measured_at"] == datetime(2025, 3, 1, 13, 0, tzinfo=GBGS_TIMEZONE)
+    assert typed["femman_no2"] == 12.5
+    assert typed["femman_pm10"] == 3.0
+    assert typed["femman_o3"] is None and typed["femman_rh"] is None
+    assert typed["femman_temp"] == 4.0 and isinstance(typed["femman_temp"], float)
+    assert typed["femman_rain"] == 0.2
+    assert typed["femman_nox"] is None and typed["femman_winddir"] is None and typed["femman_globrad"] is None
+    assert metrics.get("invalid_values") == 3
+
+
+def test_row_without_metrics():
+    assert normalize_GBGS_row({"date": "2025-03-01", "time": "01:00", "x": "bad"})["x"] is None
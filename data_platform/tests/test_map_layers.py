@@ -0,0 +1,37 @@
+from data_platform.defs.map_layers import (
+    point_features, line_features, geojson_bytes, map_layer, map_shell,
+    STATIONS_LAYER, DETECTORS_LAYER, LINKS_LAYER,
+)
+
+
+# The artifact store skips an upload when the MD5 of the content matches the stored blob, which only works if the
+# same data always renders to the same bytes
+def build_artifacts(coordinates, site_ids):
+    detectors = point_features(coordinates, [{"Site id": site_id} for site_id in site_ids])
+    links = line_features([[coordinates[0], coordinates[-1]]], [{"Distance (km)": 1.23}])
+    page = map_shell("Monitoring stations and detectors", [
+        map_layer("Monitoring stations", STATIONS_LAYER, "red"),
+        map_layer("Detectors", DETECTORS_LAYER, "blue", cluster=True),
+        map_layer("Connections", LINKS_LAYER, "green"),
+    ])
+    return geojson_bytes(detectors), geojson_bytes(links), page.encode("utf-8")
+
+
+def test_artifacts_are_deterministic():
+    coordinates = [[57.7089, 11.9746], [57.71, 11.98], [57.6, 12.0]]
+    site_ids = [101, 102, 103]
+
+    assert build_artifacts(coordinates, site_ids) == build_artifacts(coordinates, site_ids)
+
+
+def test_page_does_not_depend_on_markers():
+    _, _, small_page = build_artifacts([[57.7, 11.9], [57.71, 11.91]], [1, 2])
+    _, _, large_page = build_artifacts([[57.7 + i / 1000, 11.9] for i in range(1000)], list(range(1000)))
+
+    assert small_page == large_page
+
+
+def test_coordinates_are_rounded_lon_lat():
+    collection = point_features([[57.123456789, 11.987654321]], [{}])
+
+    assert collection["features"][0]["geometry"]["coordinates"] == [11.987654, 57.123457]
@@ -0,0 +1,53 @@
+import dagster as dg
+import dlt
+import duckdb
+from fsspec.implementations.local import LocalFileSystem
+
+from data_platform.defs.instrumentation import RunMetrics
+from data_platform.defs.io_managers.azure_duckdb_io_manager import AzureDuckDBIOManager
+
+
+# Partitioned mode with the blob container replaced by a local folder
+class LocalIOManager(AzureDuckDBIOManager):
+    def _get_fs(self):
+        return LocalFileSystem(auto_mkdir=True)
+
+
+def push(io_manager, tmp_path, rows):
+    pipeline = dlt.pipeline(
+        pipeline_name="catalog_test",
+        destination=dlt.destinations.duckdb(str(tmp_path / "staging.duckdb")),
+        dataset_name="traffic",
+        pipelines_dir=str(tmp_path / "pipelines"),
+    )
+    pipeline.run(rows, table_name="flow", write_disposition="merge", primary_key="site")
+
+    conn = duckdb.connect(str(tmp_path / "staging.duckdb"))
+    try:
+        io_manager._push_partitions(dg.build_output_context(), io_manager._get_fs(), conn, "tv", RunMetrics())
+    finally:
+        conn.close()
+
+
+# A re-exported root row replaces its child rows in the catalog, even when the new version has fewer of them
+def test_child_rows_follow_the_deduplicated_root(tmp_path):
+    io_manager = LocalIOManager(
+        account_name="local", account_key="", container=str(tmp_path / "container"),
+        database_path="air_quality.duckdb", sync_mode="partitioned", local_cache_dir=str(tmp_path / "cache"),
+    )
+
+    push(io_manager, tmp_path, [{"site": 1, "county_no": [1, 2, 3]}, {"site": 2, "county_no": [5]}])
+    push(io_manager, tmp_path, [{"site": 1, "county_no": [4]}])
+
+    conn = duckdb.connect(io_manager._get_remote_path(), read_only=True)
+    try:
+        assert conn.execute("SELECT site FROM traffic.flow ORDER BY site").fetchall() == [(1,), (2,)]
+        assert conn.execute("""
+            SELECT f.site, c.value
+            FROM traffic.flow__county_no AS c
+            JOIN traffic.flow AS f ON c._dlt_root_id = f._dlt_id
+            ORDER BY f.site, c.value
+        """).fetchall() == [(1, 4), (2, 5)]
+        assert conn.execute("SELECT count(*) FROM traffic.flow__county_no").fetchone()[0] == 2
+    finally:
+        conn.close()
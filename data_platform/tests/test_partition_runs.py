@@ -0,0 +1,90 @@
+import dagster as dg
+import dlt
+import pytest
+
+from data_platform.defs.fetch_data import fetch_GBGS_data
+from data_platform.defs.partitions import daily_partitions, run_partition_range, is_current_partition_run
+from data_platform.defs.io_managers.azure_duckdb_io_manager import _partition_range
+
+
+# Records what the asset and the IO manager see of the run's partitions
+def run(**kwargs):
+    seen = {}
+
+    class RecordingIOManager(dg.IOManager):
+        def handle_output(self, context, obj):
+            seen["output_range"] = _partition_range(context)[0]
+
+        def load_input(self, context):
+            pass
+
+    @dg.asset(partitions_def=daily_partitions, io_manager_key="recording")
+    def raw(context):
+        seen["range"] = run_partition_range(context)
+        seen["current"] = is_current_partition_run(context)
+        seen["input_range"] = _partition_range(context)[0]
+
+    dg.materialize([raw], resources={"recording": RecordingIOManager()}, **kwargs)
+    return seen
+
+
+def range_tags(start, end):
+    return {"dagster/asset_partition_range_start": start, "dagster/asset_partition_range_end": end}
+
+
+@pytest.mark.parametrize("kwargs, start, end, current", [
+    # One past day materialized from the UI is processed as its own window
+    ({"partition_key": "2025-03-04"}, "2025-03-04", "2025-03-04", False),
+    ({"tags": range_tags("2025-03-04", "2025-03-06")}, "2025-03-04", "2025-03-06", False),
+    ({"partition_key": daily_partitions.get_last_partition_key()},
+     daily_partitions.get_last_partition_key(), daily_partitions.get_last_partition_key(), True),
+])
+def test_single_partitions_are_ranges(kwargs, start, end, current):
+    seen = run(**kwargs)
+
+    assert (seen["range"].start, seen["range"].end) == (start, end)
+    assert seen["current"] is current
+    # load_input and handle_output pick the same staging scope
+    assert seen["input_range"] == seen["output_range"] == seen["range"]
+
+
+def test_backfill_window_up_to_today_is_not_the_cursor_run():
+    last = daily_partitions.get_last_partition_key()
+
+    assert run(tags=range_tags("2025-03-04", last))["current"] is False
+
+
+class FakeGBGSClient:
+    base_url = "https://gbgs.example/api"
+    max_in_flight = 1
+    date_filter_param = None
+    row_order = None
+
+    def get_json(self, url):
+        rows = [{"date": date, "time": "12:00", "femman_no2": "1.0"} for date in ("2025-03-03", "2025-03-04", "2025-03-05")]
+        return {"results": rows}
+
+
+def load_GBGS(tmp_path, partition_key):
+    loaded = {}
+
+    @dg.asset(partitions_def=daily_partitions, required_resource_keys={"GBGS_api_client"})
+    def raw(context):
+        pipeline = dlt.pipeline(
+            pipeline_name="GBGS_raw_data",
+            destination=dlt.destinations.duckdb(str(tmp_path / "raw.duckdb")),
+            dataset_name="air_quality_data",
+            pipelines_dir=str(tmp_path / "pipelines"),
+        )
+        pipeline.run(fetch_GBGS_data(context))
+        with pipeline.sql_client() as client:
+            loaded["dates"] = [row[0] for row in client.execute_sql("SELECT date FROM GBGS_air_quality_data ORDER BY date")]
+
+    dg.materialize([raw], partition_key=partition_key, resources={"GBGS_api_client": FakeGBGSClient()})
+    return loaded["dates"]
+
+
+# A past day reloads only its own rows, the current day follows the date cursor
+def test_GBGS_past_day_loads_its_window(tmp_path):
+    assert load_GBGS(tmp_path / "past", "2025-03-04") == ["2025-03-04"]
+    assert load_GBGS(tmp_path / "current", daily_partitions.get_last_partition_key()) == ["2025-03-03", "2025-03-04", "2025-03-05"]
@@ -0,0 +1,102 @@
+import json
+from contextlib import contextmanager
+
+import pytest
+
+from data_platform.defs.fetch_data import fetch_TV_batches, _iter_json_array_items
+from data_platform.defs.instrumentation import RunMetrics
+
+
+MEASUREMENTS = [
+    {"SiteId": 1, "MeasurementTime": "2025-09-25T10:00:00.000+02:00", "MeasurementSide": "Norrgående", "VehicleFlowRate": 12},
+    {"SiteId": 2, "MeasurementTime": "2025-09-25T10:00:00.000+02:00", "Geometry": {"WGS84": "POINT (11.97 57.70)"}},
+    {"SiteId": 3, "MeasurementTime": "2025-09-25T10:01:00.000+02:00", "CountyNo": [14], "Deleted": False},
+]
+
+BODY = json.dumps({"RESPONSE": {"RESULT": [{
+    "TrafficFlow": MEASUREMENTS,
+    "INFO": {"LASTCHANGEID": "7428012345678901234"},
+}]}}, ensure_ascii=False).encode("utf-8")
+
+
+class FakeResponse:
+    def __init__(self, body, chunk_size):
+        self.body = body
+        self.chunk_size = chunk_size
+        self.encoding = "utf-8"
+
+    # The chunk size of the test, not the one requested, so objects and characters are split between chunks
+    def iter_content(self, chunk_size=None):
+        for start in range(0, len(self.body), self.chunk_size):
+            yield self.body[start:start + self.chunk_size]
+
+
+class FakeTVClient:
+    def __init__(self, body, chunk_size, batch_size=2):
+        self.body = body
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.change_ids = []
+
+    @contextmanager
+    def post_query(self, change_id):
+        self.change_ids.append(change_id)
+        yield FakeResponse(self.body, self.chunk_size)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, len(BODY)])
+def test_batches_do_not_depend_on_chunk_boundaries(chunk_size):
+    client = FakeTVClient(BODY, chunk_size)
+    info = {}
+
+    batches = list(fetch_TV_batches(client, "42", info))
+
+    assert client.change_ids == ["42"]
+    assert batches == [MEASUREMENTS[:2], MEASUREMENTS[2:]]
+    assert info["last_change_id"] == "7428012345678901234"
+
+
+def test_response_bytes_are_counted():
+    metrics = RunMetrics()
+
+    list(fetch_TV_batches(FakeTVClient(BODY, 5), "0", {}, metrics))
+
+    assert metrics.get("response_bytes") == len(BODY)
+    assert metrics.observations["tv_http"][0] == 1
+
+
+def test_truncated_array_raises_and_keeps_change_id():
+    body = BODY[:BODY.index(b'"SiteId": 3')]
+    info = {}
+
+    with pytest.raises(RuntimeError, match="TrafficFlow array was not closed"):
+        list(fetch_TV_batches(FakeTVClient(body, 16), "42", info))
+
+    assert "last_change_id" not in info
+
+
+def test_empty_response_has_change_id():
+    body = b'{"RESPONSE": {"RESULT": [{"TrafficFlow": [], "INFO": {"LASTCHANGEID": 99}}]}}'
+    info = {}
+
+    assert list(fetch_TV_batches(FakeTVClient(body, 4), "99", info)) == []
+    assert info["last_change_id"] == "99"
+
+
+def test_response_without_change_id():
+    body = b'{"RESPONSE": {"RESULT": [{"TrafficFlow": [{"SiteId": 1}]}]}}'
+    info = {}
+
+    assert list(fetch_TV_batches(FakeTVClient(body, 3), "0", info)) == [[{"SiteId": 1}]]
+    assert info == {}
+
+
+def test_text_outside_the_array_is_collected():
+    text = '{"A": 1, "TrafficFlow" : [ {"x": 1} , {"x": [2, "]"]} ], "INFO": {"LASTCHANGEID": "5"}}'
+    outside = []
+
+    items = list(_iter_json_array_items((text[i:i + 4] for i in range(0, len(text), 4)), "TrafficFlow", outside))
+
+    assert items == [{"x": 1}, {"x": [2, "]"]}]
+    assert '"LASTCHANGEID": "5"' in "".join(outside)
+    assert '"x"' not in "".join(outside)
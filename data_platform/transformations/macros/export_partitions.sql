@@ -0,0 +1,70 @@
+{#
+    Export location of a model: <name> in the Parquet folder read by the notebooks, DBT_EXPORT_DIR overrides the
+    folder (e.g. for the benchmarks)
+#}
+{% macro export_path(name) %}
+    {{- return(env_var('DBT_EXPORT_DIR', '/opt/dagster/app/data/parquet_files') ~ '/' ~ name) -}}
+{%- endmacro %}
+
+
+{#
+    Post-hook for incremental models: write the Hive partitions (<export dir>/<name>/<partition_column>=<value>/)
+    touched by this dbt invocation to Parquet. Every touched partition is rewritten in full from the model table,
+    the others are left as they are, so the amount of Parquet written follows the new data.
+    Each touched partition directory is written by its own COPY with OVERWRITE, which clears the directory first:
+    a rewrite with fewer files than before leaves no stale data_<i> files behind (OVERWRITE with PARTITION_BY
+    would clear the whole export, OVERWRITE_OR_IGNORE keeps the stale files).
+    Models using it select '{{ invocation_id }}' as _dbt_invocation_id. order_by sorts the rows within each
+    partition, so Parquet row group statistics can skip on those columns.
+#}
+{% macro export_partitions(name, partition_column, order_by=none) %}
+    {%- if execute -%}
+        {%- set touched = run_query(
+            "SELECT DISTINCT CAST(" ~ partition_column ~ " AS VARCHAR) FROM " ~ this
+            ~ " WHERE _dbt_invocation_id = '" ~ invocation_id ~ "'"
+        ).columns[0].values() -%}
+        {#- COPY with OVERWRITE does not create missing parent directories, an empty partitioned COPY creates the
+            export directory of the model #}
+        {%- call statement('export_partitions_dir') %}
+            COPY (SELECT * EXCLUDE (_dbt_invocation_id) FROM {{ this }} LIMIT 0)
+            TO '{{ export_path(name) }}' (FORMAT PARQUET, PARTITION_BY ({{ partition_column }}), OVERWRITE_OR_IGNORE)
+        {%- endcall %}
+        {%- for value in touched %}
+            {%- call statement('export_partition_' ~ loop.index) %}
+                COPY (
+                    SELECT * EXCLUDE (_dbt_invocation_id, {{ partition_column }})
+                    FROM {{ this }}
+                    WHERE CAST({{ partition_column }} AS VARCHAR) = '{{ value }}'
+                    {%- if order_by %}
+                    ORDER BY {{ order_by }}
+                    {%- endif %}
+                )
+                TO '{{ export_path(name) }}/{{ partition_column }}={{ value }}' (FORMAT PARQUET, PER_THREAD_OUTPUT, OVERWRITE, FILENAME_PATTERN 'data_{i}')
+            {%- endcall %}
+        {%- endfor %}
+    {%- endif %}
+{%- endmacro %}
+
+
+{#
+    Post-hook for small models (rollups): write the whole model table to a single Parquet file <export dir>/<name>
+#}
+{% macro export_table(name) %}
+    COPY {{ this }} TO '{{ export_path(name) }}' (FORMAT PARQUET)
+{%- endmacro %}
+
+
+{#
+    Incremental filter on the dlt load id: only raw rows loaded (or merged) after the last build. The last build is
+    read from the _dlt_load_id column of the model, so incremental models using it (or partition_window without
+    the min_date / max_date vars) must select _dlt_load_id
+#}
+{% macro new_dlt_loads() %}
+    {%- if execute -%}
+        {%- set columns = adapter.get_columns_in_relation(this) | map(attribute='name') | map('lower') | list -%}
+        {%- if '_dlt_load_id' not in columns -%}
+            {{ exceptions.raise_compiler_error(this ~ " has no _dlt_load_id column, select _dlt_load_id in " ~ model.name ~ " to build it incrementally from new dlt loads") }}
+        {%- endif -%}
+    {%- endif %}
+    CAST(_dlt_load_id AS DOUBLE) > (SELECT coalesce(max(CAST(_dlt_load_id AS DOUBLE)), 0) FROM {{ this }})
+{%- endmacro %}
@@ -0,0 +1,22 @@
+{#
+    GBGS measurement columns as FLOAT (Float32 in Parquet). Every raw column except the key (date, time), measured_at
+    and the dlt columns is a measurement, so new stations need no change here. Models read the raw measurements only
+    through this macro: the raw columns are DOUBLE in raw tables created since the rows are typed, but stay VARCHAR in
+    raw tables created before (dlt keeps the stored column types and loads the floats as text, see fetch_data.py).
+    try_cast reads both, blanks and values that are not numbers become NULL.
+#}
+{% macro gbgs_measurements() %}
+    try_cast(columns(c -> c not in ('date', 'time', 'measured_at') and not starts_with(c, '_dlt')) as float)
+{%- endmacro %}
+
+
+{#
+    Station and pollutant of a GBGS measurement column name, <station>_<pollutant> (femman_pm10, mobil2_no2)
+#}
+{% macro gbgs_station(column_name) %}
+    split_part({{ column_name }}, '_', 1)
+{%- endmacro %}
+
+{% macro gbgs_pollutant(column_name) %}
+    substr({{ column_name }}, strpos({{ column_name }}, '_') + 1)
+{%- endmacro %}
@@ -0,0 +1,14 @@
+{#
+    Filter for the rows a build should (re)process. Partitioned runs from Dagster pass the partition window as the
+    min_date / max_date vars ([min_date, max_date), local dates) and rebuild exactly those days. Without a window,
+    incremental builds take the dlt loads after the last build and full builds take everything.
+#}
+{% macro partition_window(date_column) %}
+    {%- if var('min_date', none) and var('max_date', none) -%}
+        {{ date_column }} >= '{{ var("min_date") }}' and {{ date_column }} < '{{ var("max_date") }}'
+    {%- elif is_incremental() -%}
+        {{ new_dlt_loads() }}
+    {%- else -%}
+        true
+    {%- endif -%}
+{%- endmacro %}
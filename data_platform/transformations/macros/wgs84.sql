@@ -0,0 +1,7 @@
+{#
+    Parse Trafikverket WGS84 points, 'POINT (lon lat)', into a struct with lon/lat strings.
+    Both coordinates come out of a single regexp_extract call, cast them with .lat / .lon
+#}
+{% macro wgs84_point(column) %}
+    regexp_extract({{ column }}, '^POINT\s*\(\s*(\S+)\s+(\S+)\s*\)$', ['lon', 'lat'])
+{%- endmacro %}
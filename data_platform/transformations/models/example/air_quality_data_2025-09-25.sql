@@ -1,14 +1,21 @@
 {{ config(
-    materialized='table',
+    materialized='incremental',
+    incremental_strategy='delete+insert',
+    unique_key=['date', 'time'],
+    on_schema_change='append_new_columns',
     alias='aq_data_sep25',
     schema='dbt_tables',
-    post_hook="""
-        COPY main_dbt_tables.aq_data_sep25
-        TO '/opt/dagster/app/data/parquet_files/aq_data_sep25.parquet' (FORMAT PARQUET)
-    """
+    post_hook="{{ export_partitions('aq_data_sep25', 'date') }}"
 ) }}
 
 select
-    *
+    date,
+    time,
+    measured_at,
+    {{ gbgs_measurements() }},
+    _dlt_load_id,
+    _dlt_id,
+    '{{ invocation_id }}' as _dbt_invocation_id
 from {{ source("air_quality_aq", "gbgs_air_quality_data") }}
-where date = '2025-09-25'
\ No newline at end of file
+where date = '2025-09-25'
+  and {{ partition_window('date') }}
\ No newline at end of file
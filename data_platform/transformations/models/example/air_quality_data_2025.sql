@@ -1,13 +1,20 @@
 {{ config(
-    materialized='table',
+    materialized='incremental',
+    incremental_strategy='delete+insert',
+    unique_key=['date', 'time'],
+    on_schema_change='append_new_columns',
     alias='aq_data_2025',
     schema='dbt_tables',
-    post_hook="""
-        COPY main_dbt_tables.aq_data_2025
-        TO '/opt/dagster/app/data/parquet_files/aq_data_2025.parquet' (FORMAT PARQUET)
-    """
+    post_hook="{{ export_partitions('aq_data_2025', 'date') }}"
 ) }}
 
 select
-    *
-from {{ source("air_quality_aq", "gbgs_air_quality_data") }}
\ No newline at end of file
+    date,
+    time,
+    measured_at,
+    {{ gbgs_measurements() }},
+    _dlt_load_id,
+    _dlt_id,
+    '{{ invocation_id }}' as _dbt_invocation_id
+from {{ source("air_quality_aq", "gbgs_air_quality_data") }}
+where {{ partition_window('date') }}
\ No newline at end of file
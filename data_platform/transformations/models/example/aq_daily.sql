@@ -0,0 +1,36 @@
+{{ config(
+    materialized='incremental',
+    incremental_strategy='delete+insert',
+    unique_key=['station', 'pollutant', 'date'],
+    alias='aq_daily',
+    schema='dbt_tables',
+    post_hook="{{ export_table('aq_daily.parquet') }}"
+) }}
+
+-- Daily values per station and pollutant (GBGS date, the 24:00 value belongs to its day), rolled up from the
+-- touched days of aq_hourly
+with touched as (
+    select distinct
+        station,
+        pollutant,
+        date
+    from {{ ref('aq_hourly') }}
+    where {{ partition_window('date') }}
+)
+
+select
+    hourly.station,
+    hourly.pollutant,
+    hourly.date,
+    sum(hourly.value_mean * hourly.value_count) / sum(hourly.value_count) as value_mean,
+    min(hourly.value_min) as value_min,
+    max(hourly.value_max) as value_max,
+    cast(sum(hourly.value_count) as bigint) as value_count,
+    max(hourly._dlt_load_id) as _dlt_load_id
+from {{ ref('aq_hourly') }} as hourly
+join touched
+    on touched.station = hourly.station
+    and touched.pollutant = hourly.pollutant
+    and touched.date = hourly.date
+group by all
+order by hourly.station, hourly.pollutant, hourly.date
\ No newline at end of file
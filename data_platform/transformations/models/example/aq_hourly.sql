@@ -0,0 +1,38 @@
+{{ config(
+    materialized='incremental',
+    incremental_strategy='delete+insert',
+    unique_key=['station', 'pollutant', 'hour'],
+    alias='aq_hourly',
+    schema='dbt_tables',
+    post_hook="{{ export_partitions('aq_hourly', 'date') }}"
+) }}
+
+-- Hourly values per station and pollutant. Only the buckets touched by new loads (or the partition window) are
+-- recomputed, from all measurements in those buckets
+with touched as (
+    select distinct
+        station,
+        pollutant,
+        date_trunc('hour', measured_at) as hour
+    from {{ ref('aq_measurements') }}
+    where {{ partition_window('date') }}
+)
+
+select
+    measurements.station,
+    measurements.pollutant,
+    touched.hour,
+    cast(max(measurements.date) as date) as date,
+    avg(measurements.value) as value_mean,
+    min(measurements.value) as value_min,
+    max(measurements.value) as value_max,
+    count(measurements.value) as value_count,
+    max(measurements._dlt_load_id) as _dlt_load_id,
+    '{{ invocation_id }}' as _dbt_invocation_id
+from {{ ref('aq_measurements') }} as measurements
+join touched
+    on touched.station = measurements.station
+    and touched.pollutant = measurements.pollutant
+    and touched.hour = date_trunc('hour', measurements.measured_at)
+group by all
+order by measurements.station, measurements.pollutant, touched.hour
\ No newline at end of file
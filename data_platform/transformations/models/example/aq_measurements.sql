@@ -0,0 +1,37 @@
+{{ config(
+    materialized='incremental',
+    incremental_strategy='delete+insert',
+    unique_key=['station', 'pollutant', 'measured_at'],
+    alias='aq_measurements',
+    schema='dbt_tables',
+    post_hook="{{ export_partitions('aq_measurements', 'date', 'station, pollutant, measured_at') }}"
+) }}
+
+-- Long format of the wide GBGS table: one row per (station, pollutant, measured_at), blanks are dropped.
+-- Rows are inserted sorted on (station, pollutant, measured_at) so the zone maps prune on them
+with measurements as (
+    select
+        date,
+        measured_at,
+        {{ gbgs_measurements() }},
+        _dlt_load_id
+    from {{ source("air_quality_aq", "gbgs_air_quality_data") }}
+    where {{ partition_window('date') }}
+),
+
+unpivoted as (
+    unpivot measurements
+    on columns(* exclude (date, measured_at, _dlt_load_id))
+    into name measurement value value
+)
+
+select
+    {{ gbgs_station('measurement') }} as station,
+    {{ gbgs_pollutant('measurement') }} as pollutant,
+    measured_at,
+    value,
+    date,
+    _dlt_load_id,
+    '{{ invocation_id }}' as _dbt_invocation_id
+from unpivoted
+order by station, pollutant, measured_at
\ No newline at end of file
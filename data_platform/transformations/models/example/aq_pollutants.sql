@@ -0,0 +1,15 @@
+{{ config(
+    materialized='table',
+    alias='aq_pollutants',
+    schema='dbt_tables'
+) }}
+
+-- Pollutants (and other measurements such as temp) found in the GBGS data
+select
+    pollutant,
+    count(distinct station) as station_count,
+    min(measured_at) as first_measured_at,
+    max(measured_at) as last_measured_at
+from {{ ref('aq_measurements') }}
+group by pollutant
+order by pollutant
\ No newline at end of file
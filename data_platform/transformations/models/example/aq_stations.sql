@@ -0,0 +1,15 @@
+{{ config(
+    materialized='table',
+    alias='aq_stations',
+    schema='dbt_tables'
+) }}
+
+-- Stations found in the GBGS data, a new station shows up here with its first load
+select
+    station,
+    count(distinct pollutant) as pollutant_count,
+    min(measured_at) as first_measured_at,
+    max(measured_at) as last_measured_at
+from {{ ref('aq_measurements') }}
+group by station
+order by station
\ No newline at end of file
@@ -0,0 +1,50 @@
+{{ config(
+    materialized='table',
+    alias='station_detector_hourly',
+    schema='dbt_tables',
+    post_hook="{{ export_table('station_detector_hourly.parquet') }}"
+) }}
+
+-- Air quality of each monitoring station aligned with the traffic flow of its matched detectors, one row per
+-- (station, detector, hour, pollutant) built from the hourly rollups. A GBGS hour labels the end of the measured
+-- hour, so it is ASOF joined to the latest flow bucket starting before it. Flow more than flow_max_lag_hours
+-- older than the measurement is left NULL (1: only the bucket of the measured hour)
+with matches as (
+    select
+        station,
+        detector_id,
+        rank as detector_rank,
+        distance_km
+    from {{ source("maps", "station_detector_matches") }}
+    where station is not null
+),
+
+air_quality as (
+    select
+        matches.station,
+        matches.detector_id,
+        matches.detector_rank,
+        matches.distance_km,
+        hourly.hour,
+        hourly.date,
+        hourly.pollutant,
+        hourly.value_mean,
+        hourly.value_count
+    from {{ ref('aq_hourly') }} as hourly
+    join matches
+        on matches.station = hourly.station
+)
+
+select
+    air_quality.*,
+    case when air_quality.hour - flow.hour <= to_hours({{ var('flow_max_lag_hours', 1) }})
+        then flow.hour end as flow_hour,
+    case when air_quality.hour - flow.hour <= to_hours({{ var('flow_max_lag_hours', 1) }})
+        then flow.vehicle_flow_rate_mean end as vehicle_flow_rate_mean,
+    case when air_quality.hour - flow.hour <= to_hours({{ var('flow_max_lag_hours', 1) }})
+        then flow.vehicle_flow_rate_count end as vehicle_flow_rate_count
+from air_quality
+asof left join {{ ref('tf_site_hourly') }} as flow
+    on flow.site_id = air_quality.detector_id
+    and air_quality.hour > flow.hour
+order by air_quality.station, air_quality.detector_rank, air_quality.pollutant, air_quality.hour
\ No newline at end of file
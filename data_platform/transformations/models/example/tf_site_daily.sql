@@ -0,0 +1,32 @@
+{{ config(
+    materialized='incremental',
+    incremental_strategy='delete+insert',
+    unique_key=['site_id', 'date'],
+    alias='tf_site_daily',
+    schema='dbt_tables',
+    post_hook="{{ export_table('tf_site_daily.parquet') }}"
+) }}
+
+-- Daily vehicle flow per detector site (local date), rolled up from the touched days of tf_site_hourly
+with touched as (
+    select distinct
+        site_id,
+        date
+    from {{ ref('tf_site_hourly') }}
+    where {{ partition_window('date') }}
+)
+
+select
+    hourly.site_id,
+    hourly.date,
+    sum(hourly.vehicle_flow_rate_mean * hourly.vehicle_flow_rate_count) / sum(hourly.vehicle_flow_rate_count) as vehicle_flow_rate_mean,
+    min(hourly.vehicle_flow_rate_min) as vehicle_flow_rate_min,
+    max(hourly.vehicle_flow_rate_max) as vehicle_flow_rate_max,
+    cast(sum(hourly.vehicle_flow_rate_count) as bigint) as vehicle_flow_rate_count,
+    max(hourly._dlt_load_id) as _dlt_load_id
+from {{ ref('tf_site_hourly') }} as hourly
+join touched
+    on touched.site_id = hourly.site_id
+    and touched.date = hourly.date
+group by all
+order by hourly.site_id, hourly.date
\ No newline at end of file
@@ -0,0 +1,35 @@
+{{ config(
+    materialized='incremental',
+    incremental_strategy='delete+insert',
+    unique_key=['site_id', 'hour'],
+    alias='tf_site_hourly',
+    schema='dbt_tables',
+    post_hook="{{ export_partitions('tf_site_hourly', 'date') }}"
+) }}
+
+-- Hourly vehicle flow per detector site. Only the (site, hour) buckets touched by new loads (or the partition
+-- window) are recomputed, from all raw rows in those buckets
+with touched as (
+    select distinct
+        site_id,
+        date_trunc('hour', measurement_time) as hour
+    from {{ source("air_quality_tf", "tv_traffic_flow_data") }}
+    where {{ partition_window("cast(measurement_time at time zone 'Europe/Berlin' as date)") }}
+)
+
+select
+    traffic_flow.site_id,
+    touched.hour,
+    cast(touched.hour at time zone 'Europe/Berlin' as date) as date,
+    avg(traffic_flow.vehicle_flow_rate) as vehicle_flow_rate_mean,
+    min(traffic_flow.vehicle_flow_rate) as vehicle_flow_rate_min,
+    max(traffic_flow.vehicle_flow_rate) as vehicle_flow_rate_max,
+    count(traffic_flow.vehicle_flow_rate) as vehicle_flow_rate_count,
+    max(traffic_flow._dlt_load_id) as _dlt_load_id,
+    '{{ invocation_id }}' as _dbt_invocation_id
+from {{ source("air_quality_tf", "tv_traffic_flow_data") }} as traffic_flow
+join touched
+    on touched.site_id = traffic_flow.site_id
+    and touched.hour = date_trunc('hour', traffic_flow.measurement_time)
+group by all
+order by traffic_flow.site_id, touched.hour
\ No newline at end of file
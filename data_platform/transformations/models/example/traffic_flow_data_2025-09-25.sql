@@ -1,16 +1,28 @@
 {{ config(
-    materialized='table',
+    materialized='incremental',
+    incremental_strategy='delete+insert',
+    unique_key=['site_id', 'measurement_time'],
+    on_schema_change='append_new_columns',
     alias='tf_data_sep25',
     schema='dbt_tables',
-    post_hook="""
-        COPY main_dbt_tables.tf_data_sep25
-        TO '/opt/dagster/app/data/parquet_files/tf_data_sep25.parquet' (FORMAT PARQUET)
-    """
+    post_hook="{{ export_partitions('tf_data_sep25', 'measurement_date') }}"
 ) }}
 
+with traffic_flow as (
+    select
+        *,
+        {{ wgs84_point('geometry__wgs84') }} as wgs84_point
+    from {{ source("air_quality_tf", "tv_traffic_flow_data") }}
+    where measurement_time >= timestamp '2025-09-25 00:00:00'
+      and measurement_time < timestamp '2025-09-26 00:00:00'
+      and {{ partition_window("cast(measurement_time at time zone 'Europe/Berlin' as date)") }}
+)
+
 select
     measurement_time at time zone 'Europe/Berlin' as measurement_time_local,
-    *
-from {{ source("air_quality_tf", "tv_traffic_flow_data") }}
-where measurement_time >= timestamp '2025-09-25 00:00:00'
-  and measurement_time < timestamp '2025-09-26 00:00:00'
+    cast(measurement_time at time zone 'Europe/Berlin' as date) as measurement_date,
+    * exclude (wgs84_point),
+    cast(wgs84_point.lat as double) as lat,
+    cast(wgs84_point.lon as double) as lon,
+    '{{ invocation_id }}' as _dbt_invocation_id
+from traffic_flow